@@ -4,9 +4,12 @@ AI Prompt Builder for Palestinian Checkpoint Status
 This class intelligently builds prompts with MongoDB context for AI responses
 """
 
+import logging
 import os
+import re
+import time
 from datetime import datetime, timezone
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from flask_pymongo import PyMongo
@@ -14,6 +17,35 @@ from flask_pymongo import PyMongo
 # Load environment variables
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+# How often the list of known checkpoint/city names is reloaded from MongoDB
+LOCATIONS_REFRESH_SECONDS = int(os.getenv("AI_LOCATIONS_REFRESH_SECONDS", "600"))
+
+# Maximum number of checkpoints listed in a single multi-checkpoint/city answer
+MAX_SUMMARY_CHECKPOINTS = int(os.getenv("AI_MAX_SUMMARY_CHECKPOINTS", "15"))
+
+# Words that make a query mentioning only a city a question about its checkpoints
+# ("شو الوضع في نابلس؟"), as opposed to weather, places or directions in that city
+STATUS_INTENT_KEYWORDS = [
+    "حاجز",
+    "حواجز",
+    "حالة",
+    "وضع",
+    "مفتوح",
+    "مغلق",
+    "مسكر",
+    "سالك",
+    "ازمة",
+    "أزمة",
+    "زحمة",
+    "ازدحام",
+    "تفتيش",
+    "اغلاق",
+    "إغلاق",
+    "فاتح",
+]
+
 
 class AIPromptBuilder:
     """
@@ -30,6 +62,14 @@ class AIPromptBuilder:
         """
         self.mongo = mongo_instance
         self.data_collection = mongo_instance.db[os.getenv("MONGO_COLLECTION_DATA")]
+        self.location_collection = mongo_instance.db[os.getenv("MONGO_COLLECTION_LOCATIONS")]
+
+        # Known names (longest first) and their compiled patterns, loaded lazily
+        self._checkpoint_patterns: List[Tuple[str, re.Pattern]] = []
+        self._city_patterns: List[Tuple[str, re.Pattern]] = []
+        # Every checkpoint and city name in one alternation, for yes/no checks
+        self._any_location_pattern: Optional[re.Pattern] = None
+        self._locations_loaded_at: Optional[float] = None
 
     def extract_checkpoint_from_query(self, user_query: str) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -47,8 +87,6 @@ class AIPromptBuilder:
         query_lower = user_query.lower().strip()
 
         # Remove common punctuation and question marks
-        import re
-
         query_clean = re.sub(r"[؟?.,!]", "", query_lower)
 
         # Remove common words to focus on checkpoint name
@@ -100,6 +138,180 @@ class AIPromptBuilder:
 
         return None, None
 
+    @staticmethod
+    def _name_pattern(name: str) -> re.Pattern:
+        """Match a name as a whole word, allowing a leading و/ب/ل (e.g. "وعطارة", "بنابلس")"""
+        return re.compile(r"(?<!\S)[وبل]?" + re.escape(name.lower()) + r"(?!\S)")
+
+    def _refresh_known_locations(self) -> None:
+        """
+        Load known checkpoint and city names from the locations collection.
+        Names are kept longest first so that "عطارة البلد" wins over "عطارة".
+        """
+        now = time.monotonic()
+        if self._locations_loaded_at is not None and now - self._locations_loaded_at < LOCATIONS_REFRESH_SECONDS:
+            return
+
+        try:
+            checkpoints, cities = set(), set()
+            for loc in self.location_collection.find({}, {"_id": 0, "checkpoint": 1, "city": 1}):
+                if loc.get("checkpoint"):
+                    checkpoints.add(loc["checkpoint"].strip())
+                if loc.get("city"):
+                    cities.add(loc["city"].strip())
+        except Exception as e:
+            log.warning(f"Error loading known checkpoint names: {e}")
+            return
+
+        self._checkpoint_patterns = [
+            (name, self._name_pattern(name)) for name in sorted(checkpoints, key=len, reverse=True)
+        ]
+        # Cities such as "اريحا(طوباس)" are also matched by their first part
+        city_aliases = []
+        for city in cities:
+            city_aliases.append((city, city))
+            short = city.split("(")[0].strip()
+            if short and short != city:
+                city_aliases.append((short, city))
+        self._city_patterns = [
+            (city, self._name_pattern(alias))
+            for alias, city in sorted(city_aliases, key=lambda a: len(a[0]), reverse=True)
+        ]
+        names = sorted(checkpoints | {alias for alias, _ in city_aliases}, key=len, reverse=True)
+        self._any_location_pattern = (
+            re.compile(r"(?<!\S)[وبل]?(?:" + "|".join(re.escape(n.lower()) for n in names) + r")(?!\S)")
+            if names
+            else None
+        )
+        self._locations_loaded_at = now
+
+    def extract_checkpoints_and_city(self, user_query: str) -> Tuple[List[str], Optional[str]]:
+        """
+        Detect every known checkpoint name and a city mentioned in a single query,
+        e.g. "كيف قلنديا وعطارة؟" or "شو الوضع في نابلس؟"
+
+        Args:
+            user_query (str): User's question in Arabic
+
+        Returns:
+            Tuple[List[str], Optional[str]]: (checkpoint names in query order, city name or None)
+        """
+        if not user_query:
+            return [], None
+
+        self._refresh_known_locations()
+        query_clean = re.sub(r"[؟?.,!،]", " ", user_query.lower())
+
+        # Longest names are matched first and their spans masked, so shorter names
+        # contained in them ("عطارة" inside "عطارة البلد") are not counted twice
+        found = []
+        for name, pattern in self._checkpoint_patterns:
+            for match in pattern.finditer(query_clean):
+                start, end = match.span()
+                found.append((start, name))
+                query_clean = query_clean[:start] + " " * (end - start) + query_clean[end:]
+
+        city = None
+        for city_name, pattern in self._city_patterns:
+            if pattern.search(query_clean):
+                city = city_name
+                break
+
+        checkpoints = []
+        for _, name in sorted(found):
+            if name not in checkpoints:
+                checkpoints.append(name)
+        return checkpoints, city
+
+    def get_latest_statuses(
+        self, checkpoint_names: Optional[List[str]] = None, city: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Get the latest status of several checkpoints (or of every checkpoint in a city)
+        with a single aggregation instead of one query per checkpoint
+
+        Args:
+            checkpoint_names (Optional[List[str]]): Exact checkpoint names
+            city (Optional[str]): City name, used when no checkpoint names are given
+
+        Returns:
+            List[Dict]: Latest record per checkpoint, most recently updated first
+        """
+        if checkpoint_names:
+            match = {"checkpoint_name": {"$in": checkpoint_names}}
+        elif city:
+            match = {"city_name": city}
+        else:
+            return []
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"message_date": -1}},
+            {
+                "$group": {
+                    "_id": {"checkpoint": "$checkpoint_name", "city": "$city_name"},
+                    "checkpoint_name": {"$first": "$checkpoint_name"},
+                    "city_name": {"$first": "$city_name"},
+                    "status": {"$first": "$status"},
+                    "direction": {"$first": "$direction"},
+                    "message_date": {"$first": "$message_date"},
+                }
+            },
+            {"$sort": {"message_date": -1}},
+            {"$limit": MAX_SUMMARY_CHECKPOINTS},
+        ]
+
+        try:
+            return list(self.data_collection.aggregate(pipeline))
+        except Exception as e:
+            log.warning(f"Error fetching checkpoint statuses: {e}")
+            return []
+
+    def has_status_intent(self, user_query: str) -> bool:
+        """True when the query asks about checkpoint status (not just mentions a place)"""
+        query_lower = (user_query or "").lower()
+        return any(keyword in query_lower for keyword in STATUS_INTENT_KEYWORDS)
+
+    def build_multi_status_answer(self, user_query: str) -> Optional[str]:
+        """
+        Answer questions about several checkpoints or a whole city directly from
+        MongoDB, using the same deterministic sentence as single-checkpoint answers
+
+        Args:
+            user_query (str): Original user query
+
+        Returns:
+            Optional[str]: Compact Arabic summary, or None when the query names
+            a single checkpoint (or none), or a city without asking about its
+            checkpoints, and should take the regular path
+        """
+        checkpoints, city = self.extract_checkpoints_and_city(user_query)
+
+        if len(checkpoints) >= 2:
+            statuses = self.get_latest_statuses(checkpoint_names=checkpoints)
+            by_name = {}
+            for record in statuses:
+                by_name.setdefault(record.get("checkpoint_name"), record)
+
+            lines = []
+            for name in checkpoints:
+                record = by_name.get(name)
+                if record:
+                    lines.append(self.format_status_record(record))
+                else:
+                    lines.append(f"لا توجد معلومات حديثة عن حاجز {name}")
+            return "\n".join(lines)
+
+        if city and not checkpoints and self.has_status_intent(user_query):
+            statuses = self.get_latest_statuses(city=city)
+            if not statuses:
+                return f"لا توجد معلومات حديثة عن حواجز {city}. يرجى المحاولة لاحقاً."
+            lines = [f"آخر أوضاع الحواجز في {city}:"]
+            lines.extend(f"- {self.format_status_record(record)}" for record in statuses)
+            return "\n".join(lines)
+
+        return None
+
     def get_latest_checkpoint_status(self, checkpoint_name: str) -> Optional[Dict]:
         """
         Get the latest status for a specific checkpoint from MongoDB using flexible search
@@ -120,7 +332,7 @@ class AIPromptBuilder:
             return latest_record
 
         except Exception as e:
-            print(f"Error fetching checkpoint status: {e}")
+            log.warning(f"Error fetching checkpoint status: {e}")
             return None
 
     def format_time_ago_arabic(self, dt) -> str:
@@ -190,7 +402,7 @@ class AIPromptBuilder:
                 return f"منذ {diff_days} يوم"
 
         except Exception as e:
-            print(f"Error formatting relative time: {e}")
+            log.debug(f"Error formatting relative time: {e}")
             return "غير محدد"
 
     def format_datetime_arabic(self, dt) -> str:
@@ -225,7 +437,7 @@ class AIPromptBuilder:
 
             return f"{time_str} {period} بتاريخ {date_str}"
         except Exception as e:
-            print(f"Error formatting datetime: {e}")
+            log.debug(f"Error formatting datetime: {e}")
             return str(dt)
 
     def build_smart_prompt(self, user_query: str) -> str:
@@ -327,7 +539,11 @@ class AIPromptBuilder:
 
     def is_checkpoint_query(self, user_query: str) -> bool:
         """
-        Check if the user query is asking about checkpoint status
+        Check if the user query may be asking about live checkpoint status. Answers to such
+        queries are never cached, so anything that could be one counts: a known checkpoint or
+        city, a status word, a route/crossing word, or a name-like phrase the location lists
+        may spell differently. Only clearly unrelated questions (greetings, thanks, how the
+        service works) are cacheable.
 
         Args:
             user_query (str): User query
@@ -339,22 +555,20 @@ class AIPromptBuilder:
             return False
 
         query_lower = user_query.lower()
-
-        # Keywords that indicate checkpoint queries
-        checkpoint_keywords = ["حاجز", "حالة", "وضع", "مفتوح", "مغلق", "سالك", "ازمة", "طريق", "عبور", "مرور", "تفتيش"]
-
-        # Check if query contains checkpoint keywords
-        has_keywords = any(keyword in query_lower for keyword in checkpoint_keywords)
-
-        # Check if query mentions a potential checkpoint (simplified check)
-        checkpoint_name, _ = self.extract_checkpoint_from_query(user_query)
-        has_checkpoint = checkpoint_name is not None
-
-        # Additional check: exclude obvious non-checkpoint queries
-        greeting_patterns = ["مرحبا", "أهلا", "السلام عليكم", "كيف الحال", "كيف حالك"]
-        is_greeting = any(pattern in query_lower for pattern in greeting_patterns)
-
-        return (has_keywords or has_checkpoint) and not is_greeting
+        self._refresh_known_locations()
+        if self._any_location_pattern is not None:
+            # Same answer as bool(any of extract_checkpoints_and_city), with one regex search
+            if self._any_location_pattern.search(re.sub(r"[؟?.,!،]", " ", query_lower)):
+                return True
+        if self.has_status_intent(query_lower):
+            return True
+        if any(keyword in query_lower for keyword in ("طريق", "عبور", "مرور")):
+            return True
+        # Previous name heuristic, on what is left after greetings ("السلام عليكم كيف قلنديه" still counts)
+        for pattern in ("مرحبا", "أهلا", "السلام عليكم", "كيف الحال", "كيف حالك"):
+            query_lower = query_lower.replace(pattern, " ")
+        checkpoint_name, _ = self.extract_checkpoint_from_query(query_lower)
+        return checkpoint_name is not None
 
     def post_process_response(self, ai_response: str, user_query: str) -> str:
         """
@@ -394,15 +608,47 @@ class AIPromptBuilder:
             return ai_response
 
         # Build proper response based on direction
-        direction_lower = direction.lower()
+        return self.format_status_sentence(checkpoint_name_from_db, status, direction, time_str)
+
+    def format_status_sentence(self, checkpoint_name: str, status: str, direction: str, time_str: str) -> str:
+        """
+        Build the deterministic status sentence for one checkpoint
+
+        Args:
+            checkpoint_name (str): Checkpoint name
+            status (str): Checkpoint status
+            direction (str): Direction the status applies to
+            time_str (str): Relative time string (منذ X دقيقة/ساعة)
+
+        Returns:
+            str: e.g. "حاجز قلنديا سالك بالاتجاهين منذ 5 دقائق"
+        """
+        direction_lower = (direction or "").lower()
 
         if direction_lower in ["الاتجاهين", "اتجاهين", "كلا الاتجاهين"]:
-            processed_response = f"حاجز {checkpoint_name_from_db} {status} بالاتجاهين {time_str}"
+            return f"حاجز {checkpoint_name} {status} بالاتجاهين {time_str}"
         elif direction_lower in ["الدخول", "داخل", "الداخل", "دخول"]:
-            processed_response = f"حاجز {checkpoint_name_from_db} {status} للدخول {time_str}"
+            return f"حاجز {checkpoint_name} {status} للدخول {time_str}"
         elif direction_lower in ["الخروج", "خارج", "الخارج", "خروج"]:
-            processed_response = f"حاجز {checkpoint_name_from_db} {status} للخروج {time_str}"
+            return f"حاجز {checkpoint_name} {status} للخروج {time_str}"
         else:
-            processed_response = f"حاجز {checkpoint_name_from_db} {status} {time_str}"
+            return f"حاجز {checkpoint_name} {status} {time_str}"
+
+    def format_status_record(self, record: Dict) -> str:
+        """
+        Build the deterministic status sentence from a MongoDB status record
+
+        Args:
+            record (Dict): Record with checkpoint_name, status, direction and message_date
 
-        return processed_response
+        Returns:
+            str: Status sentence for the record
+        """
+        message_date = record.get("message_date")
+        time_str = self.format_time_ago_arabic(message_date) if message_date else "غير محدد"
+        return self.format_status_sentence(
+            record.get("checkpoint_name", "غير محدد"),
+            record.get("status") or "غير محدد",
+            record.get("direction") or "غير محدد",
+            time_str,
+        )
@@ -1,40 +1,91 @@
+import logging
 import os
-import random
+import re
 from datetime import datetime, timedelta, timezone
 
 from ai_prompt_builder import AIPromptBuilder
 from api_auth import token_required
+from checkpoint_snapshot import create_snapshot_store
 from dotenv import load_dotenv
+from feedback_queue import FeedbackWriteQueue, QueueFull, newer_report
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_pymongo import PyMongo
-from geo_utils import haversine
+from geo_utils import decode_polyline, haversine
+from json_logging import LOG_SAMPLE_RATE, setup_logging
 from keyvault_client import get_secret
+from map_tiles import TILE_MAX_ZOOM, TileCache
 from openai_client import get_gpt_response
+from push_dispatch import COLLECTION_PUSH_SUBSCRIPTIONS, ensure_push_indexes, is_allowed_endpoint, save_subscription
+from pymongo import ReturnDocument
+from request_metrics import create_request_metrics
+from response_cache import create_response_cache
+from rollups import HISTORY_VIEWS, checkpoint_history, record_reports
+from route_search import (
+    ROUTE_CORRIDOR_KM,
+    ROUTE_MAX_CORRIDOR_KM,
+    ROUTE_MAX_KM,
+    ROUTE_MAX_POINTS,
+    RouteCheckpointIndex,
+    latest_statuses,
+    parse_path,
+    parse_point,
+    route_length_km,
+)
 
 load_dotenv()
+setup_logging()
+
+log = logging.getLogger("api")
 
 app = Flask(__name__)
 CORS(app)
 
+# Per-route latency/status and per-request Mongo command metrics on /metrics
+request_metrics = create_request_metrics()
+if request_metrics:
+    request_metrics.init_app(app)
+
 # MongoDB Atlas Connection
 app.config["MONGO_URI"] = get_secret(os.getenv("MONGO_CONNECTION_STRING_KEY"))
-mongo = PyMongo(app)
+mongo = PyMongo(app, **({"event_listeners": [request_metrics]} if request_metrics else {}))
 
 # Reading variables from the environment
 COLLECTION_DATA = os.getenv("MONGO_COLLECTION_DATA")
 COLLECTION_LOCATIONS = os.getenv("MONGO_COLLECTION_LOCATIONS")
-
+COLLECTION_COUNTERS = os.getenv("MONGO_COLLECTION_COUNTERS", "counters")
+COLLECTION_ROLLUPS = os.getenv("MONGO_COLLECTION_ROLLUPS", "status_rollups")
 
 # Collections
 data_collection = mongo.db[COLLECTION_DATA]
 location_collection = mongo.db[COLLECTION_LOCATIONS]
+counters_collection = mongo.db[COLLECTION_COUNTERS]
+rollups_collection = mongo.db[COLLECTION_ROLLUPS]
+push_subscriptions_collection = mongo.db[COLLECTION_PUSH_SUBSCRIPTIONS]
+ensure_push_indexes(push_subscriptions_collection)
 
 # Initialize AI Prompt Builder
 ai_prompt_builder = AIPromptBuilder(mongo)
 
+# Grid index over checkpoint locations for route corridor queries
+route_index = RouteCheckpointIndex(location_collection)
+
+# Clustered map tiles of checkpoints with their latest status
+tile_cache = TileCache(location_collection, data_collection)
+
+# Checkpoints with their latest status, shared by all workers through a memory-mapped file
+checkpoint_snapshot = create_snapshot_store(location_collection, data_collection)
+
+# Near-duplicate cache for general (non-checkpoint) AI answers
+response_cache = create_response_cache()
+
 RADIUS_KM = float(os.getenv("RADIUS_IN_KM", "10"))
 
+# Feedback message ids share the (source_channel, message_id) keyspace with Telegram reports.
+# They come from an atomic counter and start above the old random range (1,000,000-9,999,999).
+FEEDBACK_SOURCE_CHANNEL = "user_feedback"
+FEEDBACK_ID_OFFSET = 10_000_000
+
 # Verify that the values exist
 if not COLLECTION_DATA or not COLLECTION_LOCATIONS:
     raise ValueError("❌ COLLECTION_DATA or COLLECTION_LOCATIONS is missing in .env file")
@@ -56,6 +107,75 @@ def prepare_doc(doc):
     return doc
 
 
+def next_feedback_message_id(count=1):
+    """Reserve count consecutive collision-free message_ids for user_feedback documents; returns the first"""
+    counter = counters_collection.find_one_and_update(
+        {"_id": FEEDBACK_SOURCE_CHANNEL},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return FEEDBACK_ID_OFFSET + counter["seq"] - count + 1
+
+
+def current_snapshot():
+    """The shared checkpoint snapshot, or None to read from Mongo (disabled, not built yet or stale)"""
+    return checkpoint_snapshot.current() if checkpoint_snapshot else None
+
+
+def query_snapshot(snapshot, checkpoint_name, city_name, status, direction, ago_cutoff, top):
+    """checkpoints/query?all=true over the shared snapshot, same filters and output as the aggregation"""
+    checkpoint_re = re.compile(checkpoint_name.strip('"'), re.IGNORECASE) if checkpoint_name else None
+    city_re = re.compile(city_name.strip('"'), re.IGNORECASE) if city_name else None
+    status_re = re.compile(status.strip('"'), re.IGNORECASE) if status else None
+    direction_re = re.compile(direction.strip('"'), re.IGNORECASE) if direction else None
+
+    out = []
+    for i in range(snapshot.count):
+        rec = snapshot.record(i)
+        if checkpoint_re and not checkpoint_re.search(rec["checkpoint"] or ""):
+            continue
+        if city_re and not city_re.search(rec["city"] or ""):
+            continue
+        latest = newer_report(rec["latest"], feedback_queue.latest_for(rec["checkpoint"], rec["city"])) or {}
+        if ago_cutoff and not (latest.get("message_date") and _naive_utc(latest["message_date"]) >= ago_cutoff):
+            latest = {}
+        if status_re and not status_re.search(latest.get("status") or ""):
+            continue
+        if direction_re and not direction_re.search(latest.get("direction") or ""):
+            continue
+        item = {"checkpoint_name": rec["checkpoint"], "city_name": rec["city"], "lat": rec["lat"], "lng": rec["lng"]}
+        for field in ("status", "direction", "message", "message_date"):
+            if latest.get(field) is not None:
+                item[field] = latest[field]
+        out.append(item)
+        if top and len(out) >= top:
+            break
+    return out
+
+
+def _naive_utc(value):
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def on_feedback_written(docs):
+    """Runs on the feedback writer thread after each batch is stored"""
+    # Tiles already show these reports (update_reports on submit); no rebuild here
+    try:
+        record_reports(rollups_collection, docs)
+    except Exception as e:
+        # The reports are stored; rollups can be rebuilt from raw reports
+        log.warning(f"⚠️ Could not update status rollups: {e}", extra={"event": "rollups.error"})
+
+
+# Feedback is acknowledged once queued and written in micro-batches (feedback_queue.py);
+# reads overlay the queued reports until they are stored
+feedback_queue = FeedbackWriteQueue(data_collection, next_feedback_message_id, on_feedback_written)
+tile_cache.pending_reports = feedback_queue.pending_latest
+
+
 # ---------------- Root & Health ----------------
 @app.route("/")
 def home():
@@ -73,8 +193,13 @@ def home():
                     "/api/near_location",
                     "/api/closest-checkpoint",
                     "/api/checkpoints/query",
+                    "/api/checkpoints/<name>/history",
+                    "/api/route/checkpoints",
+                    "/api/checkpoints/tiles/<z>/<x>/<y>",
                 ],
-                "ai_chat": ["/api/ask-ai"],
+                "ai_chat": ["/api/ask-ai", "/api/ask-ai/cache-stats"],
+                "push": ["/api/push/vapid-public-key", "/api/push/subscribe", "/api/push/unsubscribe"],
+                "monitoring": ["/metrics"],
             },
         }
     )
@@ -96,14 +221,37 @@ def ask_ai():
         if not user_prompt:
             return jsonify({"error": "No prompt provided"}), 400
 
-        print("📝 User query: {user_prompt}")
+        log.info(
+            "📝 User query", extra={"event": "ask_ai.query", "prompt": user_prompt, "sample_rate": LOG_SAMPLE_RATE}
+        )
+
+        # Several checkpoints or a whole city: answer from one batched lookup, no AI call
+        multi_answer = ai_prompt_builder.build_multi_status_answer(user_prompt)
+        if multi_answer is not None:
+            log.debug("✅ Multi-checkpoint answer built from MongoDB", extra={"event": "ask_ai.multi_status"})
+            return jsonify({"success": True, "prompt": user_prompt, "response": multi_answer, "enhanced": True})
 
         # Check if this is a checkpoint-related query
-        if ai_prompt_builder.is_checkpoint_query(user_prompt):
+        is_checkpoint_query = ai_prompt_builder.is_checkpoint_query(user_prompt)
+        if is_checkpoint_query:
             # Build smart prompt with MongoDB context
             enhanced_prompt = ai_prompt_builder.build_smart_prompt(user_prompt)
-            print("🧠 Enhanced prompt built with checkpoint context")
+            log.debug("🧠 Enhanced prompt built with checkpoint context", extra={"event": "ask_ai.enhanced"})
         else:
+            # General queries are highly repetitive: reuse the answer of a near-duplicate prompt
+            cached_response = response_cache.get(user_prompt) if response_cache else None
+            if cached_response is not None:
+                log.debug("♻️ AI response served from cache", extra={"event": "ask_ai.cache_hit"})
+                return jsonify(
+                    {
+                        "success": True,
+                        "prompt": user_prompt,
+                        "response": cached_response,
+                        "enhanced": False,
+                        "cached": True,
+                    }
+                )
+
             # Use regular prompt for general queries
             enhanced_prompt = f"""
 أنت مساعد ذكي متخصص في الإجابة على الأسئلة باللغة العربية.
@@ -120,25 +268,36 @@ def ask_ai():
         ai_response = get_gpt_response(enhanced_prompt)
 
         # Post-process AI response to ensure proper formatting with direction
-        if ai_prompt_builder.is_checkpoint_query(user_prompt):
+        if is_checkpoint_query:
             ai_response = ai_prompt_builder.post_process_response(ai_response, user_prompt)
+        elif response_cache:
+            # Checkpoint status answers are never cached, they must reflect live data
+            response_cache.put(user_prompt, ai_response)
 
-        print("✅ AI response generated successfully")
+        log.debug("✅ AI response generated successfully", extra={"event": "ask_ai.answered"})
 
         return jsonify(
             {
                 "success": True,
                 "prompt": user_prompt,
                 "response": ai_response,
-                "enhanced": ai_prompt_builder.is_checkpoint_query(user_prompt),
+                "enhanced": is_checkpoint_query,
             }
         )
 
     except Exception as e:
-        print(f"❌ Error in ask_ai: {e}")
+        log.exception(f"❌ Error in ask_ai: {e}", extra={"event": "ask_ai.error"})
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/ask-ai/cache-stats", methods=["GET"])
+def ask_ai_cache_stats():
+    """Hit-rate of the general ask-ai response cache (each hit is one Azure OpenAI call saved)"""
+    if not response_cache:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
+
 # ---------------- User on the frontend (PushNotificationSetup.js) page ----------------
 @app.route("/api/near_location", methods=["GET"])
 def get_nearby_checkpoints():
@@ -151,29 +310,37 @@ def get_nearby_checkpoints():
 
         radius_km = RADIUS_KM  # read from .env
 
-        checkpoints = list(location_collection.find({"lat": {"$exists": True}, "lng": {"$exists": True}}))
+        snapshot = current_snapshot()
+        if snapshot:
+            found = [(snapshot.record(i), dist) for i, dist in snapshot.within(user_lat, user_lng, radius_km)]
+        else:
+            found = []
+            checkpoints = list(location_collection.find({"lat": {"$exists": True}, "lng": {"$exists": True}}))
+            for cp in checkpoints:
+                cp_lat = cp.get("lat")
+                cp_lng = cp.get("lng")
+                if cp_lat is None or cp_lng is None:
+                    continue
+
+                dist = haversine(user_lat, user_lng, cp_lat, cp_lng)
+                if dist > radius_km:
+                    continue
+
+                cp["latest"] = data_collection.find_one(
+                    {"checkpoint_name": cp.get("checkpoint"), "city_name": cp.get("city")},
+                    sort=[("message_date", -1)],
+                )
+                found.append((cp, dist))
 
         nearby = []
-        for cp in checkpoints:
-            cp_lat = cp.get("lat")
-            cp_lng = cp.get("lng")
-            if cp_lat is None or cp_lng is None:
-                continue
-
-            dist = haversine(user_lat, user_lng, cp_lat, cp_lng)
-            if dist > radius_km:
-                continue
-
-            status_doc = data_collection.find_one(
-                {"checkpoint_name": cp.get("checkpoint"), "city_name": cp.get("city")},
-                sort=[("message_date", -1)],
-            )
+        for cp, dist in found:
+            status_doc = newer_report(cp["latest"], feedback_queue.latest_for(cp.get("checkpoint"), cp.get("city")))
 
             merged = {
                 "checkpoint": cp.get("checkpoint"),
                 "city": cp.get("city"),
-                "latitude": cp_lat,
-                "longitude": cp_lng,
+                "latitude": cp.get("lat"),
+                "longitude": cp.get("lng"),
                 "distance_km": round(dist, 2),
             }
 
@@ -190,6 +357,63 @@ def get_nearby_checkpoints():
         return jsonify({"error": str(e)}), 500
 
 
+# ---------------- Push Subscriptions (PushNotificationSetup.js) ----------------
+@app.route("/api/push/vapid-public-key", methods=["GET"])
+def get_vapid_public_key():
+    """Application server key for PushManager.subscribe()"""
+    public_key = os.getenv("VAPID_PUBLIC_KEY", "")
+    if not public_key:
+        return jsonify({"error": "Push notifications are not configured"}), 503
+    return jsonify({"publicKey": public_key})
+
+
+@app.route("/api/push/subscribe", methods=["POST"])
+@token_required
+def subscribe_push():
+    """
+    Store a push subscription with the user's last location (call again when the location changes).
+    Request format:
+        { "subscription": <PushSubscription.toJSON()>, "latitude": 31.9, "longitude": 35.2 }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        subscription = data.get("subscription") or {}
+        lat = data.get("latitude")
+        lng = data.get("longitude")
+
+        if not subscription.get("endpoint"):
+            return jsonify({"error": "Missing 'subscription.endpoint'"}), 400
+        if not is_allowed_endpoint(subscription["endpoint"]):
+            return jsonify({"error": "'subscription.endpoint' is not a known push service URL"}), 400
+        if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+            return jsonify({"error": "Missing or invalid 'latitude' or 'longitude'"}), 400
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return jsonify({"error": "Latitude or longitude out of range"}), 400
+
+        created = save_subscription(push_subscriptions_collection, subscription, lat, lng)
+        return jsonify({"success": True, "created": created, "radius_km": RADIUS_KM}), 201 if created else 200
+
+    except Exception as e:
+        log.exception(f"❌ Error saving push subscription: {e}", extra={"event": "push.subscribe_error"})
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/push/unsubscribe", methods=["POST"])
+@token_required
+def unsubscribe_push():
+    """Request format: { "endpoint": "<subscription endpoint>" }"""
+    try:
+        data = request.get_json(silent=True) or {}
+        endpoint = data.get("endpoint") or (data.get("subscription") or {}).get("endpoint")
+        if not endpoint:
+            return jsonify({"error": "Missing 'endpoint'"}), 400
+        deleted = push_subscriptions_collection.delete_one({"endpoint": endpoint}).deleted_count
+        return jsonify({"success": True, "deleted": deleted})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # ---------------- User on the frontend (FeedbackNotification .js) page ----------------
 @app.route("/api/closest-checkpoint", methods=["GET"])
 def get_closest_checkpoint():
@@ -199,28 +423,39 @@ def get_closest_checkpoint():
         if lat is None or lng is None:
             return jsonify({"error": "Missing lat or lng parameters"}), 400
 
-        checkpoints = list(location_collection.find({"lat": {"$exists": True}, "lng": {"$exists": True}}))
-        min_dist = None
-        closest_cp = None
-
-        for cp in checkpoints:
-            cp_lat = cp.get("lat")
-            cp_lng = cp.get("lng")
-            dist = haversine(lat, lng, cp_lat, cp_lng)
-            if min_dist is None or dist < min_dist:
-                min_dist = dist
-                closest_cp = cp
-
-        if not closest_cp:
-            return jsonify({"error": "No checkpoints found"}), 404
-
-        # Get latest status for this checkpoint
-        status_doc = data_collection.find_one(
-            {
-                "checkpoint_name": closest_cp.get("checkpoint"),
-                "city_name": closest_cp.get("city"),
-            },
-            sort=[("message_date", -1)],
+        snapshot = current_snapshot()
+        if snapshot:
+            closest = snapshot.closest(lat, lng)
+            if not closest:
+                return jsonify({"error": "No checkpoints found"}), 404
+            closest_cp, min_dist = snapshot.record(closest[0]), closest[1]
+            status_doc = closest_cp["latest"]
+        else:
+            checkpoints = list(location_collection.find({"lat": {"$exists": True}, "lng": {"$exists": True}}))
+            min_dist = None
+            closest_cp = None
+
+            for cp in checkpoints:
+                cp_lat = cp.get("lat")
+                cp_lng = cp.get("lng")
+                dist = haversine(lat, lng, cp_lat, cp_lng)
+                if min_dist is None or dist < min_dist:
+                    min_dist = dist
+                    closest_cp = cp
+
+            if not closest_cp:
+                return jsonify({"error": "No checkpoints found"}), 404
+
+            # Get latest status for this checkpoint
+            status_doc = data_collection.find_one(
+                {
+                    "checkpoint_name": closest_cp.get("checkpoint"),
+                    "city_name": closest_cp.get("city"),
+                },
+                sort=[("message_date", -1)],
+            )
+        status_doc = newer_report(
+            status_doc, feedback_queue.latest_for(closest_cp.get("checkpoint"), closest_cp.get("city"))
         )
 
         result = {
@@ -242,6 +477,68 @@ def get_closest_checkpoint():
         return jsonify({"error": str(e)}), 500
 
 
+# ---------------- Destination Search: checkpoints along a route ----------------
+@app.route("/api/route/checkpoints", methods=["GET", "POST"])
+def get_route_checkpoints():
+    """
+    Checkpoints within a corridor around a route, ordered from origin to destination,
+    with their latest status.
+
+    Route (query string or JSON body), first one given wins:
+        polyline=<encoded polyline>            (Google / OSRM / Leaflet format)
+        path=lat,lng;lat,lng;...               (or a JSON list of [lat, lng])
+        origin=lat,lng&destination=lat,lng     (straight line)
+    corridor_km: maximum distance from the route (default ROUTE_CORRIDOR_KM)
+    """
+    try:
+        params = request.get_json(silent=True) or request.args
+        try:
+            if params.get("polyline"):
+                path = decode_polyline(params["polyline"])
+            elif params.get("path"):
+                path = parse_path(params["path"])
+            elif params.get("origin") and params.get("destination"):
+                path = [parse_point(params["origin"]), parse_point(params["destination"])]
+            else:
+                return jsonify({"error": "Provide 'origin' and 'destination', 'path' or 'polyline'"}), 400
+            corridor_km = float(params.get("corridor_km") or ROUTE_CORRIDOR_KM)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        if len(path) < 2:
+            return jsonify({"error": "A route needs at least two points"}), 400
+        if len(path) > ROUTE_MAX_POINTS:
+            return jsonify({"error": f"A route can have at most {ROUTE_MAX_POINTS} points"}), 400
+        if not 0 < corridor_km <= ROUTE_MAX_CORRIDOR_KM:
+            return jsonify({"error": f"'corridor_km' must be between 0 and {ROUTE_MAX_CORRIDOR_KM}"}), 400
+        if route_length_km(path) > ROUTE_MAX_KM:
+            return jsonify({"error": f"A route can be at most {ROUTE_MAX_KM:g} km long"}), 400
+
+        checkpoints, route_km = route_index.along_route(path, corridor_km)
+        statuses = latest_statuses(data_collection, checkpoints)
+        for cp in checkpoints:
+            status_doc = newer_report(
+                statuses.get((cp["checkpoint"], cp["city"])), feedback_queue.latest_for(cp["checkpoint"], cp["city"])
+            )
+            if status_doc:
+                cp["status"] = status_doc.get("status")
+                cp["direction"] = status_doc.get("direction")
+                cp["updatedAt"] = status_doc.get("message_date")
+
+        return jsonify(
+            {
+                "success": True,
+                "route_km": round(route_km, 2),
+                "corridor_km": corridor_km,
+                "count": len(checkpoints),
+                "checkpoints": checkpoints,
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # ---------------- User on the frontend (Map.js) & (Destination Search) pages ----------------
 @app.route("/api/checkpoints/query", methods=["GET"])
 def search_road_conditions():
@@ -274,6 +571,15 @@ def search_road_conditions():
                 except ValueError:
                     return jsonify({"error": "Invalid value for 'ago'. Please use a positive integer."}), 400
 
+            snapshot = current_snapshot()
+            if snapshot:
+                try:
+                    top = max(int(top_filter), 0) if top_filter else 0
+                except ValueError:
+                    return jsonify({"error": "Invalid value for 'top'. Please use a positive integer."}), 400
+                out = query_snapshot(snapshot, checkpoint_name, city_name, status, direction, ago_cutoff, top)
+                return jsonify({"results": out, "count": len(out)}), 200
+
             match_locs = {"lat": {"$exists": True}, "lng": {"$exists": True}}
             if checkpoint_name:
                 match_locs["checkpoint"] = {"$regex": checkpoint_name.strip('"'), "$options": "i"}
@@ -343,6 +649,12 @@ def search_road_conditions():
             # Serialize message_date
             out = []
             for d in docs:
+                # Queued feedback newer than the stored status replaces it
+                latest = newer_report(d, feedback_queue.latest_for(d.get("checkpoint_name"), d.get("city_name")))
+                if latest is not d:
+                    d["status"] = latest.get("status")
+                    d["direction"] = latest.get("direction")
+                    d["message_date"] = latest.get("message_date")
                 out.append(d)
             return jsonify({"results": out, "count": len(out)}), 200
 
@@ -436,7 +748,56 @@ def search_road_conditions():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    # ---------------- User Feedback ----------------
+
+# ---------------- Map tiles (Map.js) ----------------
+@app.route("/api/checkpoints/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def get_checkpoint_tile(z, x, y):
+    """
+    Checkpoints with their latest status in one XYZ map tile (Leaflet/OSM numbering).
+    Below TILE_CLUSTER_MAX_ZOOM nearby checkpoints are merged into clusters with a status_counts mix.
+    Responses carry an ETag of the data version, so unchanged tiles revalidate as 304.
+    """
+    try:
+        if z > TILE_MAX_ZOOM or x >= 2**z or y >= 2**z:
+            return jsonify({"error": f"Invalid tile {z}/{x}/{y} (max zoom {TILE_MAX_ZOOM})"}), 400
+
+        tile, version = tile_cache.get_tile(z, x, y)
+        response = jsonify({**tile, "version": version})
+        response.set_etag(f"{version}-{z}-{x}-{y}")
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------- Checkpoint History ----------------
+@app.route("/api/checkpoints/<name>/history", methods=["GET"])
+def get_checkpoint_history(name):
+    """
+    Status history of one checkpoint from the hourly rollups.
+
+    Query params:
+    - view: day (default) | week | hour_of_week
+    - city: restrict to one city
+    - days: lookback in days (default 30 / 182 / 84 per view, max 366)
+    """
+    try:
+        view = request.args.get("view", "day")
+        if view not in HISTORY_VIEWS:
+            return jsonify({"error": f"Invalid view. Use one of: {', '.join(HISTORY_VIEWS)}."}), 400
+        days = request.args.get("days", type=int)
+        if days is not None and days < 1:
+            return jsonify({"error": "Days value must be a positive integer."}), 400
+        city = request.args.get("city") or None
+
+        history = checkpoint_history(rollups_collection, name, city, view, days)
+        return jsonify(history), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------- User Feedback ----------------
 
 
 @app.route("/api/feedback", methods=["POST"])
@@ -445,39 +806,30 @@ def submit_feedback():
     try:
         data = request.get_json()
 
-        print("Received feedback:", data, flush=True)
-        print("Latitude:", data.get("latitude"), "Longitude:", data.get("longitude"), flush=True)
+        log.debug("Received feedback", extra={"event": "feedback.received", "body": data})
 
         if not data or "message" not in data or "latitude" not in data or "longitude" not in data:
             return jsonify({"error": ("Missing 'message', 'latitude' or 'longitude' field")}), 400
 
         user_lat = data["latitude"]
         user_lng = data["longitude"]
+        if not isinstance(user_lat, (int, float)) or not isinstance(user_lng, (int, float)):
+            return jsonify({"error": "Invalid 'latitude' or 'longitude'"}), 400
+        if not (-90 <= user_lat <= 90 and -180 <= user_lng <= 180):
+            return jsonify({"error": "Latitude or longitude out of range"}), 400
         message = data["message"]
         status = data["status"]
         direction = data["direction"]
 
         # ---------------- Find closest checkpoint ----------------
-        checkpoints = list(location_collection.find({"lat": {"$exists": True}, "lng": {"$exists": True}}))
-        closest_cp, min_dist = None, None
-
-        for cp in checkpoints:
-            cp_lat = cp.get("lat")
-            cp_lng = cp.get("lng")
-            dist = haversine(user_lat, user_lng, cp_lat, cp_lng)
-            if min_dist is None or dist < min_dist:
-                min_dist = dist
-                closest_cp = cp
-
-        print("Closest checkpoint found:", closest_cp, flush=True)
-
-        if not closest_cp:
+        closest = route_index.closest(user_lat, user_lng)
+        if not closest:
             return jsonify({"error": "No checkpoint found"}), 404
+        closest_cp, min_dist = closest
 
         # ---------------- Build feedback document ----------------
         feedback_doc = {
-            "message_id": random.randint(1_000_000, 9_999_999),
-            "source_channel": "user_feedback",
+            "source_channel": FEEDBACK_SOURCE_CHANNEL,
             "original_message": message,
             "checkpoint_name": closest_cp.get("checkpoint"),
             "city_name": closest_cp.get("city"),
@@ -486,32 +838,47 @@ def submit_feedback():
             "message_date": datetime.now(timezone.utc),
         }
 
-        print("Feedback document to insert:", feedback_doc, flush=True)
-
-        inserted_id = data_collection.insert_one(feedback_doc).inserted_id
-        print("✅ Inserted Feedback into collection:", data_collection.name, "with _id:", inserted_id, flush=True)
+        try:
+            # message_id is assigned when the batch is written
+            feedback_id = feedback_queue.submit(feedback_doc)
+        except QueueFull as e:
+            log.warning(f"⚠️ {e}", extra={"event": "feedback.rejected", **feedback_queue.stats()})
+            return jsonify({"error": "Too many reports right now, please retry shortly"}), 503, {"Retry-After": "5"}
+        tile_cache.update_reports([feedback_doc])
+        log.info(
+            "✅ Accepted feedback",
+            extra={
+                "event": "feedback.accepted",
+                "id": feedback_id,
+                "checkpoint": feedback_doc["checkpoint_name"],
+                "city": feedback_doc["city_name"],
+                "status": status,
+                "direction": direction,
+                "distance_km": round(min_dist, 2),
+            },
+        )
 
         return (
             jsonify(
                 {
                     "success": True,
-                    "id": str(inserted_id),
+                    "id": feedback_id,
                     "checkpoint": closest_cp.get("checkpoint"),
                     "city": closest_cp.get("city"),
                     "status": status,
                     "direction": direction,
                 }
             ),
-            201,
+            202,
         )
 
     except Exception as e:
-        print("❌ Error inserting feedback:", str(e), flush=True)
+        log.exception(f"❌ Error inserting feedback: {e}", extra={"event": "feedback.error"})
         return jsonify({"error": str(e)}), 500
 
 
 def start_api_server():
-    print("\n🤝 Team Integration Ready!")
+    log.info("🤝 Team Integration Ready!")
     port = int(os.getenv("PORT", 5000))
     # Always bind to 0.0.0.0 so it works both locally and in Azure
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
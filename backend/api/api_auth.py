@@ -1,3 +1,4 @@
+import logging
 import os
 from functools import wraps
 
@@ -9,6 +10,8 @@ TENANT_ID = os.getenv("TENANT_ID")
 AUDIENCE = os.getenv("AUDIENCE")
 JWKS_URL = os.getenv("JWKS_URL")
 
+log = logging.getLogger(__name__)
+
 
 def get_signing_key(kid):
     jwks = requests.get(JWKS_URL).json()["keys"]
@@ -41,7 +44,7 @@ def token_required(f):
             )
             request.user = decoded
         except Exception as e:
-            print("JWT decode error:", str(e))  # log error
+            log.warning(f"JWT decode error: {e}", extra={"event": "auth.invalid_token"})
             return jsonify({"error": "Token is invalid"}), 401
 
         return f(*args, **kwargs)
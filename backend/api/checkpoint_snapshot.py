@@ -0,0 +1,371 @@
+"""
+Shared checkpoint snapshot for all API worker processes.
+
+One worker at a time (elected with a non-blocking flock on SNAPSHOT_PATH + ".lock") builds a compact
+binary snapshot of every checkpoint location with its latest status and publishes it at SNAPSHOT_PATH:
+written to a temporary file, then swapped in with os.replace, so readers see either the old or the new
+version and never a partial one. Every worker maps the file read-only (mmap) and reads it through
+memoryview arrays, so the data is held once in the page cache however many workers there are, and
+near_location, closest-checkpoint and the all=true query run without touching Mongo.
+
+The refresher polls the newest report every SNAPSHOT_REFRESH_SECONDS and rebuilds when it changed,
+or after SNAPSHOT_MAX_AGE_SECONDS so location edits show up. Each poll touches the file; readers fall
+back to Mongo when it has not been touched for SNAPSHOT_STALE_SECONDS (no live refresher).
+
+Layout (little-endian): header <8sQII> (magic, version, checkpoints, strings), then per checkpoint
+lat float64, lng float64, updated_at int64 (epoch ms, 0 = none), checkpoint, city, status, direction and
+message uint32 string ids (NONE = no value), then the string table (uint32 offsets + UTF-8 blob).
+
+The refresher thread starts in each worker after import; don't use gunicorn --preload with it.
+"""
+
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from geo_utils import KM_PER_DEG_LAT, haversine
+from json_logging import LOG_SAMPLE_RATE
+from pymongo.errors import PyMongoError
+from route_search import latest_statuses
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process refreshes its own snapshot file
+    fcntl = None
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+# Empty: checkpoint_snapshot_<database>.bin in the temp directory, so APIs on different databases never share it
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "5"))
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "600"))
+SNAPSHOT_STALE_SECONDS = float(os.getenv("SNAPSHOT_STALE_SECONDS", "60"))
+# How often a reader looks for a newer file
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("SNAPSHOT_CHECK_SECONDS", "1"))
+
+MAGIC = b"CPSNAP02"
+HEADER = struct.Struct("<8sQII")
+NONE = 0xFFFFFFFF
+
+
+def _epoch_ms(value: Any) -> int:
+    if not isinstance(value, datetime):
+        return 0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def default_snapshot_path(data_collection) -> str:
+    return os.path.join(tempfile.gettempdir(), f"checkpoint_snapshot_{data_collection.database.name}.bin")
+
+
+def build_snapshot(location_collection, data_collection, version: int) -> bytes:
+    """Serialize every checkpoint with a location and its latest status"""
+    locations = [
+        loc
+        for loc in location_collection.find(
+            {"lat": {"$exists": True}, "lng": {"$exists": True}},
+            {"_id": 0, "checkpoint": 1, "city": 1, "lat": 1, "lng": 1},
+        )
+        if isinstance(loc.get("lat"), (int, float)) and isinstance(loc.get("lng"), (int, float))
+    ]
+    statuses = latest_statuses(data_collection, locations, with_message=True)
+
+    strings: List[str] = []
+    ids: Dict[str, int] = {}
+
+    def intern(value: Any) -> int:
+        if value is None:
+            return NONE
+        value = str(value)
+        if value not in ids:
+            ids[value] = len(strings)
+            strings.append(value)
+        return ids[value]
+
+    n = len(locations)
+    lat, lng, updated = [0.0] * n, [0.0] * n, [0] * n
+    checkpoint, city, status, direction, message = [NONE] * n, [NONE] * n, [NONE] * n, [NONE] * n, [NONE] * n
+    for i, loc in enumerate(locations):
+        lat[i], lng[i] = float(loc["lat"]), float(loc["lng"])
+        checkpoint[i], city[i] = intern(loc.get("checkpoint")), intern(loc.get("city"))
+        doc = statuses.get((loc.get("checkpoint"), loc.get("city")))
+        if doc:
+            status[i], direction[i] = intern(doc.get("status")), intern(doc.get("direction"))
+            message[i] = intern(doc.get("message"))
+            updated[i] = _epoch_ms(doc.get("message_date"))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+
+    parts = [
+        HEADER.pack(MAGIC, version, n, len(strings)),
+        struct.pack(f"<{n}d", *lat),
+        struct.pack(f"<{n}d", *lng),
+        struct.pack(f"<{n}q", *updated),
+        struct.pack(f"<{5 * n}I", *checkpoint, *city, *status, *direction, *message),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        b"".join(encoded),
+    ]
+    return b"".join(parts)
+
+
+def publish_snapshot(path: str, data: bytes) -> None:
+    """Write the snapshot next to path and swap it in atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class CheckpointSnapshot:
+    """
+    One published snapshot version, read zero-copy from a memory map
+    """
+
+    def __init__(self, mm: mmap.mmap):
+        magic, self.version, n, n_strings = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a checkpoint snapshot")
+        self.count = n
+        view = memoryview(mm)
+        pos = HEADER.size
+
+        def section(fmt: str, length: int) -> memoryview:
+            nonlocal pos
+            size = struct.calcsize(fmt) * length
+            start, pos = pos, pos + size
+            return view[start:pos].cast(fmt)
+
+        self.lat = section("d", n)
+        self.lng = section("d", n)
+        self.updated_ms = section("q", n)
+        self.checkpoint = section("I", n)
+        self.city = section("I", n)
+        self.status = section("I", n)
+        self.direction = section("I", n)
+        self.message = section("I", n)
+        self._offsets = section("I", n_strings + 1)
+        self._blob = view[pos:]
+        self._strings: List[Optional[str]] = [None] * n_strings
+
+    def string(self, sid: int) -> Optional[str]:
+        """Decoded string for an id (decoded once per version)"""
+        if sid == NONE:
+            return None
+        value = self._strings[sid]
+        if value is None:
+            start, end = self._offsets[sid], self._offsets[sid + 1]
+            value = self._strings[sid] = str(self._blob[start:end], "utf-8")
+        return value
+
+    def record(self, i: int) -> Dict[str, Any]:
+        """Checkpoint i as {checkpoint, city, lat, lng, latest}; latest is its last report or None"""
+        updated, status, direction, message = self.updated_ms[i], self.status[i], self.direction[i], self.message[i]
+        latest = None
+        if updated or status != NONE or direction != NONE or message != NONE:
+            latest = {
+                "status": self.string(status),
+                "direction": self.string(direction),
+                "message": self.string(message),
+                # Naive UTC, like the datetimes PyMongo returns
+                "message_date": (
+                    datetime.fromtimestamp(updated / 1000, timezone.utc).replace(tzinfo=None) if updated else None
+                ),
+            }
+        return {
+            "checkpoint": self.string(self.checkpoint[i]),
+            "city": self.string(self.city[i]),
+            "lat": self.lat[i],
+            "lng": self.lng[i],
+            "latest": latest,
+        }
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[int, float]]:
+        """(index, distance in KM) of the checkpoints within radius_km, in snapshot order"""
+        d_lat = radius_km / KM_PER_DEG_LAT
+        d_lng = d_lat / max(math.cos(math.radians(min(abs(lat) + d_lat, 89.0))), 0.01)
+        found = []
+        lats, lngs = self.lat, self.lng
+        for i in range(self.count):
+            # Cheap bounding-box test before the great-circle distance
+            if abs(lats[i] - lat) > d_lat or abs(lngs[i] - lng) > d_lng:
+                continue
+            dist = haversine(lat, lng, lats[i], lngs[i])
+            if dist <= radius_km:
+                found.append((i, dist))
+        return found
+
+    def closest(self, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """(index, distance in KM) of the closest checkpoint, None when empty"""
+        best, best_dist = None, math.inf
+        lats, lngs = self.lat, self.lng
+        for i in range(self.count):
+            dist = haversine(lat, lng, lats[i], lngs[i])
+            if dist < best_dist:
+                best, best_dist = i, dist
+        return None if best is None else (best, best_dist)
+
+
+class SnapshotStore:
+    """
+    Publishes the snapshot when this process holds the refresher lock, and maps the current version
+    """
+
+    def __init__(
+        self,
+        location_collection,
+        data_collection,
+        path: Optional[str] = None,
+        refresh_seconds: float = SNAPSHOT_REFRESH_SECONDS,
+        max_age_seconds: float = SNAPSHOT_MAX_AGE_SECONDS,
+        stale_seconds: float = SNAPSHOT_STALE_SECONDS,
+    ):
+        self.location_collection = location_collection
+        self.data_collection = data_collection
+        self.path = path or SNAPSHOT_PATH or default_snapshot_path(data_collection)
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.stale_seconds = stale_seconds
+        self._snapshot: Optional[CheckpointSnapshot] = None
+        self._inode: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._lock_file = None
+        # The refresher thread and direct refresh() calls (e.g. right after a bulk load) publish one at a time
+        self._refresh_lock = threading.Lock()
+        self._newest_report: Any = None
+        self._published_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------- Reading ----------------
+    def current(self) -> Optional[CheckpointSnapshot]:
+        """The latest published snapshot, or None when there is none or no refresher keeps it fresh"""
+        now = time.monotonic()
+        if now - self._checked_at >= SNAPSHOT_CHECK_SECONDS:
+            with self._lock:
+                if now - self._checked_at >= SNAPSHOT_CHECK_SECONDS:
+                    self._check()
+                    self._checked_at = time.monotonic()
+        return self._snapshot if self._fresh else None
+
+    def _check(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot, self._inode, self._fresh = None, None, False
+            return
+        self._fresh = time.time() - st.st_mtime < self.stale_seconds
+        inode = (st.st_dev, st.st_ino)
+        if inode == self._inode:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            snapshot = CheckpointSnapshot(mm)
+        except (OSError, ValueError, struct.error) as e:
+            log.warning(f"⚠️ Could not map checkpoint snapshot: {e}", extra={"event": "snapshot.error"})
+            return
+        # The previous mapping stays valid for requests still reading it and is freed with its last view
+        self._snapshot, self._inode = snapshot, inode
+        log.debug(f"Mapped checkpoint snapshot v{snapshot.version}", extra={"event": "snapshot.mapped"})
+
+    # ---------------- Refreshing ----------------
+    def _is_refresher(self) -> bool:
+        """Try to become (or stay) the process that publishes the snapshot"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + ".lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        # Held until the process exits; the lock is released by the OS even if it crashes
+        self._lock_file = lock_file
+        log.info(f"📸 This worker (pid {os.getpid()}) publishes the checkpoint snapshot")
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Rebuild and publish the snapshot if the reports changed or it is too old, else just mark it live
+
+        Returns:
+            bool: True when a new version was published
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> bool:
+        doc = self.data_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        newest = doc["_id"] if doc else None
+        now = time.monotonic()
+        expired = self._published_at is None or now - self._published_at >= self.max_age_seconds
+        if not expired and newest == self._newest_report and os.path.exists(self.path):
+            os.utime(self.path)
+            return False
+        started = time.perf_counter()
+        data = build_snapshot(self.location_collection, self.data_collection, time.time_ns())
+        publish_snapshot(self.path, data)
+        self._newest_report, self._published_at = newest, now
+        log.info(
+            f"📸 Published checkpoint snapshot ({len(data)} bytes)",
+            extra={
+                "event": "snapshot.published",
+                "bytes": len(data),
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "sample_rate": LOG_SAMPLE_RATE,
+            },
+        )
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._is_refresher():
+                    self.refresh()
+            except (PyMongoError, OSError) as e:
+                log.warning(f"⚠️ Checkpoint snapshot refresh failed: {e}", extra={"event": "snapshot.error"})
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self) -> "SnapshotStore":
+        """Start the background refresher election/refresh loop"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def create_snapshot_store(location_collection, data_collection) -> Optional[SnapshotStore]:
+    """Build and start the shared snapshot from environment settings (None when SNAPSHOT_ENABLED=false)"""
+    if not SNAPSHOT_ENABLED:
+        return None
+    return SnapshotStore(location_collection, data_collection).start()
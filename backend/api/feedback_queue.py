@@ -0,0 +1,222 @@
+"""
+Write-coalescing queue for user feedback reports.
+
+POST /api/feedback puts the report in a bounded in-process queue and answers 202 with the report id
+(the _id is generated client-side, so it is final before the write). A background thread writes the
+queue to Mongo with one insert_many every FEEDBACK_BATCH_SIZE reports or FEEDBACK_FLUSH_SECONDS,
+whichever comes first. When the queue is full, submit() raises QueueFull and the endpoint answers 503.
+
+Until a report is written, latest_for() still returns it, so the latest-status reads can overlay it.
+close() (registered with atexit) writes whatever is left before the process exits.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError, PyMongoError
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "1000"))
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "50"))
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "0.5"))
+FEEDBACK_WRITE_RETRIES = int(os.getenv("FEEDBACK_WRITE_RETRIES", "3"))
+
+# Duplicate key: the document was already written by an earlier attempt of the same batch
+_DUPLICATE_KEY = 11000
+
+
+class QueueFull(Exception):
+    """The feedback queue is at capacity; the client should retry later"""
+
+
+def _as_utc(value: Any) -> Any:
+    """Mongo returns naive UTC datetimes, queued reports carry aware ones"""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def newer_report(stored: Optional[Dict[str, Any]], pending: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The more recent of a stored and a pending report (either may be None)"""
+    if pending is None:
+        return stored
+    if stored is None:
+        return pending
+    stored_date, pending_date = _as_utc(stored.get("message_date")), _as_utc(pending.get("message_date"))
+    if isinstance(stored_date, datetime) and isinstance(pending_date, datetime) and stored_date > pending_date:
+        return stored
+    return pending
+
+
+class FeedbackWriteQueue:
+    """
+    Bounded queue of feedback reports flushed to Mongo in micro-batches by a background thread
+    """
+
+    def __init__(
+        self,
+        data_collection,
+        reserve_message_ids: Callable[[int], int],
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        maxsize: int = FEEDBACK_QUEUE_SIZE,
+        batch_size: int = FEEDBACK_BATCH_SIZE,
+        flush_seconds: float = FEEDBACK_FLUSH_SECONDS,
+    ):
+        """
+        Args:
+            data_collection: Reports collection
+            reserve_message_ids (Callable[[int], int]): Reserves n consecutive message ids, returns the first
+            on_flush (Callable[[List[Dict]], None]): Called with each written batch (cache invalidation, rollups)
+            maxsize (int): Queued reports before submit() raises QueueFull
+            batch_size (int): Reports per insert_many
+            flush_seconds (float): Longest a report waits for its batch to fill
+        """
+        self.data_collection = data_collection
+        self.reserve_message_ids = reserve_message_ids
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=maxsize)
+        # Newest queued-but-unwritten report per (checkpoint, city)
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def submit(self, doc: Dict[str, Any]) -> str:
+        """
+        Queue a report for writing
+
+        Returns:
+            str: The report id (its final _id)
+
+        Raises:
+            QueueFull: The queue is at capacity
+        """
+        if self._stop.is_set():
+            raise QueueFull("Feedback queue is shutting down")
+        doc.setdefault("_id", ObjectId())
+        key = (doc.get("checkpoint_name"), doc.get("city_name"))
+        with self._pending_lock:
+            try:
+                self._queue.put_nowait(doc)
+            except queue.Full:
+                raise QueueFull(f"Feedback queue is full ({self._queue.maxsize} reports)") from None
+            self._pending[key] = newer_report(self._pending.get(key), doc)
+        return str(doc["_id"])
+
+    def latest_for(self, checkpoint: str, city: str) -> Optional[Dict[str, Any]]:
+        """Newest queued report for a checkpoint that is not written yet"""
+        if not self._pending:
+            return None
+        with self._pending_lock:
+            return self._pending.get((checkpoint, city))
+
+    def pending_latest(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Copy of the newest unwritten report per (checkpoint, city)"""
+        with self._pending_lock:
+            return dict(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queue.qsize(), "capacity": self._queue.maxsize}
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        missing = [doc for doc in batch if "message_id" not in doc]
+        if missing:
+            # One counter update per batch instead of one per report
+            first = self.reserve_message_ids(len(missing))
+            for offset, doc in enumerate(missing):
+                doc["message_id"] = first + offset
+        try:
+            self.data_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != _DUPLICATE_KEY]
+            if errors:
+                raise
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        for attempt in range(FEEDBACK_WRITE_RETRIES + 1):
+            try:
+                self._write(batch)
+                break
+            except PyMongoError as e:
+                # Shutting down: one retry only, so the process is not held up
+                if attempt == FEEDBACK_WRITE_RETRIES or (self._stop.is_set() and attempt):
+                    log.error(
+                        f"❌ Dropped {len(batch)} feedback reports after {attempt + 1} attempts: {e}",
+                        extra={"event": "feedback.dropped", "count": len(batch)},
+                    )
+                    self._forget(batch)
+                    return
+                time.sleep(min(2**attempt, 10))
+
+        self._forget(batch)
+        log.info(
+            f"✅ Inserted {len(batch)} feedback reports",
+            extra={"event": "feedback.inserted", "count": len(batch), "ids": [str(doc["_id"]) for doc in batch]},
+        )
+        if self.on_flush:
+            try:
+                self.on_flush(batch)
+            except Exception as e:
+                log.warning(f"⚠️ Feedback post-write hook failed: {e}", extra={"event": "feedback.hook_error"})
+
+    def _forget(self, batch: List[Dict[str, Any]]) -> None:
+        """Drop written reports from the pending overlay unless a newer one was queued meanwhile"""
+        with self._pending_lock:
+            for doc in batch:
+                key = (doc.get("checkpoint_name"), doc.get("city_name"))
+                if self._pending.get(key) is doc:
+                    del self._pending[key]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def close(self) -> None:
+        """Stop accepting reports and write everything still queued"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._writer.join()
+        remaining: List[Dict[str, Any]] = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        size = self.batch_size
+        for start in range(0, len(remaining), size):
+            end = start + size
+            self._flush(remaining[start:end])
@@ -17,3 +17,56 @@ def haversine(lat1, lon1, lat2, lon2):
     )
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c  # in KM
+
+
+KM_PER_DEG_LAT = 111.32
+
+
+def project_km(lat, lng, ref_lat):
+    """
+    Equirectangular projection to kilometers around the reference latitude.
+    Accurate to well under 1% over a few hundred kilometers, which covers the West Bank.
+    Returns (x, y) in KM
+    """
+    return lng * KM_PER_DEG_LAT * math.cos(math.radians(ref_lat)), lat * KM_PER_DEG_LAT
+
+
+def point_segment_distance(p, a, b):
+    """
+    Distance from point p to segment a-b, all projected (x, y) in KM.
+    Returns (distance_km, t) where t in [0, 1] is the position of the closest point along a-b
+    """
+    ax, ay = a
+    dx, dy = b[0] - ax, b[1] - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0
+    if length_sq > 0:
+        t = max(0.0, min(1.0, ((p[0] - ax) * dx + (p[1] - ay) * dy) / length_sq))
+    return math.hypot(p[0] - (ax + t * dx), p[1] - (ay + t * dy)), t
+
+
+def decode_polyline(encoded, precision=5):
+    """
+    Decode an encoded polyline (Google / OSRM / Leaflet format)
+    Returns a list of (lat, lng)
+    """
+    points, index, lat, lng = [], 0, 0, 0
+    factor = 10**precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift, result = 0, 0
+            while True:
+                if index >= len(encoded):
+                    raise ValueError("Truncated polyline")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
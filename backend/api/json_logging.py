@@ -0,0 +1,141 @@
+"""
+Non-blocking structured logging.
+
+Logging calls only put records on an in-memory queue (QueueHandler); a background
+QueueListener thread formats them as JSON lines and writes them to stdout, so slow log I/O
+never adds to request latency or stalls the consumer's event loop. When the queue is full, records are dropped and counted
+instead of blocking the caller.
+
+High-volume events can be sampled by logging them with extra={"sample_rate": ...}:
+DEBUG/INFO records are then kept with that probability (warnings and errors are always kept),
+and the kept records carry the rate so counts can be scaled back up.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json | text
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Attributes every LogRecord has; anything else was passed through `extra` and becomes a JSON field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, then the record's extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a DEBUG/INFO record with probability record.sample_rate (1.0 when not set)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", 1.0)
+        return record.levelno >= logging.WARNING or rate >= 1.0 or random.random() < rate
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of raising"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback now (they may not survive the thread hop),
+        # but keep the extra fields for the JSON formatter instead of flattening to a string
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: Optional[str] = None, force: bool = False) -> None:
+    """
+    Route the root logger through a background writer thread
+
+    When the root logger already has handlers (the Azure Functions host's) and force is not set, they are
+    deliberately kept on the calling thread: the host's handler ties each record to the running invocation
+    from the caller's context, which a queue hop to the writer thread would lose. They only get the
+    SamplingFilter, so sampled events are thinned out there too.
+    """
+    global _listener
+    with _setup_lock:
+        root = logging.getLogger()
+        if root.handlers and not force:
+            for handler in root.handlers:
+                if not any(isinstance(f, SamplingFilter) for f in handler.filters):
+                    handler.addFilter(SamplingFilter())
+            return
+        if _listener:
+            _listener.stop()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        output = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "text":
+            output.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+        else:
+            output.setFormatter(JsonFormatter())
+
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = _NonBlockingQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter())
+        root.addHandler(handler)
+        root.setLevel(getattr(logging, (level or LOG_LEVEL).upper(), logging.INFO))
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    # Write out what is still queued before the process exits
+    if _listener:
+        _listener.stop()
+
+
+def dropped_records() -> int:
+    """Records dropped because the log queue was full"""
+    return _NonBlockingQueueHandler.dropped
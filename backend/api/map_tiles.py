@@ -0,0 +1,322 @@
+"""
+Map tiles of checkpoints with their latest status (overall and per direction), clustered at low zoom levels.
+
+Tiles use the Web Mercator XYZ scheme of Leaflet/OSM. All checkpoints and their latest status are
+loaded into one snapshot; tiles up to TILE_PRECOMPUTE_MAX_ZOOM are computed when the snapshot is
+built, deeper tiles on first request (LRU-cached). Below TILE_CLUSTER_MAX_ZOOM, checkpoints that fall
+in the same cell of a TILE_CLUSTER_GRID × TILE_CLUSTER_GRID grid per tile are merged into one cluster
+with its status mix.
+
+The snapshot is rebuilt when a newer report exists (checked at most every TILE_VERSION_CHECK_SECONDS,
+so consumer writes are picked up too), when invalidate() is called, or after TILE_SNAPSHOT_MAX_AGE_SECONDS
+so location changes show up. Feedback that is queued but not written yet (pending_reports) is merged into
+the snapshot; a newly accepted report is applied with update_reports(), which only rebuilds the tiles
+containing its checkpoint.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from feedback_queue import newer_report
+
+load_dotenv()
+
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "20"))
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "13"))  # clusters below this zoom
+TILE_CLUSTER_GRID = int(os.getenv("TILE_CLUSTER_GRID", "8"))  # 8 × 8 cells = 32 px on a 256 px tile
+TILE_PRECOMPUTE_MAX_ZOOM = int(os.getenv("TILE_PRECOMPUTE_MAX_ZOOM", "12"))
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "5000"))
+TILE_VERSION_CHECK_SECONDS = float(os.getenv("TILE_VERSION_CHECK_SECONDS", "5"))
+TILE_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("TILE_SNAPSHOT_MAX_AGE_SECONDS", "600"))
+
+# Web Mercator is undefined at the poles
+_MAX_LAT = 85.05112878
+
+Tile = Tuple[int, int, int]
+
+
+def tile_position(lat: float, lng: float, z: int) -> Tuple[float, float]:
+    """Fractional XYZ tile coordinates of a point at zoom z"""
+    lat = max(-_MAX_LAT, min(_MAX_LAT, lat))
+    n = 2**z
+    x = (lng + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return min(max(x, 0.0), n - 1e-9), min(max(y, 0.0), n - 1e-9)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Dict[str, float]:
+    """Geographic bounds of a tile"""
+    n = 2**z
+
+    def lat_of(ty: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return {
+        "west": x / n * 360.0 - 180.0,
+        "east": (x + 1) / n * 360.0 - 180.0,
+        "north": lat_of(y),
+        "south": lat_of(y + 1),
+    }
+
+
+def _tile_of(point: Dict[str, Any], z: int) -> Tuple[int, int]:
+    tx, ty = tile_position(point["latitude"], point["longitude"], z)
+    return int(tx), int(ty)
+
+
+def _with_report(point: Dict[str, Any], report: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The point with `report` as the latest status of its direction (and of the checkpoint when it is the
+    newest), or None when the point already has a newer report for that direction
+    """
+    direction = report.get("direction")
+    directions = point.get("directions", [])
+    current = next((d for d in directions if d["direction"] == direction), None)
+    if current and newer_report({"message_date": current["updatedAt"]}, report) is not report:
+        return None
+    status = {"direction": direction, "status": report.get("status"), "updatedAt": report.get("message_date")}
+    others = [d for d in directions if d is not current]
+    point = {**point, "directions": sorted(others + [status], key=lambda d: str(d["direction"] or ""))}
+    if "updatedAt" not in point or newer_report({"message_date": point["updatedAt"]}, report) is report:
+        point.update(status)
+    return point
+
+
+def _cluster(points: List[Dict[str, Any]]) -> Dict[str, Any]:
+    status_counts: Dict[str, int] = defaultdict(int)
+    for p in points:
+        status_counts[p.get("status") or "غير محدد"] += 1
+    return {
+        "type": "cluster",
+        "count": len(points),
+        "latitude": round(sum(p["latitude"] for p in points) / len(points), 6),
+        "longitude": round(sum(p["longitude"] for p in points) / len(points), 6),
+        "status_counts": dict(status_counts),
+        "bounds": {
+            "west": min(p["longitude"] for p in points),
+            "east": max(p["longitude"] for p in points),
+            "south": min(p["latitude"] for p in points),
+            "north": max(p["latitude"] for p in points),
+        },
+    }
+
+
+class TileCache:
+    """
+    Versioned tile cache over a snapshot of checkpoint locations and latest statuses
+    """
+
+    def __init__(self, location_collection, data_collection, pending_reports=None):
+        self.location_collection = location_collection
+        self.data_collection = data_collection
+        # Optional callable returning reports accepted but not written yet, {(checkpoint, city): report}
+        self.pending_reports = pending_reports
+        self.version = ""
+        self._points: List[Dict[str, Any]] = []
+        self._tiles: "OrderedDict[Tile, Dict[str, Any]]" = OrderedDict()
+        self._precomputed: Dict[Tile, Dict[str, Any]] = {}
+        self._newest_report: Any = None
+        self._built_at: Optional[float] = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next request (call after writing a report in this process)"""
+        self._stale = True
+
+    def update_reports(self, reports: List[Dict[str, Any]]) -> None:
+        """
+        Apply newly accepted reports to the current snapshot, rebuilding only the tiles that contain
+        their checkpoints (a full rebuild per feedback report would undo the write batching)
+        """
+        with self._lock:
+            if self._built_at is None or self._stale:
+                return
+            points = list(self._points)
+            changed = []
+            for report in reports:
+                key = (report.get("checkpoint_name"), report.get("city_name"))
+                for i, p in enumerate(points):
+                    if (p["checkpoint"], p["city"]) != key:
+                        continue
+                    updated = _with_report(p, report)
+                    if updated is not None:
+                        points[i] = updated
+                        changed.append(updated)
+            if not changed:
+                return
+
+            precomputed = dict(self._precomputed)
+            for z in range(min(TILE_PRECOMPUTE_MAX_ZOOM, TILE_MAX_ZOOM) + 1):
+                for x, y in {_tile_of(p, z) for p in changed}:
+                    tile_points = [p for p in points if _tile_of(p, z) == (x, y)]
+                    precomputed[(z, x, y)] = self._build_tile(z, x, y, tile_points)
+            # Deeper tiles with a changed checkpoint are built again on their next request
+            tiles = OrderedDict(
+                (key, tile)
+                for key, tile in self._tiles.items()
+                if not any(_tile_of(p, key[0]) == key[1:] for p in changed)
+            )
+
+            self._points = points
+            self._precomputed = precomputed
+            self._tiles = tiles
+            self.version = self._digest(points)
+
+    @staticmethod
+    def _digest(points: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha1()
+        for p in points:
+            digest.update(repr((p["checkpoint"], p["city"], p["latitude"], p["longitude"], p.get("status"))).encode())
+            digest.update(repr((p.get("direction"), p.get("updatedAt"))).encode())
+            for d in p.get("directions", []):
+                digest.update(repr((d["direction"], d["status"], d["updatedAt"])).encode())
+        return digest.hexdigest()[:16]
+
+    def _newest_report_id(self) -> Any:
+        doc = self.data_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return doc["_id"] if doc else None
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if not self._stale and self._built_at is not None:
+            if (
+                now - self._built_at < TILE_SNAPSHOT_MAX_AGE_SECONDS
+                and now - self._checked_at < TILE_VERSION_CHECK_SECONDS
+            ):
+                return
+        with self._lock:
+            now = time.monotonic()
+            expired = self._built_at is None or now - self._built_at >= TILE_SNAPSHOT_MAX_AGE_SECONDS
+            if not self._stale and not expired and now - self._checked_at < TILE_VERSION_CHECK_SECONDS:
+                return
+            newest = self._newest_report_id()
+            self._checked_at = now
+            if self._stale or expired or newest != self._newest_report:
+                self._rebuild(newest)
+
+    def _rebuild(self, newest: Any) -> None:
+        self._stale = False
+        locations = list(
+            self.location_collection.find(
+                {"lat": {"$exists": True}, "lng": {"$exists": True}},
+                {"_id": 0, "checkpoint": 1, "city": 1, "lat": 1, "lng": 1},
+            )
+        )
+        reports = self._latest_by_direction(locations)
+        if self.pending_reports:
+            for key, report in self.pending_reports().items():
+                reports[key].append(report)
+        points = []
+        for loc in locations:
+            lat, lng = loc.get("lat"), loc.get("lng")
+            if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+                continue
+            point = {
+                "type": "checkpoint",
+                "checkpoint": loc.get("checkpoint"),
+                "city": loc.get("city"),
+                "latitude": lat,
+                "longitude": lng,
+            }
+            for report in reports.get((loc.get("checkpoint"), loc.get("city")), []):
+                point = _with_report(point, report) or point
+            points.append(point)
+
+        precomputed: Dict[Tile, Dict[str, Any]] = {}
+        for z in range(min(TILE_PRECOMPUTE_MAX_ZOOM, TILE_MAX_ZOOM) + 1):
+            by_tile: Dict[Tuple[int, int], List[Dict[str, Any]]] = defaultdict(list)
+            for p in points:
+                tx, ty = tile_position(p["latitude"], p["longitude"], z)
+                by_tile[(int(tx), int(ty))].append(p)
+            for (x, y), tile_points in by_tile.items():
+                precomputed[(z, x, y)] = self._build_tile(z, x, y, tile_points)
+
+        # Readers use whatever set of attributes they fetched; each is replaced in one assignment
+        self._points = points
+        self._precomputed = precomputed
+        self._tiles = OrderedDict()
+        self._newest_report = newest
+        self._built_at = time.monotonic()
+        self.version = self._digest(points)
+
+    def _latest_by_direction(self, locations: List[Dict[str, Any]]) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """Latest report per (checkpoint, city) and direction, in one aggregation"""
+        names = sorted({loc["checkpoint"] for loc in locations if loc.get("checkpoint")})
+        reports: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        if not names:
+            return reports
+        pipeline = [
+            {"$match": {"checkpoint_name": {"$in": names}}},
+            {"$sort": {"message_date": -1}},
+            {
+                "$group": {
+                    "_id": {"checkpoint": "$checkpoint_name", "city": "$city_name", "direction": "$direction"},
+                    "status": {"$first": "$status"},
+                    "message_date": {"$first": "$message_date"},
+                }
+            },
+        ]
+        for doc in self.data_collection.aggregate(pipeline):
+            key = (doc["_id"]["checkpoint"], doc["_id"]["city"])
+            reports[key].append({**doc, "direction": doc["_id"]["direction"]})
+        return reports
+
+    def _build_tile(self, z: int, x: int, y: int, points: List[Dict[str, Any]]) -> Dict[str, Any]:
+        clustered = z < TILE_CLUSTER_MAX_ZOOM
+        if clustered:
+            cells: Dict[Tuple[int, int], List[Dict[str, Any]]] = defaultdict(list)
+            for p in points:
+                tx, ty = tile_position(p["latitude"], p["longitude"], z)
+                cells[(int((tx - x) * TILE_CLUSTER_GRID), int((ty - y) * TILE_CLUSTER_GRID))].append(p)
+            features = [cell[0] if len(cell) == 1 else _cluster(cell) for _, cell in sorted(cells.items())]
+        else:
+            features = sorted(points, key=lambda p: (p["latitude"], p["longitude"]))
+        return {
+            "z": z,
+            "x": x,
+            "y": y,
+            "bounds": tile_bounds(z, x, y),
+            "clustered": clustered,
+            "checkpoints": len(points),
+            "count": len(features),
+            "features": features,
+        }
+
+    def get_tile(self, z: int, x: int, y: int) -> Tuple[Dict[str, Any], str]:
+        """
+        Tile content and the snapshot version it was built from
+
+        Returns:
+            Tuple[Dict, str]: (tile, version)
+        """
+        self._ensure_fresh()
+        version, points_all, precomputed, tiles = self.version, self._points, self._precomputed, self._tiles
+        key = (z, x, y)
+        if z <= TILE_PRECOMPUTE_MAX_ZOOM:
+            return precomputed.get(key) or self._build_tile(z, x, y, []), version
+
+        tile = tiles.get(key)
+        if tile is None:
+            points = []
+            for p in points_all:
+                tx, ty = tile_position(p["latitude"], p["longitude"], z)
+                if int(tx) == x and int(ty) == y:
+                    points.append(p)
+            tile = self._build_tile(z, x, y, points)
+            with self._lock:
+                tiles[key] = tile
+                while len(tiles) > TILE_CACHE_MAX_ENTRIES:
+                    tiles.popitem(last=False)
+        else:
+            with self._lock:
+                if key in tiles:
+                    tiles.move_to_end(key)
+        return tile, version
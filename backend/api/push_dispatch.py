@@ -0,0 +1,332 @@
+"""
+Proximity push notifications for checkpoint status changes.
+
+Push subscriptions are stored with the user's last location (GeoJSON point, 2dsphere index).
+The dispatcher follows inserts into the reports collection through a MongoDB change stream,
+so reports from the consumer and from POST /api/feedback are handled the same way. For each
+report that changes a checkpoint's status it looks up the subscribers within RADIUS_IN_KM of
+the checkpoint (index-backed $geoWithin) and sends them one notification in batches through a
+pluggable sender:
+
+    PUSH_SENDER=webpush   Web Push with VAPID (needs pywebpush)
+    PUSH_SENDER=local     keeps notifications in memory and logs them (local runs and tests)
+
+Run the dispatcher next to the API (it needs a replica set, which Atlas always is):
+
+    python push_dispatch.py
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure, PyMongoError
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+COLLECTION_PUSH_SUBSCRIPTIONS = os.getenv("MONGO_COLLECTION_PUSH_SUBSCRIPTIONS", "push_subscriptions")
+PUSH_SENDER = os.getenv("PUSH_SENDER", "local").lower()
+PUSH_BATCH_SIZE = int(os.getenv("PUSH_BATCH_SIZE", "100"))
+PUSH_SEND_CONCURRENCY = int(os.getenv("PUSH_SEND_CONCURRENCY", "8"))
+PUSH_TTL_SECONDS = int(os.getenv("PUSH_TTL_SECONDS", "3600"))
+RADIUS_KM = float(os.getenv("RADIUS_IN_KM", "10"))
+# Push services a subscription endpoint may point at; "*." entries also match subdomains
+PUSH_ALLOWED_HOSTS = [
+    h.strip().lower()
+    for h in os.getenv(
+        "PUSH_ALLOWED_HOSTS",
+        "fcm.googleapis.com,updates.push.services.mozilla.com,*.notify.windows.com,*.push.apple.com",
+    ).split(",")
+    if h.strip()
+]
+
+# Reports older than this when they reach the dispatcher (late or replayed inserts) are not pushed
+PUSH_MAX_REPORT_AGE_SECONDS = int(os.getenv("PUSH_MAX_REPORT_AGE_SECONDS", "900"))
+
+# Mean Earth radius, the same one geo_utils.haversine uses
+EARTH_RADIUS_KM = 6371
+
+UNKNOWN = "غير محدد"
+
+
+def ensure_push_indexes(subscriptions) -> None:
+    try:
+        subscriptions.create_index([("endpoint", ASCENDING)], unique=True, name="endpoint_unique")
+        subscriptions.create_index([("location", GEOSPHERE)], name="location_2dsphere")
+    except OperationFailure as e:
+        log.warning(f"Could not create push subscription indexes: {e}")
+
+
+def is_allowed_endpoint(endpoint: Any) -> bool:
+    """True for an https URL on one of PUSH_ALLOWED_HOSTS (the dispatcher POSTs to it, so nothing else is accepted)"""
+    if not isinstance(endpoint, str):
+        return False
+    try:
+        parts = urlsplit(endpoint)
+        port = parts.port
+    except ValueError:
+        return False
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https" or not host or port not in (None, 443) or parts.username or parts.password:
+        return False
+    for allowed in PUSH_ALLOWED_HOSTS:
+        if allowed.startswith("*."):
+            if host.endswith(allowed[1:]):
+                return True
+        elif host == allowed:
+            return True
+    return False
+
+
+def save_subscription(subscriptions, subscription: Dict[str, Any], lat: float, lng: float) -> bool:
+    """
+    Create or update a push subscription with the user's last location
+
+    Args:
+        subscriptions: Push subscriptions collection
+        subscription (Dict): PushSubscription.toJSON() from the browser ({endpoint, keys: {p256dh, auth}})
+        lat (float): User latitude
+        lng (float): User longitude
+
+    Returns:
+        bool: True when the subscription is new
+    """
+    now = datetime.now(timezone.utc)
+    result = subscriptions.update_one(
+        {"endpoint": subscription["endpoint"]},
+        {
+            "$set": {
+                "keys": subscription.get("keys") or {},
+                "location": {"type": "Point", "coordinates": [lng, lat]},
+                "updated_at": now,
+            },
+            "$setOnInsert": {"created_at": now},
+        },
+        upsert=True,
+    )
+    return result.upserted_id is not None
+
+
+def subscribers_near(subscriptions, lat: float, lng: float, radius_km: float = RADIUS_KM):
+    """Cursor over the subscriptions whose last location is within radius_km of the point"""
+    return subscriptions.find(
+        {"location": {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}}},
+        {"endpoint": 1, "keys": 1},
+    )
+
+
+# ---------------- Senders ----------------
+class LocalSender:
+    """
+    Stand-in sender: keeps what would have been sent and logs it
+    """
+
+    def __init__(self) -> None:
+        self.sent: List[Tuple[str, Dict[str, Any]]] = []
+        # Endpoints to report as expired, for exercising the cleanup path
+        self.gone: set = set()
+
+    def send_batch(self, subscriptions: List[Dict[str, Any]], payload: Dict[str, Any]) -> List[str]:
+        """Returns the endpoints that no longer exist (to be deleted)"""
+        for sub in subscriptions:
+            self.sent.append((sub["endpoint"], payload))
+        log.info(
+            f"📣 Local push: {payload.get('title')} to {len(subscriptions)} subscribers",
+            extra={"event": "push.local", "checkpoint": payload.get("checkpoint"), "recipients": len(subscriptions)},
+        )
+        return [sub["endpoint"] for sub in subscriptions if sub["endpoint"] in self.gone]
+
+
+class WebPushSender:
+    """
+    Web Push (RFC 8030) with VAPID through pywebpush; sends a batch concurrently
+    """
+
+    def __init__(self, vapid_private_key: str, vapid_subject: str, concurrency: int = PUSH_SEND_CONCURRENCY) -> None:
+        try:
+            from pywebpush import WebPushException, webpush
+        except ImportError as e:
+            raise RuntimeError("PUSH_SENDER=webpush needs the pywebpush package") from e
+        self._webpush = webpush
+        self._error = WebPushException
+        self.vapid_private_key = vapid_private_key
+        self.vapid_claims = {"sub": vapid_subject}
+        self.concurrency = concurrency
+
+    def _send(self, sub: Dict[str, Any], data: str) -> Optional[str]:
+        try:
+            self._webpush(
+                subscription_info={"endpoint": sub["endpoint"], "keys": sub.get("keys") or {}},
+                data=data,
+                vapid_private_key=self.vapid_private_key,
+                vapid_claims=dict(self.vapid_claims),
+                ttl=PUSH_TTL_SECONDS,
+            )
+        except self._error as e:
+            status = getattr(e.response, "status_code", None)
+            if status in (404, 410):
+                return sub["endpoint"]
+            log.warning(f"Web push failed ({status}): {e}", extra={"event": "push.error"})
+        return None
+
+    def send_batch(self, subscriptions: List[Dict[str, Any]], payload: Dict[str, Any]) -> List[str]:
+        """Returns the endpoints that no longer exist (to be deleted)"""
+        data = json.dumps(payload, ensure_ascii=False, default=str)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return [endpoint for endpoint in pool.map(lambda s: self._send(s, data), subscriptions) if endpoint]
+
+
+def create_sender():
+    """Sender from PUSH_SENDER ("local" or "webpush")"""
+    if PUSH_SENDER == "webpush":
+        from keyvault_client import get_secret
+
+        return WebPushSender(
+            vapid_private_key=get_secret(os.getenv("VAPID_PRIVATE_KEY_SECRET", "VapidPrivateKey")),
+            vapid_subject=os.getenv("VAPID_SUBJECT", "mailto:admin@example.com"),
+        )
+    return LocalSender()
+
+
+# ---------------- Dispatcher ----------------
+class PushDispatcher:
+    """
+    Fans a new report out to the subscribers near its checkpoint
+    """
+
+    def __init__(self, db, sender, radius_km: float = RADIUS_KM, batch_size: int = PUSH_BATCH_SIZE) -> None:
+        self.data_collection = db[os.getenv("MONGO_COLLECTION_DATA")]
+        self.location_collection = db[os.getenv("MONGO_COLLECTION_LOCATIONS")]
+        self.subscriptions = db[COLLECTION_PUSH_SUBSCRIPTIONS]
+        self.sender = sender
+        self.radius_km = radius_km
+        self.batch_size = batch_size
+
+    def _is_current(self, report: Dict[str, Any]) -> bool:
+        """False for a report older than PUSH_MAX_REPORT_AGE_SECONDS or than a stored report of the same direction"""
+        message_date = report.get("message_date")
+        if not isinstance(message_date, datetime):
+            return False
+        if message_date.tzinfo is None:
+            # Change stream documents carry naive UTC datetimes
+            message_date = message_date.replace(tzinfo=timezone.utc)
+        if (datetime.now(timezone.utc) - message_date).total_seconds() > PUSH_MAX_REPORT_AGE_SECONDS:
+            return False
+        newer = self.data_collection.find_one(
+            {
+                "checkpoint_name": report.get("checkpoint_name"),
+                "city_name": report.get("city_name"),
+                "direction": report.get("direction"),
+                "message_date": {"$gt": report.get("message_date")},
+            },
+            {"_id": 1},
+        )
+        return newer is None
+
+    def _status_changed(self, report: Dict[str, Any]) -> bool:
+        """True unless the previous report for the same checkpoint, city and direction had the same status"""
+        previous = self.data_collection.find_one(
+            {
+                "checkpoint_name": report.get("checkpoint_name"),
+                "city_name": report.get("city_name"),
+                "direction": report.get("direction"),
+                "message_date": {"$lt": report.get("message_date")},
+                "_id": {"$ne": report.get("_id")},
+            },
+            {"status": 1},
+            sort=[("message_date", -1)],
+        )
+        return previous is None or previous.get("status") != report.get("status")
+
+    def notify_report(self, report: Dict[str, Any]) -> int:
+        """
+        Notify the subscribers near the report's checkpoint
+
+        Returns:
+            int: Number of subscribers notified
+        """
+        checkpoint, city = report.get("checkpoint_name"), report.get("city_name")
+        if not checkpoint or checkpoint == UNKNOWN or not report.get("status") or report.get("status") == UNKNOWN:
+            return 0
+        if not self._is_current(report) or not self._status_changed(report):
+            return 0
+        location = self.location_collection.find_one({"checkpoint": checkpoint, "city": city}, {"lat": 1, "lng": 1})
+        if not location or location.get("lat") is None or location.get("lng") is None:
+            return 0
+
+        payload = {
+            "title": "🚧 تغيرت حالة حاجز قريب منك",
+            "body": f"🔘 {checkpoint} 📍 {city}: {report.get('status')} 🧭 {report.get('direction') or UNKNOWN}",
+            "checkpoint": checkpoint,
+            "city": city,
+            "status": report.get("status"),
+            "direction": report.get("direction"),
+            "updatedAt": report.get("message_date"),
+        }
+        notified, gone = 0, []
+        batch: List[Dict[str, Any]] = []
+        for sub in subscribers_near(self.subscriptions, location["lat"], location["lng"], self.radius_km):
+            batch.append(sub)
+            if len(batch) >= self.batch_size:
+                gone += self.sender.send_batch(batch, payload)
+                notified += len(batch)
+                batch = []
+        if batch:
+            gone += self.sender.send_batch(batch, payload)
+            notified += len(batch)
+        if gone:
+            self.subscriptions.delete_many({"endpoint": {"$in": gone}})
+        if notified:
+            log.info(
+                f"📣 {checkpoint} ({city}) -> {report.get('status')}: notified {notified} subscribers",
+                extra={"event": "push.dispatched", "checkpoint": checkpoint, "recipients": notified, "gone": len(gone)},
+            )
+        return notified - len(gone)
+
+    def run(self, resume_after: Optional[Dict[str, Any]] = None) -> None:
+        """Follow inserts into the reports collection until interrupted, reconnecting on errors"""
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        resume_token = resume_after
+        while True:
+            try:
+                with self.data_collection.watch(pipeline, resume_after=resume_token) as stream:
+                    log.info("📡 Push dispatcher watching new reports")
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        try:
+                            self.notify_report(change["fullDocument"])
+                        except PyMongoError as e:
+                            log.warning(f"Push dispatch failed for a report: {e}", extra={"event": "push.error"})
+            except PyMongoError as e:
+                log.warning(f"Change stream interrupted, resuming in 5s: {e}", extra={"event": "push.stream_error"})
+                time.sleep(5)
+
+
+def main() -> None:
+    from json_logging import setup_logging
+    from keyvault_client import get_secret
+    from pymongo import MongoClient
+
+    setup_logging()
+    client = MongoClient(get_secret(os.getenv("MONGO_CONNECTION_STRING_KEY")))
+    db = client.get_default_database(os.getenv("MONGO_DB_NAME"))
+    ensure_push_indexes(db[COLLECTION_PUSH_SUBSCRIPTIONS])
+    try:
+        PushDispatcher(db, create_sender()).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
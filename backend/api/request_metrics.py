@@ -0,0 +1,220 @@
+"""
+Per-request metrics for the Flask API, exposed in Prometheus text format on /metrics.
+
+Every request records its latency and status code per route template. A PyMongo CommandListener
+attributes each Mongo command (count, duration, documents returned) to the request that issued it,
+so an N+1 pattern such as one find_one per checkpoint shows up as a high commands-per-request count.
+Requests slower than SLOW_REQUEST_MS are logged with their command breakdown.
+
+Metrics are kept per process: with several gunicorn workers each one serves its own numbers.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from flask import Response, g, request
+from pymongo import monitoring
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMANDS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+
+# Commands issued outside a request (startup, background threads)
+NO_ROUTE = "none"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _CommandStats:
+    __slots__ = ("count", "failures", "seconds", "documents")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.documents = 0
+
+
+def _documents_returned(command_name: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    if command_name == "distinct":
+        return len(reply.get("values") or [])
+    return 0
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class RequestMetrics(monitoring.CommandListener):
+    """
+    Registry of request and Mongo command metrics, and the CommandListener that feeds it.
+    Pass it to the Mongo client (event_listeners=[metrics]) and call init_app(app).
+    """
+
+    def __init__(self, slow_request_ms: float = SLOW_REQUEST_MS) -> None:
+        self.slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+        self._commands_per_request: Dict[Tuple[str, str], _Histogram] = {}
+        self._commands: Dict[Tuple[str, str], _CommandStats] = defaultdict(_CommandStats)
+
+    # ---------------- Flask ----------------
+    def init_app(self, app, endpoint: str = "/metrics") -> None:
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule(endpoint, "metrics", self.metrics_view, methods=["GET"])
+
+    def _before_request(self) -> None:
+        g.metrics_started = time.perf_counter()
+        # command name -> [count, seconds, documents] for the current request
+        self._local.commands = defaultdict(lambda: [0, 0.0, 0])
+
+    def _after_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        commands = getattr(self._local, "commands", None) or {}
+        total_commands = sum(c[0] for c in commands.values())
+
+        key = (request.method, route)
+        with self._lock:
+            self._requests[(request.method, route, response.status_code)] += 1
+            self._latency.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self._commands_per_request.setdefault(key, _Histogram(COMMANDS_BUCKETS)).observe(total_commands)
+
+        if elapsed * 1000 >= self.slow_request_ms:
+            breakdown = ", ".join(
+                f"{name}={count} ({seconds * 1000:.0f}ms, {docs} docs)"
+                for name, (count, seconds, docs) in sorted(commands.items(), key=lambda item: -item[1][1])
+            )
+            log.warning(
+                f"🐢 Slow request {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                f"in {elapsed * 1000:.0f}ms, {total_commands} Mongo commands: {breakdown or 'none'}",
+                extra={
+                    "event": "request.slow",
+                    "route": route,
+                    "status": response.status_code,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "mongo_commands": {
+                        name: {"count": count, "ms": round(seconds * 1000, 1), "docs": docs}
+                        for name, (count, seconds, docs) in commands.items()
+                    },
+                },
+            )
+        return response
+
+    def _teardown_request(self, exc: Optional[BaseException]) -> None:
+        self._local.commands = None
+
+    # ---------------- PyMongo CommandListener ----------------
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self._record(event.command_name, event.duration_micros, _documents_returned(event.command_name, event.reply))
+
+    def failed(self, event) -> None:
+        self._record(event.command_name, event.duration_micros, 0, failed=True)
+
+    def _record(self, command_name: str, duration_micros: int, documents: int, failed: bool = False) -> None:
+        seconds = duration_micros / 1_000_000
+        commands = getattr(self._local, "commands", None)
+        route = NO_ROUTE
+        if commands is not None:
+            current = commands[command_name]
+            current[0] += 1
+            current[1] += seconds
+            current[2] += documents
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+        with self._lock:
+            stats = self._commands[(route, command_name)]
+            stats.count += 1
+            stats.failures += int(failed)
+            stats.seconds += seconds
+            stats.documents += documents
+
+    # ---------------- Exposition ----------------
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP http_requests_total HTTP requests by route template and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(
+                    f"http_requests_total{{{_labels(method=method, route=route, status=str(status))}}} {count}"
+                )
+
+            for name, help_text, histograms in (
+                ("http_request_duration_seconds", "HTTP request latency.", self._latency),
+                ("http_request_mongo_commands", "Mongo commands issued per HTTP request.", self._commands_per_request),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), hist in sorted(histograms.items()):
+                    labels = _labels(method=method, route=route)
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                    lines.append(f"{name}_sum{{{labels}}} {round(hist.sum, 6)}")
+                    lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+            for name, help_text, value in (
+                ("mongo_commands_total", "Mongo commands by issuing route and command.", lambda s: s.count),
+                ("mongo_command_failures_total", "Failed Mongo commands.", lambda s: s.failures),
+                ("mongo_command_duration_seconds_total", "Time spent in Mongo commands.", lambda s: f"{s.seconds:.6f}"),
+                ("mongo_documents_returned_total", "Documents returned by Mongo commands.", lambda s: s.documents),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (route, command), stats in sorted(self._commands.items()):
+                    lines.append(f"{name}{{{_labels(route=route, command=command)}}} {value(stats)}")
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self) -> Response:
+        return Response(self.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def create_request_metrics() -> Optional[RequestMetrics]:
+    """Build the metrics registry from environment settings (None when METRICS_ENABLED=false)"""
+    if not METRICS_ENABLED:
+        return None
+    return RequestMetrics(slow_request_ms=SLOW_REQUEST_MS)
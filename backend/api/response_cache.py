@@ -0,0 +1,207 @@
+"""
+Near-duplicate response cache for general (non-checkpoint) AI queries.
+
+Prompts are normalized, split into character n-grams and indexed with MinHash/LSH,
+so "مرحبا كيف الحال" and "مرحباً، كيف الحال؟" hit the same cached answer.
+Checkpoint status answers must never go through this cache.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Largest prime below 2**32, used for the MinHash universal hash family
+_PRIME = 4294967291
+
+_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u0640]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_arabic(text: str) -> str:
+    """
+    Normalize an Arabic prompt for cache lookups:
+    removes diacritics/tatweel and punctuation, unifies alef/ya/ta marbuta forms
+    and collapses whitespace
+    """
+    if not text:
+        return ""
+    t = _DIACRITICS.sub("", text.lower())
+    t = re.sub("[إأآٱ]", "ا", t)
+    t = t.replace("ى", "ي").replace("ة", "ه").replace("ؤ", "و").replace("ئ", "ي")
+    t = _PUNCTUATION.sub(" ", t)
+    return _SPACES.sub(" ", t).strip()
+
+
+def _shingles(text: str, n: int) -> Set[str]:
+    """Character n-grams of a normalized prompt (the whole prompt if shorter than n)"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:j] for i, j in zip(range(len(padded) - n + 1), range(n, len(padded) + 1))}
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with per-entry TTL and MinHash/LSH near-duplicate matching
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 500,
+        ttl_seconds: int = 3600,
+        threshold: float = 0.8,
+        ngram: int = 3,
+        bands: int = 16,
+        rows: int = 4,
+    ) -> None:
+        """
+        Args:
+            max_entries (int): Maximum number of cached responses (LRU eviction)
+            ttl_seconds (int): Lifetime of a cached response
+            threshold (float): Minimum n-gram Jaccard similarity for a near-duplicate hit
+            ngram (int): Character n-gram size
+            bands (int): Number of LSH bands
+            rows (int): MinHash rows per band
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = rows
+
+        num_perm = bands * rows
+        self._hash_params: List[Tuple[int, int]] = [
+            (1 + (i * 2654435761) % (_PRIME - 1), (i * 40503 + 12345) % _PRIME) for i in range(1, num_perm + 1)
+        ]
+
+        # key (normalized prompt) -> (shingles, band keys, response, expires_at), oldest first
+        self._entries: OrderedDict = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _band_keys(self, shingles: Set[str]) -> List[Tuple[int, Tuple[int, ...]]]:
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+        signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in self._hash_params]
+        band_keys = []
+        for band in range(self.bands):
+            start, end = band * self.rows, (band + 1) * self.rows
+            band_keys.append((band, tuple(signature[start:end])))
+        return band_keys
+
+    def _remove(self, key: str) -> None:
+        _, band_keys, _, _ = self._entries.pop(key)
+        for band_key in band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def get(self, prompt: str) -> Optional[str]:
+        """
+        Return a cached response for the prompt or a near-duplicate of it
+
+        Args:
+            prompt (str): Raw user prompt
+
+        Returns:
+            Optional[str]: Cached response or None on a miss
+        """
+        key = normalize_arabic(prompt)
+        if not key:
+            return None
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[3] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+
+            shingles = _shingles(key, self.ngram)
+            candidates: Set[str] = set()
+            for band_key in self._band_keys(shingles):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best_key, best_score = None, 0.0
+            for candidate in candidates:
+                cand_shingles, _, _, expires_at = self._entries[candidate]
+                if expires_at <= now:
+                    continue
+                score = len(shingles & cand_shingles) / len(shingles | cand_shingles)
+                if score > best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                self.near_hits += 1
+                return self._entries[best_key][2]
+
+            self.misses += 1
+            return None
+
+    def put(self, prompt: str, response: str) -> None:
+        """
+        Cache a response for the prompt
+
+        Args:
+            prompt (str): Raw user prompt
+            response (str): AI response to reuse for this prompt and its near-duplicates
+        """
+        key = normalize_arabic(prompt)
+        if not key or not response:
+            return
+        shingles = _shingles(key, self.ngram)
+        band_keys = self._band_keys(shingles)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (shingles, band_keys, response, time.monotonic() + self.ttl_seconds)
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict:
+        """Hit-rate metrics; every hit is one Azure OpenAI call saved"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "llm_calls_saved": self.hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the ask-ai response cache from environment variables (None when disabled)"""
+    if os.getenv("AI_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    return ResponseCache(
+        max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "500")),
+        ttl_seconds=int(os.getenv("AI_CACHE_TTL_SECONDS", "3600")),
+        threshold=float(os.getenv("AI_CACHE_SIMILARITY", "0.8")),
+    )
@@ -0,0 +1,141 @@
+"""
+Hourly per-checkpoint status rollups.
+
+One document per (checkpoint, city, UTC hour) with report counts by status and direction,
+kept up to date with $inc upserts when a report is stored (consumer and user feedback).
+History queries read at most days * 24 rollups per checkpoint, however many raw reports exist.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+load_dotenv()
+
+UNKNOWN = "غير محدد"
+
+# Day and hour-of-week buckets are in local time ("Sunday mornings" means Palestine time)
+ROLLUP_TIMEZONE = ZoneInfo(os.getenv("ROLLUP_TIMEZONE", "Asia/Hebron"))
+
+HISTORY_VIEWS = {"day": 30, "week": 182, "hour_of_week": 84}  # view -> default lookback in days
+MAX_HISTORY_DAYS = 366
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def hour_bucket(dt: datetime) -> datetime:
+    """Start of the UTC hour containing dt (naive datetimes are taken as UTC)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _field_name(value: Optional[str]) -> str:
+    """Status/direction as a counter field name ("." and a leading "$" are not allowed in field names)"""
+    return (value or "").replace(".", " ").lstrip("$").strip() or UNKNOWN
+
+
+def rollup_ops(docs: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """
+    $inc upserts for a batch of stored reports, one per (checkpoint, city, hour)
+
+    Args:
+        docs (Iterable[Dict]): Report documents with checkpoint_name, city_name, status, direction, message_date
+
+    Returns:
+        List[UpdateOne]: Operations for the rollups collection
+    """
+    increments: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for doc in docs:
+        checkpoint, date = doc.get("checkpoint_name"), doc.get("message_date")
+        if not checkpoint or checkpoint == UNKNOWN or not isinstance(date, datetime):
+            continue
+        key = (checkpoint, doc.get("city_name") or UNKNOWN, hour_bucket(date))
+        counts = increments[key]
+        counts["total"] += 1
+        counts[f"status.{_field_name(doc.get('status'))}"] += 1
+        counts[f"direction.{_field_name(doc.get('direction'))}"] += 1
+
+    return [
+        UpdateOne({"checkpoint_name": cp, "city_name": city, "hour": hour}, {"$inc": dict(counts)}, upsert=True)
+        for (cp, city, hour), counts in increments.items()
+    ]
+
+
+def record_reports(collection, docs: Iterable[Dict[str, Any]]) -> None:
+    """Add stored reports to the hourly rollups"""
+    ops = rollup_ops(docs)
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def _bucket_key(view: str, hour: datetime) -> tuple:
+    local = hour_bucket(hour).astimezone(ROLLUP_TIMEZONE)
+    if view == "day":
+        return (local.date().isoformat(),)
+    if view == "week":
+        year, week, _ = local.isocalendar()
+        return (f"{year}-W{week:02d}",)
+    return local.weekday(), local.hour
+
+
+def checkpoint_history(
+    collection, checkpoint: str, city: Optional[str] = None, view: str = "day", days: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Aggregate the rollups of one checkpoint
+
+    Args:
+        collection: Rollups collection
+        checkpoint (str): Checkpoint name
+        city (Optional[str]): City name (all cities with that checkpoint name when omitted)
+        view (str): "day", "week" or "hour_of_week"
+        days (Optional[int]): Lookback in days (defaults per view, capped at MAX_HISTORY_DAYS)
+
+    Returns:
+        Dict: Buckets with total, status and direction counts, oldest first
+    """
+    days = min(days or HISTORY_VIEWS[view], MAX_HISTORY_DAYS)
+    since = hour_bucket(datetime.now(timezone.utc)) - timedelta(days=days)
+    query: Dict[str, Any] = {"checkpoint_name": checkpoint, "hour": {"$gte": since}}
+    if city:
+        query["city_name"] = city
+
+    buckets: Dict[tuple, Dict[str, Any]] = {}
+    for rollup in collection.find(query, {"_id": 0, "hour": 1, "total": 1, "status": 1, "direction": 1}):
+        key = _bucket_key(view, rollup["hour"])
+        bucket = buckets.setdefault(key, {"total": 0, "status": defaultdict(int), "direction": defaultdict(int)})
+        bucket["total"] += rollup.get("total", 0)
+        for field in ("status", "direction"):
+            for name, count in (rollup.get(field) or {}).items():
+                bucket[field][name] += count
+
+    out = []
+    for key in sorted(buckets):
+        bucket = buckets[key]
+        if view == "hour_of_week":
+            label = {"weekday": key[0], "weekday_name": WEEKDAYS[key[0]], "hour": key[1]}
+        else:
+            label = {view: key[0]}
+        out.append(
+            {
+                **label,
+                "total": bucket["total"],
+                "status": dict(bucket["status"]),
+                "direction": dict(bucket["direction"]),
+            }
+        )
+
+    return {
+        "checkpoint": checkpoint,
+        "city": city,
+        "view": view,
+        "days": days,
+        "timezone": str(ROLLUP_TIMEZONE),
+        "buckets": out,
+    }
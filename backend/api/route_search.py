@@ -0,0 +1,264 @@
+"""
+Checkpoints along a route.
+
+Checkpoints are bucketed into a uniform grid of ROUTE_GRID_CELL_KM cells (projected with
+geo_utils.project_km), rebuilt from the locations collection every ROUTE_INDEX_REFRESH_SECONDS.
+A route query walks each segment cell by cell and only measures the checkpoints in the cells
+within the corridor, so its cost follows the route length, not checkpoints × segments. The same grid answers
+closest-checkpoint lookups by searching outwards from the query cell.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from geo_utils import haversine, point_segment_distance, project_km
+
+load_dotenv()
+
+ROUTE_GRID_CELL_KM = float(os.getenv("ROUTE_GRID_CELL_KM", "2"))
+ROUTE_INDEX_REFRESH_SECONDS = int(os.getenv("ROUTE_INDEX_REFRESH_SECONDS", "600"))
+ROUTE_CORRIDOR_KM = float(os.getenv("ROUTE_CORRIDOR_KM", "1"))
+ROUTE_MAX_CORRIDOR_KM = float(os.getenv("ROUTE_MAX_CORRIDOR_KM", "10"))
+ROUTE_MAX_POINTS = int(os.getenv("ROUTE_MAX_POINTS", "5000"))
+ROUTE_MAX_KM = float(os.getenv("ROUTE_MAX_KM", "1000"))
+
+# Projection reference latitude (middle of the West Bank); any fixed value near the data works
+REF_LAT = 31.9
+
+Cell = Tuple[int, int]
+Point = Tuple[float, float]
+# (min x, max x, min y, max y) of the occupied cells, None when there are no checkpoints
+Extent = Optional[Tuple[int, int, int, int]]
+
+
+def route_length_km(path: Sequence[Tuple[float, float]]) -> float:
+    """Length of a route of (lat, lng) points, measured in the same projection as along_route"""
+    points = [project_km(lat, lng, REF_LAT) for lat, lng in path]
+    return sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(points, points[1:]))
+
+
+def clip_segment(a: Point, b: Point, box: Tuple[float, float, float, float]) -> Optional[Tuple[Point, Point]]:
+    """Part of segment a-b inside box (min x, max x, min y, max y), None when it misses the box (Liang-Barsky)"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, a[0] - box[0]), (dx, box[1] - a[0]), (-dy, a[1] - box[2]), (dy, box[3] - a[1])):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return None
+    return (a[0] + t0 * dx, a[1] + t0 * dy), (a[0] + t1 * dx, a[1] + t1 * dy)
+
+
+class RouteCheckpointIndex:
+    """
+    Uniform grid over the checkpoint locations
+    """
+
+    def __init__(
+        self,
+        location_collection,
+        cell_km: float = ROUTE_GRID_CELL_KM,
+        refresh_seconds: int = ROUTE_INDEX_REFRESH_SECONDS,
+    ):
+        self.location_collection = location_collection
+        self.cell_km = cell_km
+        self.refresh_seconds = refresh_seconds
+        self._state: Tuple[Dict[Cell, List[Dict[str, Any]]], Extent] = ({}, None)
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_km), math.floor(y / self.cell_km)
+
+    def _refresh(self) -> Tuple[Dict[Cell, List[Dict[str, Any]]], Extent]:
+        """Rebuild the grid when it is older than refresh_seconds; returns the current grid and its cell extent"""
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+            return self._state
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_seconds:
+                return self._state
+            grid: Dict[Cell, List[Dict[str, Any]]] = {}
+            query = {"lat": {"$exists": True}, "lng": {"$exists": True}}
+            for loc in self.location_collection.find(query, {"_id": 0, "checkpoint": 1, "city": 1, "lat": 1, "lng": 1}):
+                lat, lng = loc.get("lat"), loc.get("lng")
+                if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+                    continue
+                x, y = project_km(lat, lng, REF_LAT)
+                entry = {**loc, "xy": (x, y)}
+                grid.setdefault(self._cell(x, y), []).append(entry)
+            extent = None
+            if grid:
+                xs, ys = [c[0] for c in grid], [c[1] for c in grid]
+                extent = (min(xs), max(xs), min(ys), max(ys))
+            # Swap in one assignment so readers never see a half-built grid
+            self._state = (grid, extent)
+            self._loaded_at = time.monotonic()
+            return self._state
+
+    def _segment_cells(self, a: Tuple[float, float], b: Tuple[float, float], corridor_km: float) -> List[Cell]:
+        """Cells within corridor_km of segment a-b, found by stepping along it one cell at a time"""
+        reach = math.ceil(corridor_km / self.cell_km)
+        length = math.hypot(b[0] - a[0], b[1] - a[1])
+        steps = max(1, math.ceil(length / self.cell_km))
+        cells = set()
+        for i in range(steps + 1):
+            t = i / steps
+            cx, cy = self._cell(a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1]))
+            for dx in range(-reach - 1, reach + 2):
+                for dy in range(-reach - 1, reach + 2):
+                    cells.add((cx + dx, cy + dy))
+        return list(cells)
+
+    def along_route(
+        self, path: Sequence[Tuple[float, float]], corridor_km: float
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Checkpoints within corridor_km of the route
+
+        Args:
+            path (Sequence[Tuple[float, float]]): Route points (lat, lng), at least two
+            corridor_km (float): Maximum distance from the route
+
+        Returns:
+            Tuple[List[Dict], float]: (checkpoints ordered along the route with distance_from_route_km and
+                                       distance_along_route_km, route length in KM)
+        """
+        grid, extent = self._refresh()
+        points = [project_km(lat, lng, REF_LAT) for lat, lng in path]
+        best: Dict[Tuple[str, str], Tuple[float, float, Dict[str, Any]]] = {}
+        travelled = 0.0
+        box = None
+        if extent is not None:
+            # Only the part of a segment near the checkpoints is stepped through, however far the route runs
+            margin = corridor_km + self.cell_km
+            box = (
+                extent[0] * self.cell_km - margin,
+                (extent[1] + 1) * self.cell_km + margin,
+                extent[2] * self.cell_km - margin,
+                (extent[3] + 1) * self.cell_km + margin,
+            )
+        for a, b in zip(points, points[1:]):
+            seg_len = math.hypot(b[0] - a[0], b[1] - a[1])
+            clipped = clip_segment(a, b, box) if box else None
+            for cell in self._segment_cells(*clipped, corridor_km) if clipped else ():
+                for cp in grid.get(cell, ()):
+                    dist, t = point_segment_distance(cp["xy"], a, b)
+                    if dist > corridor_km:
+                        continue
+                    key = (cp.get("checkpoint"), cp.get("city"))
+                    # The closest pass wins when the route comes near a checkpoint twice
+                    if key not in best or dist < best[key][0]:
+                        best[key] = (dist, travelled + t * seg_len, cp)
+            travelled += seg_len
+
+        results = []
+        for dist, along, cp in sorted(best.values(), key=lambda item: item[1]):
+            results.append(
+                {
+                    "checkpoint": cp.get("checkpoint"),
+                    "city": cp.get("city"),
+                    "latitude": cp.get("lat"),
+                    "longitude": cp.get("lng"),
+                    "distance_from_route_km": round(dist, 2),
+                    "distance_along_route_km": round(along, 2),
+                }
+            )
+        return results, travelled
+
+    def closest(self, lat: float, lng: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Closest checkpoint to a point, searching outwards one ring of cells at a time
+        (or scanning every checkpoint when the point is outside the grid's extent)
+
+        Returns:
+            Optional[Tuple[Dict, float]]: (location with checkpoint, city, lat, lng; distance in KM),
+                                          None when there are no checkpoints
+        """
+        grid, extent = self._refresh()
+        if extent is None:
+            return None
+        x, y = project_km(lat, lng, REF_LAT)
+        cx, cy = self._cell(x, y)
+        if not (extent[0] <= cx <= extent[1] and extent[2] <= cy <= extent[3]):
+            # Outside the occupied cells the rings would first cross the whole gap: measure every checkpoint
+            best = min(
+                (cp for cps in grid.values() for cp in cps),
+                key=lambda cp: math.hypot(cp["xy"][0] - x, cp["xy"][1] - y),
+            )
+            return best, haversine(lat, lng, best["lat"], best["lng"])
+        max_ring = max(cx - extent[0], extent[1] - cx, cy - extent[2], extent[3] - cy)
+        best, best_dist = None, math.inf
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                cells = [(cx, cy)]
+            else:
+                cells = [(cx + d, cy - ring) for d in range(-ring, ring + 1)]
+                cells += [(cx + d, cy + ring) for d in range(-ring, ring + 1)]
+                cells += [(cx - ring, cy + d) for d in range(-ring + 1, ring)]
+                cells += [(cx + ring, cy + d) for d in range(-ring + 1, ring)]
+            for cell in cells:
+                for cp in grid.get(cell, ()):
+                    dist = math.hypot(cp["xy"][0] - x, cp["xy"][1] - y)
+                    if dist < best_dist:
+                        best, best_dist = cp, dist
+            # Anything in the next ring is at least ring × cell_km away
+            if best is not None and best_dist <= ring * self.cell_km:
+                break
+        if best is None:
+            return None
+        return best, haversine(lat, lng, best["lat"], best["lng"])
+
+
+def latest_statuses(
+    data_collection, checkpoints: List[Dict[str, Any]], with_message: bool = False
+) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Latest report per (checkpoint, city) for the given checkpoints, in one aggregation
+    (status, direction, message_date, and the report's message when with_message is set)"""
+    names = sorted({cp["checkpoint"] for cp in checkpoints if cp.get("checkpoint")})
+    if not names:
+        return {}
+    group = {
+        "_id": {"checkpoint": "$checkpoint_name", "city": "$city_name"},
+        "status": {"$first": "$status"},
+        "direction": {"$first": "$direction"},
+        "message_date": {"$first": "$message_date"},
+    }
+    if with_message:
+        group["message"] = {"$first": "$message"}
+    pipeline = [
+        {"$match": {"checkpoint_name": {"$in": names}}},
+        {"$sort": {"message_date": -1}},
+        {"$group": group},
+    ]
+    return {(doc["_id"]["checkpoint"], doc["_id"]["city"]): doc for doc in data_collection.aggregate(pipeline)}
+
+
+def parse_point(value: Any) -> Tuple[float, float]:
+    """ "lat,lng" or [lat, lng] -> (lat, lng)"""
+    parts = value.split(",") if isinstance(value, str) else value
+    if not isinstance(parts, (list, tuple)) or len(parts) != 2:
+        raise ValueError(f"Invalid point: {value!r} (expected 'lat,lng')")
+    lat, lng = float(parts[0]), float(parts[1])
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"Point out of range: {value!r}")
+    return lat, lng
+
+
+def parse_path(value: Any) -> List[Tuple[float, float]]:
+    """ "lat,lng;lat,lng;..." or [[lat, lng], ...] -> [(lat, lng), ...]"""
+    items = [p for p in value.split(";") if p.strip()] if isinstance(value, str) else value
+    if not isinstance(items, (list, tuple)):
+        raise ValueError("Invalid path (expected 'lat,lng;lat,lng;...')")
+    return [parse_point(p) for p in items]
@@ -0,0 +1,318 @@
+"""
+Static status snapshot publisher.
+
+Writes every checkpoint with its latest status per direction as one pre-compressed JSON file that a
+static host or CDN can serve, so the map's "everything" view does not need the API:
+
+    checkpoints.<sha256[:16]>.json      content-hashed, immutable (cache forever)
+    checkpoints.<sha256[:16]>.json.gz   same content, gzip
+    checkpoints.manifest.json           {"current": ..., "gzip": ..., "sha256": ..., ...} (no-cache)
+
+The manifest is written after the data files, so it never points at a file that is not there yet.
+A new version is published only when the content hash changes; the last STATIC_SNAPSHOT_KEEP
+versions are kept for clients that still hold an older manifest.
+
+Targets:
+    STATIC_SNAPSHOT_TARGET=local   files in STATIC_SNAPSHOT_DIR (tests, or a directory a web server serves)
+    STATIC_SNAPSHOT_TARGET=blob    Azure Blob Storage container (needs azure-storage-blob)
+
+Run next to the API; it polls for new reports every STATIC_SNAPSHOT_POLL_SECONDS:
+
+    python static_snapshot.py            # keep publishing
+    python static_snapshot.py --once     # publish one version and exit
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+STATIC_SNAPSHOT_TARGET = os.getenv("STATIC_SNAPSHOT_TARGET", "local").lower()
+STATIC_SNAPSHOT_DIR = os.getenv("STATIC_SNAPSHOT_DIR", "static_snapshot")
+STATIC_SNAPSHOT_CONTAINER = os.getenv("STATIC_SNAPSHOT_CONTAINER", "$web")
+STATIC_SNAPSHOT_PREFIX = os.getenv("STATIC_SNAPSHOT_PREFIX", "status/")
+STATIC_SNAPSHOT_POLL_SECONDS = float(os.getenv("STATIC_SNAPSHOT_POLL_SECONDS", "10"))
+STATIC_SNAPSHOT_KEEP = int(os.getenv("STATIC_SNAPSHOT_KEEP", "5"))
+
+MANIFEST_NAME = "checkpoints.manifest.json"
+FILE_PREFIX = "checkpoints."
+IMMUTABLE = "public, max-age=31536000, immutable"
+NO_CACHE = "no-cache"
+
+
+# ---------------- Content ----------------
+def _iso(value: Any) -> Optional[str]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec="milliseconds") + "Z"
+
+
+def build_results(location_collection, data_collection) -> List[Dict[str, Any]]:
+    """
+    One row per checkpoint and direction with its latest report (one row without status when a
+    checkpoint has no reports), in the /api/checkpoints/query result shape
+    """
+    locations = [
+        loc
+        for loc in location_collection.find(
+            {"lat": {"$exists": True}, "lng": {"$exists": True}},
+            {"_id": 0, "checkpoint": 1, "city": 1, "lat": 1, "lng": 1},
+        )
+        if isinstance(loc.get("lat"), (int, float)) and isinstance(loc.get("lng"), (int, float))
+    ]
+    names = sorted({loc["checkpoint"] for loc in locations if loc.get("checkpoint")})
+    pipeline = [
+        {"$match": {"checkpoint_name": {"$in": names}}},
+        {"$sort": {"message_date": -1}},
+        {
+            "$group": {
+                "_id": {"checkpoint": "$checkpoint_name", "city": "$city_name", "direction": "$direction"},
+                "status": {"$first": "$status"},
+                "message_date": {"$first": "$message_date"},
+            }
+        },
+    ]
+    by_checkpoint: Dict[tuple, List[Dict[str, Any]]] = {}
+    for doc in data_collection.aggregate(pipeline) if names else []:
+        key = (doc["_id"]["checkpoint"], doc["_id"]["city"])
+        by_checkpoint.setdefault(key, []).append(doc)
+
+    results = []
+    for loc in sorted(locations, key=lambda item: (str(item.get("city")), str(item.get("checkpoint")))):
+        checkpoint, city = loc.get("checkpoint"), loc.get("city")
+        base = {"checkpoint_name": checkpoint, "city_name": city, "lat": loc["lat"], "lng": loc["lng"]}
+        reports = sorted(by_checkpoint.get((checkpoint, city), []), key=lambda d: str(d["_id"]["direction"]))
+        if not reports:
+            results.append({"_id": f"{checkpoint}|{city}|", **base})
+        for doc in reports:
+            direction = doc["_id"]["direction"]
+            row = {"_id": f"{checkpoint}|{city}|{direction or ''}", **base, "status": doc.get("status")}
+            row["direction"] = direction
+            # Extended-JSON style date, as read by the map (message_date.$date)
+            row["message_date"] = {"$date": _iso(doc.get("message_date"))}
+            results.append(row)
+    return results
+
+
+def encode_snapshot(results: List[Dict[str, Any]]) -> bytes:
+    """Deterministic JSON bytes, so unchanged data hashes to the same version"""
+    return json.dumps(
+        {"results": results, "count": len(results)}, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+    ).encode("utf-8")
+
+
+# ---------------- Targets ----------------
+class LocalTarget:
+    """
+    Files in a directory; each write is atomic (temporary file + os.replace)
+    """
+
+    def __init__(self, directory: str = STATIC_SNAPSHOT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(
+        self, name: str, data: bytes, content_type: str, cache_control: str, encoding: Optional[str] = None
+    ) -> None:
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, name: str) -> None:
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+
+class BlobTarget:
+    """
+    Azure Blob Storage container (for example the $web container of a static website behind a CDN)
+    """
+
+    def __init__(
+        self, account_url: str, container: str = STATIC_SNAPSHOT_CONTAINER, prefix: str = STATIC_SNAPSHOT_PREFIX
+    ):
+        try:
+            from azure.identity import ClientSecretCredential
+            from azure.storage.blob import BlobServiceClient, ContentSettings
+        except ImportError as e:
+            raise RuntimeError("STATIC_SNAPSHOT_TARGET=blob needs the azure-storage-blob package") from e
+        credential = ClientSecretCredential(
+            tenant_id=os.getenv("TENANT_ID"), client_id=os.getenv("CLIENT_ID"), client_secret=os.getenv("AppSecret")
+        )
+        self._settings = ContentSettings
+        self.container = BlobServiceClient(account_url, credential=credential).get_container_client(container)
+        self.prefix = prefix
+
+    def write(
+        self, name: str, data: bytes, content_type: str, cache_control: str, encoding: Optional[str] = None
+    ) -> None:
+        settings = self._settings(content_type=content_type, cache_control=cache_control, content_encoding=encoding)
+        self.container.upload_blob(self.prefix + name, data, overwrite=True, content_settings=settings)
+
+    def read(self, name: str) -> Optional[bytes]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self.container.download_blob(self.prefix + name).readall()
+        except ResourceNotFoundError:
+            return None
+
+    def delete(self, name: str) -> None:
+        self.container.delete_blob(self.prefix + name)
+
+
+def create_target():
+    """Target from STATIC_SNAPSHOT_TARGET ("local" or "blob")"""
+    if STATIC_SNAPSHOT_TARGET == "blob":
+        account_url = os.getenv("STATIC_SNAPSHOT_ACCOUNT_URL")
+        if not account_url:
+            raise ValueError("❌ STATIC_SNAPSHOT_ACCOUNT_URL is missing in .env file")
+        return BlobTarget(account_url)
+    return LocalTarget()
+
+
+# ---------------- Publisher ----------------
+class StaticSnapshotPublisher:
+    """
+    Publishes a new content-hashed version whenever the checkpoint statuses change
+    """
+
+    def __init__(self, db, target, keep: int = STATIC_SNAPSHOT_KEEP):
+        self.data_collection = db[os.getenv("MONGO_COLLECTION_DATA")]
+        self.location_collection = db[os.getenv("MONGO_COLLECTION_LOCATIONS")]
+        self.target = target
+        self.keep = keep
+        self._newest_report: Any = None
+        self._history: List[str] = []
+
+    def current_manifest(self) -> Optional[Dict[str, Any]]:
+        data = self.target.read(MANIFEST_NAME)
+        return json.loads(data) if data else None
+
+    def publish(self) -> Optional[Dict[str, Any]]:
+        """
+        Build the snapshot and publish it if its content changed
+
+        Returns:
+            Optional[Dict]: The new manifest, None when the published version is already current
+        """
+        results = build_results(self.location_collection, self.data_collection)
+        body = encode_snapshot(results)
+        digest = hashlib.sha256(body).hexdigest()
+        current = self.current_manifest()
+        if current and current.get("sha256") == digest:
+            return None
+
+        name = f"{FILE_PREFIX}{digest[:16]}.json"
+        # mtime=0 keeps the gzip bytes identical for identical content
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        self.target.write(name, body, "application/json; charset=utf-8", IMMUTABLE)
+        self.target.write(name + ".gz", compressed, "application/json; charset=utf-8", IMMUTABLE, encoding="gzip")
+        manifest = {
+            "current": name,
+            "gzip": name + ".gz",
+            "sha256": digest,
+            "bytes": len(body),
+            "gzip_bytes": len(compressed),
+            "count": len(results),
+            "generated_at": _iso(datetime.now(timezone.utc)),
+        }
+        manifest_bytes = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+        self.target.write(MANIFEST_NAME, manifest_bytes, "application/json; charset=utf-8", NO_CACHE)
+        self._prune(name)
+        log.info(
+            f"🗂️ Published status snapshot {name} ({len(body)} bytes, {len(compressed)} gzip)",
+            extra={
+                "event": "static_snapshot.published",
+                "file": name,
+                "bytes": len(body),
+                "gzip_bytes": len(compressed),
+            },
+        )
+        return manifest
+
+    def _prune(self, name: str) -> None:
+        """Delete the versions this publisher wrote before the last `keep` (older runs' files are left alone)"""
+        if name in self._history:
+            self._history.remove(name)
+        self._history.append(name)
+        while len(self._history) > self.keep:
+            old = self._history.pop(0)
+            for file_name in (old, old + ".gz"):
+                self.target.delete(file_name)
+
+    def publish_if_changed(self) -> Optional[Dict[str, Any]]:
+        """Publish when a report newer than the last publish exists"""
+        doc = self.data_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        newest = doc["_id"] if doc else None
+        if self._newest_report is not None and newest == self._newest_report:
+            return None
+        manifest = self.publish()
+        self._newest_report = newest
+        return manifest
+
+    def run(self, poll_seconds: float = STATIC_SNAPSHOT_POLL_SECONDS) -> None:
+        """Publish until interrupted"""
+        while True:
+            try:
+                self.publish_if_changed()
+            except (PyMongoError, OSError) as e:
+                log.warning(f"⚠️ Status snapshot publish failed: {e}", extra={"event": "static_snapshot.error"})
+            time.sleep(poll_seconds)
+
+
+def main() -> None:
+    from json_logging import setup_logging
+    from keyvault_client import get_secret
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Publish the static checkpoint status snapshot")
+    parser.add_argument("--once", action="store_true", help="publish one version and exit")
+    args = parser.parse_args()
+
+    setup_logging()
+    client = MongoClient(get_secret(os.getenv("MONGO_CONNECTION_STRING_KEY")))
+    publisher = StaticSnapshotPublisher(client.get_default_database(os.getenv("MONGO_DB_NAME")), create_target())
+    try:
+        if args.once:
+            publisher.publish()
+        else:
+            publisher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+End-to-end latency benchmark for /api/ask-ai.
+
+Starts the Flask app against mongomock (or a local mongod via --mongo-uri) seeded with
+synthetic checkpoints and reports, and against a local fake Azure OpenAI endpoint.
+Replays a corpus of Arabic checkpoint and general queries at the chosen concurrency and
+reports p50/p95/p99 latency, throughput, MongoDB calls and OpenAI calls per request.
+
+Usage:
+    python ask_ai_bench.py --requests 500 --concurrency 16 --openai-latency-ms 400
+"""
+
+import argparse
+import json
+import os
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from fake_openai import FakeOpenAIServer
+from harness import (
+    MongoCallCounter,
+    latency_summary,
+    load_api,
+    refresh_snapshot,
+    run_concurrently,
+    seed_synthetic_data,
+    start_server,
+)
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ask_ai_queries.json")
+
+
+def _post_json(url: str, payload: dict) -> int:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark /api/ask-ai with local Mongo and OpenAI stand-ins")
+    parser.add_argument("--requests", type=int, default=200, help="total number of requests to replay")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSON list of {kind, prompt}")
+    parser.add_argument("--mongo-uri", default=None, help="local mongod URI with database name (default: mongomock)")
+    parser.add_argument("--reports-per-checkpoint", type=int, default=50)
+    parser.add_argument("--openai-latency-ms", type=float, default=400.0)
+    parser.add_argument("--openai-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--openai-tokens", type=int, default=40)
+    parser.add_argument("--openai-per-token-ms", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the general response cache")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    fake_openai = FakeOpenAIServer(
+        latency_ms=args.openai_latency_ms,
+        jitter_ms=args.openai_jitter_ms,
+        output_tokens=args.openai_tokens,
+        per_token_ms=args.openai_per_token_ms,
+    ).start()
+    counter = MongoCallCounter()
+    api = load_api(
+        openai_endpoint=fake_openai.endpoint,
+        mongo_uri=args.mongo_uri,
+        counter=counter,
+        extra_env={"AI_CACHE_ENABLED": "false"} if args.no_cache else None,
+    )
+    seed_synthetic_data(api.mongo.db, reports_per_checkpoint=args.reports_per_checkpoint)
+    refresh_snapshot(api)
+    server, base_url = start_server(api.app)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    plan = [corpus[i % len(corpus)] for i in range(args.requests)]
+    url = f"{base_url}/api/ask-ai"
+    tasks = [lambda q=q: _post_json(url, {"prompt": q["prompt"]}) for q in plan]
+
+    # Warm up once so one-off work (name lists, OpenAI client) is not measured
+    _post_json(url, {"prompt": corpus[0]["prompt"]})
+    counter.reset()
+    fake_openai.calls = 0
+
+    results, elapsed = run_concurrently(tasks, args.concurrency)
+    server.shutdown()
+    fake_openai.stop()
+
+    by_kind = defaultdict(list)
+    errors = 0
+    for (latency_ms, status), query in zip(results, plan):
+        by_kind[query["kind"]].append(latency_ms)
+        if status >= 400:
+            errors += 1
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "overall": latency_summary([r[0] for r in results], elapsed),
+        "by_kind": {kind: latency_summary(lat, elapsed) for kind, lat in by_kind.items()},
+        "errors": errors,
+        "mongo_calls_per_request": round(counter.total / len(results), 2) if results else 0.0,
+        "mongo_calls_by_command": dict(counter.by_command),
+        "openai_calls_per_request": round(fake_openai.calls / len(results), 2) if results else 0.0,
+    }
+    if api.response_cache:
+        report["response_cache"] = api.response_cache.stats()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
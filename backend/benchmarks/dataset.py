@@ -0,0 +1,165 @@
+"""
+Synthetic checkpoint/report dataset generator.
+
+Creates N checkpoints clustered around the real checkpoints across the West Bank and M reports
+with a realistic mix: a few busy checkpoints get most reports (Zipf-like), reports follow the
+daily commute peaks, and statuses/directions follow the proportions seen in the channels.
+
+Load into a local mongod:
+    python dataset.py --mongo-uri mongodb://localhost:27017/tariqi_bench --checkpoints 300 --reports 200000
+
+or from Python (mongomock) with generate_checkpoints / generate_reports / load_dataset.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from harness import CHECKPOINTS
+
+# Share of reports per status and direction
+STATUS_WEIGHTS = {"سالك": 0.45, "أزمة": 0.2, "إغلاق": 0.12, "حاجز/تفتيش": 0.1, "فتح": 0.1, "حادث": 0.03}
+DIRECTION_WEIGHTS = {"دخول": 0.35, "خروج": 0.35, "الاتجاهين": 0.3}
+
+# Relative report volume per local hour: morning and afternoon commute peaks, quiet nights
+HOUR_WEIGHTS = [1, 1, 1, 1, 2, 5, 9, 10, 8, 5, 4, 4, 4, 5, 7, 9, 8, 6, 4, 3, 2, 2, 1, 1]
+LOCAL_UTC_OFFSET_HOURS = 3
+
+CHANNELS = [
+    "https://t.me/a7walstreet",
+    "https://t.me/road_jehad",
+    "https://t.me/ahwalaltreq",
+    "https://t.me/Palestine_Streets_Radar",
+]
+
+# Spread of synthetic checkpoints around a real one (~0.05 degrees is about 5 km)
+CLUSTER_SPREAD_DEG = 0.05
+
+
+def generate_checkpoints(n: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    The known checkpoints first, then synthetic ones scattered around them
+
+    Returns:
+        List[Dict]: Location documents {checkpoint, city, lat, lng}
+    """
+    rng = random.Random(seed)
+    locations = [{"checkpoint": cp, "city": city, "lat": lat, "lng": lng} for cp, city, lat, lng in CHECKPOINTS]
+    i = 1
+    while len(locations) < n:
+        _, city, lat, lng = rng.choice(CHECKPOINTS)
+        locations.append(
+            {
+                "checkpoint": f"حاجز {i}",
+                "city": city,
+                "lat": round(rng.gauss(lat, CLUSTER_SPREAD_DEG), 5),
+                "lng": round(rng.gauss(lng, CLUSTER_SPREAD_DEG), 5),
+            }
+        )
+        i += 1
+    return locations[:n]
+
+
+def _report_date(rng: random.Random, now: datetime, days: float) -> datetime:
+    """Uniform time in the window, kept with a probability that follows the local hour's volume"""
+    peak = max(HOUR_WEIGHTS)
+    while True:
+        date = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        local_hour = (date.hour + LOCAL_UTC_OFFSET_HOURS) % 24
+        if rng.random() * peak < HOUR_WEIGHTS[local_hour]:
+            return date
+
+
+def generate_reports(
+    locations: List[Dict[str, Any]], m: int, days: float = 7, seed: int = 42, now: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Reports over the last `days`, newest last
+
+    Args:
+        locations (List[Dict]): Output of generate_checkpoints
+        m (int): Number of reports
+        days (float): Time span covered by the reports
+        seed (int): Random seed
+
+    Returns:
+        List[Dict]: Report documents shaped like the consumer's
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    # Zipf-like popularity in a shuffled order so the busy checkpoints are not always the first ones
+    popularity = [1 / (rank + 1) ** 1.1 for rank in range(len(locations))]
+    rng.shuffle(popularity)
+    statuses, status_w = zip(*STATUS_WEIGHTS.items())
+    directions, direction_w = zip(*DIRECTION_WEIGHTS.items())
+
+    picked = rng.choices(locations, weights=popularity, k=m)
+    message_ids = {ch: 0 for ch in CHANNELS}
+    reports = []
+    for loc in picked:
+        date = _report_date(rng, now, days)
+        status = rng.choices(statuses, weights=status_w)[0]
+        direction = rng.choices(directions, weights=direction_w)[0]
+        channel = rng.choice(CHANNELS)
+        message_ids[channel] += 1
+        reports.append(
+            {
+                "message_id": message_ids[channel],
+                "source_channel": channel,
+                "original_message": f"{loc['checkpoint']} {status} {direction}",
+                "checkpoint_name": loc["checkpoint"],
+                "city_name": loc["city"],
+                "status": status,
+                "direction": direction,
+                "message_date": date,
+                "report_count": 1,
+            }
+        )
+    reports.sort(key=lambda r: r["message_date"])
+    return reports
+
+
+def load_dataset(
+    db,
+    locations: List[Dict[str, Any]],
+    reports: List[Dict[str, Any]],
+    locations_collection: str = "CheckpointLocation",
+    data_collection: str = "data",
+    batch_size: int = 5000,
+) -> None:
+    """Replace the locations and data collections with the generated dataset"""
+    db[locations_collection].delete_many({})
+    db[data_collection].delete_many({})
+    db[locations_collection].insert_many([dict(loc) for loc in locations])
+    for start in range(0, len(reports), batch_size):
+        end = start + batch_size
+        db[data_collection].insert_many([dict(r) for r in reports[start:end]])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate and load a synthetic checkpoint/report dataset")
+    parser.add_argument("--mongo-uri", required=True, help="local mongod URI with database name")
+    parser.add_argument("--checkpoints", type=int, default=300)
+    parser.add_argument("--reports", type=int, default=100000)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    started = time.perf_counter()
+    locations = generate_checkpoints(args.checkpoints, args.seed)
+    reports = generate_reports(locations, args.reports, args.days, args.seed)
+    client = MongoClient(args.mongo_uri)
+    load_dataset(client.get_default_database(), locations, reports)
+    client.close()
+    print(
+        f"Loaded {len(locations)} checkpoints and {len(reports)} reports over {args.days} days "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
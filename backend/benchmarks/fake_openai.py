@@ -0,0 +1,104 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint.
+
+Answers every POST .../chat/completions with a synthetic Arabic completion after a
+configurable latency, so /api/ask-ai can be benchmarked without calling Azure.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_WORDS = ["حاجز", "قلنديا", "سالك", "الاتجاهين", "منذ", "دقائق", "مرحبا", "كيف", "أستطيع", "مساعدتك", "الطريق"]
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server that mimics Azure OpenAI chat completions"""
+
+    def __init__(
+        self, latency_ms: float = 400.0, jitter_ms: float = 100.0, output_tokens: int = 40, per_token_ms: float = 0.0
+    ) -> None:
+        """
+        Args:
+            latency_ms (float): Base response latency
+            jitter_ms (float): Uniform random jitter added to the base latency
+            output_tokens (int): Number of words returned in the completion
+            per_token_ms (float): Extra latency per generated token
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.output_tokens = output_tokens
+        self.per_token_ms = per_token_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):  # keep benchmark output clean
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.calls += 1
+
+                delay = fake.latency_ms + random.uniform(0, fake.jitter_ms) + fake.per_token_ms * fake.output_tokens
+                time.sleep(delay / 1000.0)
+
+                content = " ".join(random.choice(_WORDS) for _ in range(fake.output_tokens))
+                prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+                body = json.dumps(
+                    {
+                        "id": f"chatcmpl-bench-{fake.calls}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "gpt-35-turbo"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "finish_reason": "stop",
+                                "message": {"role": "assistant", "content": content},
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": fake.output_tokens,
+                            "total_tokens": prompt_tokens + fake.output_tokens,
+                        },
+                    },
+                    ensure_ascii=False,
+                ).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.address
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,282 @@
+"""
+Shared helpers for benchmarking the Flask API locally.
+
+Loads backend/api/api.py with Key Vault replaced by local secrets, MongoDB replaced by
+mongomock (or pointed at a local mongod) and Azure OpenAI pointed at FakeOpenAIServer.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "api")
+MOCK_MONGO_URI = "mongodb://localhost:27017/tariqi_bench"
+
+# (checkpoint, city, lat, lng) - approximate positions of well-known checkpoints
+CHECKPOINTS: List[Tuple[str, str, float, float]] = [
+    ("قلنديا", "القدس", 31.8636, 35.2114),
+    ("الرام", "القدس", 31.8497, 35.2286),
+    ("حزما", "القدس", 31.8336, 35.2647),
+    ("العيزرية", "القدس", 31.7708, 35.2575),
+    ("عين سينا", "رام الله", 31.9981, 35.2306),
+    ("عطارة", "رام الله", 32.0000, 35.1950),
+    ("بيت ايل", "رام الله", 31.9403, 35.2200),
+    ("الجلزون", "رام الله", 31.9417, 35.2103),
+    ("عيون الحرمية", "رام الله", 32.0369, 35.2536),
+    ("بوابة النبي صالح", "رام الله", 32.0097, 35.1236),
+    ("زعترة", "نابلس", 32.1189, 35.2753),
+    ("دير شرف", "نابلس", 32.2594, 35.1775),
+    ("عورتا", "نابلس", 32.1750, 35.2939),
+    ("بيت فوريك", "نابلس", 32.1728, 35.3369),
+    ("الباذان", "نابلس", 32.2653, 35.3264),
+    ("الكونتينر", "بيت لحم", 31.7369, 35.2539),
+    ("النشاش", "بيت لحم", 31.6658, 35.1614),
+    ("الخضر", "بيت لحم", 31.6908, 35.1658),
+    ("جسر حلحول", "الخليل", 31.5817, 35.1053),
+    ("الفحص", "الخليل", 31.5089, 35.1014),
+    ("العروب", "الخليل", 31.6250, 35.1436),
+    ("الفوار", "الخليل", 31.4881, 35.0739),
+    ("ديرستيا", "سلفيت", 32.1297, 35.1206),
+    ("كفر الديك", "سلفيت", 32.0778, 35.0750),
+    ("جسر عزون", "قلقيلية", 32.1761, 35.0569),
+    ("عنبتا", "طولكرم", 32.3067, 35.1156),
+    ("جبارة", "طولكرم", 32.2789, 35.0272),
+    ("الجلمة", "جنين", 32.4939, 35.3161),
+    ("تياسير", "اريحا(طوباس)", 32.3394, 35.4269),
+    ("الحمرا", "اريحا(طوباس)", 32.2350, 35.4631),
+]
+
+STATUSES = ["سالك", "أزمة", "إغلاق", "حاجز/تفتيش", "حادث", "فتح"]
+DIRECTIONS = ["دخول", "خروج", "الاتجاهين"]
+
+
+class MongoCallCounter(monitoring.CommandListener):
+    """
+    Counts MongoDB round trips. Real servers are observed through PyMongo command
+    monitoring; mongomock collections are wrapped directly.
+    """
+
+    _MOCK_METHODS = [
+        "aggregate",
+        "bulk_write",
+        "count_documents",
+        "delete_many",
+        "delete_one",
+        "distinct",
+        "find",
+        "find_one",
+        "find_one_and_update",
+        "insert_many",
+        "insert_one",
+        "update_many",
+        "update_one",
+    ]
+
+    def __init__(self) -> None:
+        self.by_command: Counter = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.by_command.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.by_command.clear()
+
+    def _count(self, command: str) -> None:
+        with self._lock:
+            self.by_command[command] += 1
+
+    # PyMongo command monitoring
+    def started(self, event) -> None:
+        if event.command_name not in ("endSessions", "hello", "isMaster", "ping"):
+            self._count(event.command_name)
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+    def install_mongomock(self) -> None:
+        """Wrap mongomock Collection methods (nested calls such as find_one -> find count once)"""
+        import mongomock.collection
+
+        for name in self._MOCK_METHODS:
+            original = getattr(mongomock.collection.Collection, name)
+            setattr(mongomock.collection.Collection, name, self._wrap(name, original))
+
+    def _wrap(self, name: str, original: Callable) -> Callable:
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            depth = getattr(counter._local, "depth", 0)
+            if depth == 0:
+                counter._count(name)
+            counter._local.depth = depth + 1
+            try:
+                return original(*args, **kwargs)
+            finally:
+                counter._local.depth = depth
+
+        return wrapper
+
+
+def load_api(
+    openai_endpoint: str = "http://127.0.0.1:9/",
+    mongo_uri: Optional[str] = None,
+    counter: Optional[MongoCallCounter] = None,
+    extra_env: Optional[Dict[str, str]] = None,
+):
+    """
+    Import backend/api/api.py against local stand-ins
+
+    Args:
+        openai_endpoint (str): Base URL of the (fake) Azure OpenAI endpoint
+        mongo_uri (Optional[str]): Real MongoDB URI including the database name; mongomock when None
+        counter (Optional[MongoCallCounter]): Installed before the Mongo client is created
+        extra_env (Optional[Dict[str, str]]): Additional environment overrides
+
+    Returns:
+        module: The imported api module (api.app is the Flask app)
+    """
+    os.environ.update(
+        {
+            "MONGO_COLLECTION_DATA": "data",
+            "MONGO_COLLECTION_LOCATIONS": "CheckpointLocation",
+            "MONGO_CONNECTION_STRING_KEY": "mongodbConnectionString",
+            "OPEN_AI_SECRET_KEY": "OpenAI",
+            "AZURE_OPENAI_ENDPOINT": openai_endpoint,
+        }
+    )
+    os.environ.update(extra_env or {})
+    if API_DIR not in sys.path:
+        sys.path.insert(0, API_DIR)
+
+    import keyvault_client
+
+    secrets = {"mongodbConnectionString": mongo_uri or MOCK_MONGO_URI, "OpenAI": "local-benchmark-key"}
+    keyvault_client.get_secret = secrets.__getitem__
+
+    if mongo_uri is None:
+        import flask_pymongo
+        import mongomock
+
+        flask_pymongo.MongoClient = mongomock.MongoClient
+        if counter:
+            counter.install_mongomock()
+    elif counter:
+        monitoring.register(counter)
+
+    import api
+
+    return api
+
+
+def refresh_snapshot(api) -> None:
+    """
+    Publish the shared checkpoint snapshot now
+
+    The refresher builds its first version when the API is imported, before any data is loaded, and
+    would keep serving that empty version as fresh until its next poll. Call this after loading data.
+    """
+    if api.checkpoint_snapshot:
+        api.checkpoint_snapshot.refresh()
+
+
+def seed_synthetic_data(db, reports_per_checkpoint: int = 20, hours: int = 6, seed: int = 42) -> int:
+    """
+    Fill the locations and data collections with synthetic checkpoints and reports
+
+    Returns:
+        int: Number of reports inserted
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    db["CheckpointLocation"].delete_many({})
+    db["data"].delete_many({})
+    db["CheckpointLocation"].insert_many(
+        [{"checkpoint": cp, "city": city, "lat": lat, "lng": lng} for cp, city, lat, lng in CHECKPOINTS]
+    )
+
+    reports = []
+    message_id = 1
+    for cp, city, _, _ in CHECKPOINTS:
+        for _ in range(reports_per_checkpoint):
+            status = rng.choice(STATUSES)
+            direction = rng.choice(DIRECTIONS)
+            reports.append(
+                {
+                    "message_id": message_id,
+                    "source_channel": "https://t.me/benchmark",
+                    "original_message": f"{cp} {status} {direction}",
+                    "checkpoint_name": cp,
+                    "city_name": city,
+                    "status": status,
+                    "direction": direction,
+                    "message_date": now - timedelta(seconds=rng.uniform(0, hours * 3600)),
+                }
+            )
+            message_id += 1
+    if reports:
+        db["data"].insert_many(reports)
+    return len(reports)
+
+
+def start_server(app) -> Tuple[Any, str]:
+    """Serve the Flask app from a threaded werkzeug server on a free local port"""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def latency_summary(latencies_ms: List[float], elapsed_s: float) -> Dict[str, float]:
+    return {
+        "requests": len(latencies_ms),
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "max_ms": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 2) if elapsed_s else 0.0,
+    }
+
+
+def run_concurrently(tasks: List[Callable[[], Any]], concurrency: int) -> Tuple[List[Tuple[float, Any]], float]:
+    """
+    Run callables on a thread pool and time each one
+
+    Returns:
+        Tuple[List[Tuple[float, Any]], float]: ([(latency_ms, result), ...] in task order, elapsed seconds)
+    """
+
+    def timed(task):
+        started = time.perf_counter()
+        result = task()
+        return (time.perf_counter() - started) * 1000.0, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, tasks))
+    return results, time.perf_counter() - started
@@ -0,0 +1,253 @@
+"""
+Open-loop load test of the endpoints the frontend calls, against a synthetic dataset.
+
+Generates checkpoints and reports with dataset.py, loads them into mongomock (or a local mongod via
+--mongo-uri) and replays the frontend mix at a fixed request rate:
+
+    map      GET /api/checkpoints/tiles/{z}/{x}/{y}                       (Map.js, one visible tile)
+    near     GET /api/near_location?latitude=..&longitude=..            (Home.js)
+    top100   GET /api/checkpoints/query?top=100                         (Home.js)
+    closest  GET /api/closest-checkpoint?lat=..&lng=..                  (FeedbackNotification.js)
+    feedback POST /api/feedback                                         (signed with a local test key)
+
+Requests are sent on schedule whether or not earlier ones have finished, and latency is measured from
+the scheduled send time, so a server that falls behind shows up as growing latency instead of a lower rate.
+
+Usage:
+    python load_test.py --rps 20 --duration 30
+    python load_test.py --mongo-uri mongodb://localhost:27017/tariqi_bench --checkpoints 300 --reports 200000 \\
+        --rps 50 --duration 60 --mix map=0.2,near=0.3,top100=0.3,closest=0.15,feedback=0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from dataset import DIRECTION_WEIGHTS, STATUS_WEIGHTS, generate_checkpoints, generate_reports, load_dataset
+from harness import latency_summary, load_api, refresh_snapshot, start_server
+
+# Map.js zoom levels: the default view (8) down to single checkpoints
+MAP_ZOOMS = (8, 10, 12, 14)
+DEFAULT_MIX = {"map": 0.3, "near": 0.25, "top100": 0.25, "closest": 0.15, "feedback": 0.05}
+
+BENCH_AUDIENCE = "tariqi-load-test"
+BENCH_KID = "load-test"
+
+# Spread of simulated user positions around a checkpoint (~0.02 degrees is about 2 km)
+USER_SPREAD_DEG = 0.02
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        route = route.strip()
+        if route not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown route '{route}' (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[route] = float(weight)
+    return mix
+
+
+def _request(url: str, payload: Optional[dict] = None, headers: Optional[Dict[str, str]] = None) -> int:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(
+        url,
+        data=body,
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST" if body is not None else "GET",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        # Refused or timed out: counted as an error, like a client would see it
+        return 0
+
+
+def install_test_auth() -> str:
+    """
+    Make /api/feedback accept tokens signed with a locally generated key
+
+    Returns:
+        str: Bearer token for the feedback requests
+    """
+    import api_auth
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_key = private_key.public_key()
+    api_auth.AUDIENCE = BENCH_AUDIENCE
+    api_auth.get_signing_key = lambda kid: public_key if kid == BENCH_KID else None
+    now = datetime.now(timezone.utc)
+    return jwt.encode(
+        {"sub": "load-test", "aud": BENCH_AUDIENCE, "iat": now, "exp": now + timedelta(days=1)},
+        private_key,
+        algorithm="RS256",
+        headers={"kid": BENCH_KID},
+    )
+
+
+def build_routes(
+    base_url: str, locations: List[Dict[str, Any]], token: str, rng: random.Random
+) -> Dict[str, Callable[[], int]]:
+    """One request factory per route; user positions are scattered around random checkpoints"""
+    from map_tiles import tile_position
+
+    statuses, directions = list(STATUS_WEIGHTS), list(DIRECTION_WEIGHTS)
+    lock = threading.Lock()
+
+    def position() -> Tuple[float, float]:
+        with lock:
+            loc = rng.choice(locations)
+            return (
+                round(rng.gauss(loc["lat"], USER_SPREAD_DEG), 6),
+                round(rng.gauss(loc["lng"], USER_SPREAD_DEG), 6),
+            )
+
+    def feedback() -> int:
+        lat, lng = position()
+        with lock:
+            status, direction = rng.choice(statuses), rng.choice(directions)
+        payload = {
+            "message": f"{status} {direction}",
+            "latitude": lat,
+            "longitude": lng,
+            "status": status,
+            "direction": direction,
+        }
+        return _request(f"{base_url}/api/feedback", payload, {"Authorization": f"Bearer {token}"})
+
+    def map_tile() -> int:
+        lat, lng = position()
+        with lock:
+            z = rng.choice(MAP_ZOOMS)
+        x, y = tile_position(lat, lng, z)
+        return _request(f"{base_url}/api/checkpoints/tiles/{z}/{int(x)}/{int(y)}")
+
+    def near() -> int:
+        lat, lng = position()
+        return _request(f"{base_url}/api/near_location?latitude={lat}&longitude={lng}")
+
+    def closest() -> int:
+        lat, lng = position()
+        return _request(f"{base_url}/api/closest-checkpoint?lat={lat}&lng={lng}")
+
+    return {
+        "map": map_tile,
+        "near": near,
+        "top100": lambda: _request(f"{base_url}/api/checkpoints/query?top=100"),
+        "closest": closest,
+        "feedback": feedback,
+    }
+
+
+def run_open_loop(
+    routes: Dict[str, Callable[[], int]],
+    mix: Dict[str, float],
+    rps: float,
+    duration_s: float,
+    max_workers: int,
+    seed: int = 42,
+) -> Tuple[Dict[str, List[Tuple[float, int]]], float]:
+    """
+    Send requests at `rps` (Poisson arrivals) for `duration_s`
+
+    Returns:
+        Tuple[Dict[str, List[Tuple[float, int]]], float]: ({route: [(latency_ms, status), ...]}, elapsed seconds)
+    """
+    rng = random.Random(seed)
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    results: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    lock = threading.Lock()
+
+    def send(name: str, scheduled: float) -> None:
+        status = routes[name]()
+        latency_ms = (time.perf_counter() - scheduled) * 1000.0
+        with lock:
+            results[name].append((latency_ms, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        scheduled = started
+        while True:
+            scheduled += rng.expovariate(rps)
+            if scheduled - started > duration_s:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, rng.choices(names, weights=weights)[0], scheduled)
+    return results, time.perf_counter() - started
+
+
+def route_report(samples: List[Tuple[float, int]], elapsed_s: float) -> Dict[str, Any]:
+    errors = sum(1 for _, status in samples if status == 0 or status >= 400)
+    by_status: Dict[str, int] = defaultdict(int)
+    for _, status in samples:
+        by_status[str(status)] += 1
+    return {
+        **latency_summary([latency for latency, _ in samples], elapsed_s),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "status_codes": dict(by_status),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop load test of the frontend endpoint mix")
+    parser.add_argument("--rps", type=float, default=20.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="route=weight,... (map, near, ...)")
+    parser.add_argument("--max-workers", type=int, default=256, help="client threads for requests in flight")
+    parser.add_argument("--mongo-uri", default=None, help="local mongod URI with database name (default: mongomock)")
+    parser.add_argument("--checkpoints", type=int, default=100)
+    parser.add_argument("--reports", type=int, default=5000)
+    parser.add_argument("--days", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    api = load_api(mongo_uri=args.mongo_uri)
+    locations = generate_checkpoints(args.checkpoints, args.seed)
+    load_dataset(api.mongo.db, locations, generate_reports(locations, args.reports, args.days, args.seed))
+    refresh_snapshot(api)
+    token = install_test_auth()
+    server, base_url = start_server(api.app)
+
+    routes = build_routes(base_url, locations, token, random.Random(args.seed))
+    # Warm up each route once so one-off work is not measured
+    for name in args.mix:
+        routes[name]()
+
+    results, elapsed = run_open_loop(routes, args.mix, args.rps, args.duration, args.max_workers, args.seed)
+    server.shutdown()
+
+    all_samples = [sample for samples in results.values() for sample in samples]
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "achieved_rps": round(len(all_samples) / elapsed, 2) if elapsed else 0.0,
+        "overall": route_report(all_samples, elapsed),
+        "by_route": {name: route_report(results[name], elapsed) for name in args.mix if name in results},
+    }
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks for the pure hot functions of the API and the consumer, with stored baselines.
+
+Covers geo_utils.haversine over checkpoint sets, the Telegram message parser (parse / is_noise,
+which TelegramCheckpointCollector.parse and mongodb._is_noise delegate to) over the recorded corpus,
+AIPromptBuilder.extract_checkpoint_from_query / is_checkpoint_query over the ask-ai corpus, and
+AIPromptBuilder.format_time_ago_arabic.
+
+Usage:
+    python micro_bench.py                         # run and print ns/op
+    python micro_bench.py --save-baseline         # record baselines/micro_bench.json
+    python micro_bench.py --compare               # exit 1 if any benchmark is >20% slower than the baseline
+    python micro_bench.py --compare --threshold 0.1 --filter parser --output report.json
+
+Baselines are machine-specific: record them on the machine you compare on.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import mongomock
+from harness import API_DIR, CHECKPOINTS
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONSUMER_DIR = os.path.join(os.path.dirname(BENCH_DIR), "telegram-consumer")
+
+os.environ.setdefault("MONGO_COLLECTION_DATA", "data")
+os.environ.setdefault("MONGO_COLLECTION_LOCATIONS", "CheckpointLocation")
+sys.path.insert(0, API_DIR)
+sys.path.insert(1, CONSUMER_DIR)
+
+from ai_prompt_builder import AIPromptBuilder  # noqa: E402
+from geo_utils import haversine  # noqa: E402
+from message_parser import MessageParser  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baselines", "micro_bench.json")
+MESSAGES_CORPUS = os.path.join(BENCH_DIR, "data", "telegram_messages_golden.jsonl")
+QUERIES_CORPUS = os.path.join(BENCH_DIR, "data", "ask_ai_queries.json")
+
+# West Bank bounding box for synthetic checkpoints
+LAT_RANGE = (31.35, 32.55)
+LNG_RANGE = (34.88, 35.57)
+
+REFERENCE = "reference_loop"
+
+# name -> (batch function, operations per batch call)
+Benchmark = Tuple[Callable[[], Any], int]
+
+
+def synthetic_points(n: int, seed: int = 7) -> List[Tuple[float, float]]:
+    rng = random.Random(seed)
+    return [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(n)]
+
+
+def geo_benchmarks() -> Dict[str, Benchmark]:
+    known = [(lat, lng) for _, _, lat, lng in CHECKPOINTS]
+    users = synthetic_points(50, seed=1)
+    benches = {}
+    for label, points in (("30_known", known), ("500_synthetic", synthetic_points(500))):
+        # One user position against every checkpoint: the near_location / closest-checkpoint scan
+        def scan(points=points):
+            for ulat, ulng in users:
+                for lat, lng in points:
+                    haversine(ulat, ulng, lat, lng)
+
+        benches[f"haversine_scan_{label}"] = (scan, len(users) * len(points))
+    return benches
+
+
+def parser_benchmarks() -> Dict[str, Benchmark]:
+    with open(MESSAGES_CORPUS, encoding="utf-8") as f:
+        texts = [json.loads(line)["text"] for line in f if line.strip()]
+    # cache_size=0 measures the parser itself rather than the LRU memo
+    parser = MessageParser(cache_size=0)
+
+    def parse():
+        for text in texts:
+            parser.parse(text)
+
+    def is_noise():
+        for text in texts:
+            parser.is_noise(text)
+
+    return {"parser_parse": (parse, len(texts)), "parser_is_noise": (is_noise, len(texts))}
+
+
+def prompt_builder_benchmarks() -> Dict[str, Benchmark]:
+    db = mongomock.MongoClient().tariqi_bench
+    db[os.environ["MONGO_COLLECTION_LOCATIONS"]].insert_many(
+        [{"checkpoint": cp, "city": city, "lat": lat, "lng": lng} for cp, city, lat, lng in CHECKPOINTS]
+    )
+    builder = AIPromptBuilder(SimpleNamespace(db=db))
+
+    with open(QUERIES_CORPUS, encoding="utf-8") as f:
+        queries = [q["prompt"] for q in json.load(f)]
+    # Load the known names once so the benchmark does not time a Mongo read
+    builder.extract_checkpoint_from_query(queries[0])
+
+    now = datetime.now(timezone.utc)
+    ages = [timedelta(seconds=s) for s in (5, 70, 150, 600, 1800, 7200, 30000, 90000, 400000, 3000000)]
+    dates: List[Any] = [now - age for age in ages] + [(now - age).isoformat() for age in ages]
+
+    def extract():
+        for q in queries:
+            builder.extract_checkpoint_from_query(q)
+
+    def is_checkpoint():
+        for q in queries:
+            builder.is_checkpoint_query(q)
+
+    def time_ago():
+        for d in dates:
+            builder.format_time_ago_arabic(d)
+
+    return {
+        "extract_checkpoint_from_query": (extract, len(queries)),
+        "is_checkpoint_query": (is_checkpoint, len(queries)),
+        "format_time_ago_arabic": (time_ago, len(dates)),
+    }
+
+
+def reference_benchmark() -> Dict[str, Benchmark]:
+    """Fixed pure-Python workload; comparisons are normalized by it to cancel out CPU speed changes"""
+    values = [(i * 7919) % 1000 / 7.0 for i in range(1000)]
+
+    def loop():
+        total = 0.0
+        for v in values:
+            total += v * v if v > 50 else v
+        return total
+
+    return {REFERENCE: (loop, len(values))}
+
+
+def collect_benchmarks() -> Dict[str, Benchmark]:
+    benches: Dict[str, Benchmark] = reference_benchmark()
+    for group in (geo_benchmarks, parser_benchmarks, prompt_builder_benchmarks):
+        benches.update(group())
+    return benches
+
+
+def calibrate(fn: Callable[[], Any], min_round_ms: float) -> int:
+    """Batch repetitions per round so that a round takes at least min_round_ms (like timeit.autorange)"""
+    loops = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter_ns() - started >= min_round_ms * 1e6:
+            return loops
+        loops *= 2
+
+
+def measure(benches: Dict[str, Benchmark], rounds: int, min_round_ms: float = 50) -> Dict[str, Dict[str, float]]:
+    """
+    Time every benchmark over `rounds` rounds. Rounds are interleaved across benchmarks so that
+    a slow phase of a shared machine hits all of them instead of skewing one.
+    """
+    loops = {name: calibrate(fn, min_round_ms) for name, (fn, _) in benches.items()}
+    samples: Dict[str, List[float]] = {name: [] for name in benches}
+    gc.collect()
+    for _ in range(rounds):
+        for name, (fn, ops) in benches.items():
+            started = time.perf_counter_ns()
+            for _ in range(loops[name]):
+                fn()
+            samples[name].append((time.perf_counter_ns() - started) / (ops * loops[name]))
+
+    results = {}
+    for name, values in samples.items():
+        values.sort()
+        # The fastest round is the least disturbed by other processes, so it is what baselines compare
+        results[name] = {
+            "ns_per_op": round(values[0], 1),
+            "ns_per_op_median": round(values[len(values) // 2], 1),
+            "ops_per_round": benches[name][1] * loops[name],
+            "rounds": rounds,
+        }
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """
+    Print the comparison table and return the names of benchmarks slower than baseline * (1 + threshold).
+    When both runs include the reference loop, times are compared relative to it.
+    """
+    scale = 1.0
+    if REFERENCE in results and REFERENCE in baseline:
+        scale = baseline[REFERENCE]["ns_per_op"] / results[REFERENCE]["ns_per_op"]
+        print(f"\nMachine speed vs baseline: {1 / scale:.2f}x reference time (times below are normalized)")
+
+    regressions = []
+    print(f"\n{'benchmark':<36}{'baseline ns':>14}{'current ns':>14}{'change':>10}")
+    for name, result in results.items():
+        if name == REFERENCE:
+            continue
+        current = result["ns_per_op"] * scale
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<36}{'-':>14}{current:>14.1f}{'new':>10}")
+            continue
+        change = current / base["ns_per_op"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ❌ regression"
+        elif change < -threshold:
+            flag = "  ✅ faster"
+        print(f"{name:<36}{base['ns_per_op']:>14.1f}{current:>14.1f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the pure hot functions")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    benches = {
+        name: bench
+        for name, bench in collect_benchmarks().items()
+        if not args.filter or args.filter in name or name == REFERENCE
+    }
+    results = measure(benches, max(1, args.rounds))
+    for name, result in results.items():
+        print(f"{name:<36}{result['ns_per_op']:>12.1f} ns/op")
+
+    report: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+
+    regressions: Optional[List[str]] = None
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        report["regressions"] = regressions
+
+    if args.save_baseline:
+        # Keep baselines of benchmarks that were filtered out of this run
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                report["results"] = {**json.load(f)["results"], **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Golden-corpus check and throughput benchmark for the Telegram message parser.
+
+data/telegram_messages_golden.jsonl holds synthetic channel messages together with the
+(checkpoint, city, status, direction, cleaned) tuple and the noise flag produced by the
+original keyword-by-keyword parser. The compiled parser must reproduce them exactly.
+
+Usage:
+    python parser_bench.py [--rounds 20] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+CONSUMER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "telegram-consumer")
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "telegram_messages_golden.jsonl")
+
+sys.path.insert(0, CONSUMER_DIR)
+
+from message_parser import MessageParser  # noqa: E402
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_golden(parser: MessageParser, corpus) -> int:
+    mismatches = 0
+    for row in corpus:
+        parsed = list(parser.parse(row["text"]))
+        noise = parser.is_noise(row["text"])
+        if parsed != row["parse"] or noise != row["is_noise"]:
+            mismatches += 1
+            if mismatches <= 5:
+                print(
+                    f"❌ {row['text']!r}: expected {row['parse']} noise={row['is_noise']}, got {parsed} noise={noise}"
+                )
+    return mismatches
+
+
+def messages_per_second(fn, texts, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            fn(text)
+    return rounds * len(texts) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify and benchmark the compiled Telegram message parser")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    texts = [row["text"] for row in corpus]
+
+    uncached = MessageParser(cache_size=0)
+    mismatches = check_golden(uncached, corpus)
+
+    cached = MessageParser()
+    report = {
+        "messages": len(texts),
+        "golden_mismatches": mismatches,
+        "parse_msgs_per_sec": round(messages_per_second(uncached.parse, texts, args.rounds)),
+        "is_noise_msgs_per_sec": round(messages_per_second(uncached.is_noise, texts, args.rounds)),
+        # Forwarded duplicates: every text seen again is served from the LRU memo
+        "parse_cached_msgs_per_sec": round(messages_per_second(cached.parse, texts, args.rounds)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
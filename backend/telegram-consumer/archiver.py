@@ -0,0 +1,157 @@
+# archiver.py
+"""
+Hot/cold compaction for checkpoint reports.
+
+The data collection (hot) only keeps the last HOT_RETENTION_HOURS of reports, which is all the live
+endpoints need; older reports are moved to the archive collection (MONGO_COLLECTION_ARCHIVE) in batches.
+Runs hourly from function_app.py, or by hand:
+
+    python archiver.py compact [--retention-hours 48] [--batch-size 1000] [--dry-run]
+    python archiver.py stats [--runs 5]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+
+from json_logging import setup_logging
+from mongodb import _DUPLICATE_KEY, HOT_RETENTION_HOURS, MongoDB
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+
+log = logging.getLogger("archiver")
+
+_ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+
+def compact(
+    db: MongoDB,
+    retention_hours: int = HOT_RETENTION_HOURS,
+    batch_size: int = _ARCHIVE_BATCH_SIZE,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Move reports older than `retention_hours` from the hot collection to the archive.
+    Each batch is copied before it is deleted, so an interrupted run only leaves copies the next run skips."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+    old = {"message_date": {"$lt": cutoff}}
+    if dry_run:
+        count = db.collection.count_documents(old)
+        log.info(f"Dry run: {count} reports older than {cutoff.isoformat()} would be archived")
+        return {"archived": 0, "already_archived": 0, "eligible": count}
+
+    db.ensure_archive_indexes()
+    summary = {"archived": 0, "already_archived": 0}
+    while True:
+        docs = list(db.collection.find(old).sort("message_date", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+        try:
+            db.archive.insert_many(docs, ordered=False)
+            summary["archived"] += len(docs)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            failed = [err for err in errors if err.get("code") != _DUPLICATE_KEY]
+            if failed:
+                # Keep the batch in the hot collection; the next run retries it
+                raise RuntimeError(f"archive insert failed: {failed[0].get('errmsg')}") from e
+            # Same _id (an interrupted run) or the same message stored twice: it is already archived
+            summary["archived"] += len(docs) - len(errors)
+            summary["already_archived"] += len(errors)
+        db.collection.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        if len(docs) < batch_size:
+            break
+
+    log.info(
+        f"Compaction done: archived={summary['archived']} already_archived={summary['already_archived']} "
+        f"(older than {cutoff.isoformat()})"
+    )
+    return summary
+
+
+def _median_ms(query: Callable[[], Any], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        query()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def tier_stats(db: MongoDB, runs: int = 5) -> Dict[str, Dict[str, Any]]:
+    """Size and query latency of each tier, using the two read shapes of the live endpoints:
+    latest status per checkpoint, and the latest reports of one checkpoint."""
+    out = {}
+    for tier, col in (("hot", db.collection), ("archive", db.archive)):
+        stats: Dict[str, Any] = {"collection": col.name, "documents": col.estimated_document_count()}
+        try:
+            coll_stats = col.database.command({"collStats": col.name})
+            for key in ("size", "storageSize", "totalIndexSize"):
+                stats[key] = coll_stats.get(key)
+        except OperationFailure as e:
+            stats["collStats_error"] = str(e)
+
+        newest = col.find_one(sort=[("message_date", DESCENDING)])
+        oldest = col.find_one(sort=[("message_date", ASCENDING)])
+        stats["newest"] = newest["message_date"].isoformat() if newest else None
+        stats["oldest"] = oldest["message_date"].isoformat() if oldest else None
+
+        latest_per_checkpoint = [
+            {"$sort": {"message_date": -1}},
+            {
+                "$group": {
+                    "_id": {"checkpoint": "$checkpoint_name", "city": "$city_name"},
+                    "latest": {"$first": "$$ROOT"},
+                }
+            },
+        ]
+        stats["latest_per_checkpoint_ms"] = _median_ms(lambda: list(col.aggregate(latest_per_checkpoint)), runs)
+        if newest:
+            one = {"checkpoint_name": newest.get("checkpoint_name"), "city_name": newest.get("city_name")}
+            stats["checkpoint_latest_ms"] = _median_ms(
+                lambda: list(col.find(one).sort("message_date", DESCENDING).limit(10)), runs
+            )
+        out[tier] = stats
+    return out
+
+
+def run_compaction() -> Dict[str, int]:
+    """Entry point for the scheduled job."""
+    db = MongoDB()
+    db.connect()
+    try:
+        return compact(db)
+    finally:
+        db.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hot/cold compaction and tier stats for checkpoint reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_compact = sub.add_parser("compact", help="move reports older than the retention window to the archive")
+    p_compact.add_argument("--retention-hours", type=int, default=HOT_RETENTION_HOURS)
+    p_compact.add_argument("--batch-size", type=int, default=_ARCHIVE_BATCH_SIZE)
+    p_compact.add_argument("--dry-run", action="store_true", help="only count the reports that would move")
+    p_stats = sub.add_parser("stats", help="report sizes and query latency of the hot and archive tiers")
+    p_stats.add_argument("--runs", type=int, default=5, help="timed runs per query (median is reported)")
+    args = parser.parse_args()
+
+    setup_logging()
+    db = MongoDB()
+    db.connect()
+    try:
+        if args.command == "compact":
+            result = compact(db, args.retention_hours, max(1, args.batch_size), args.dry_run)
+        else:
+            result = tier_stats(db, max(1, args.runs))
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# backfill.py
+"""
+Bulk historical backfill from Telegram exports, without calling Telegram.
+
+Reads a Telegram Desktop JSON export (result.json) or a recorded JSONL file as a stream,
+parses messages in a process pool with TelegramCheckpointCollector.parse and writes the
+reports through MongoDB.save_messages (idempotent upserts), checkpointing progress so an
+interrupted run resumes where it stopped. Reports older than HOT_RETENTION_HOURS are upserted
+straight into the archive collection, so a backfill does not flood the hot tier.
+
+    python backfill.py result.json --channel https://t.me/a7walstreet
+    python backfill.py recorded.jsonl --workers 8 --chunk-size 5000
+
+JSONL records: {"message_id", "source_channel", "text" (or "original_message"), "message_date", "has_media"}
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from json_logging import setup_logging
+from mongodb import MongoDB, _to_utc
+from telegram_collector import build_report
+
+log = logging.getLogger("backfill")
+
+_MESSAGES_ARRAY = re.compile(r'"messages"\s*:\s*\[')
+_READ_SIZE = 1 << 20
+
+# (message_id, source_channel, text, message_date, has_media)
+Record = Tuple[Any, str, str, Any, bool]
+
+
+def _flatten_text(text: Any) -> str:
+    """Desktop exports store formatted text as a list of strings and {"type", "text"} entities."""
+    if isinstance(text, str):
+        return text
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in text)
+    return ""
+
+
+def iter_desktop_export(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the objects of the top-level "messages" array one by one, keeping at most ~1 MB buffered."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        while True:
+            match = _MESSAGES_ARRAY.search(buf)
+            if match:
+                start = match.end()
+                buf = buf[start:]
+                break
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                raise ValueError(f"{path}: no top-level 'messages' array found")
+            buf = buf[-64:] + chunk
+
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise json.JSONDecodeError("need more data", buf, pos)
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(_READ_SIZE)
+                if not chunk:
+                    raise ValueError(f"{path}: truncated export")
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield obj
+            if pos > _READ_SIZE:
+                buf, pos = buf[pos:], 0
+
+
+def iter_records(path: str, channel: Optional[str]) -> Iterator[Record]:
+    """Normalize Telegram Desktop exports and recorded JSONL into records."""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                m = json.loads(line)
+                text = m.get("text", m.get("original_message")) or ""
+                yield (
+                    m.get("message_id"),
+                    m.get("source_channel") or channel,
+                    _flatten_text(text),
+                    m.get("message_date"),
+                    bool(m.get("has_media")),
+                )
+        return
+
+    if not channel:
+        raise ValueError("--channel is required for Telegram Desktop exports (use the link from TELEGRAM_CHANNELS)")
+    for m in iter_desktop_export(path):
+        if m.get("type") != "message":
+            continue
+        # date_unixtime is UTC; "date" is the exporting machine's local time
+        unixtime = m.get("date_unixtime")
+        date = datetime.fromtimestamp(int(unixtime), tz=timezone.utc) if unixtime else m.get("date")
+        has_media = bool(m.get("media_type") or m.get("photo") or m.get("file"))
+        yield m.get("id"), channel, _flatten_text(m.get("text")), date, has_media
+
+
+def parse_chunk(records: List[Record]) -> List[Dict[str, Any]]:
+    """Process-pool worker: records -> report documents (messages without a status are dropped)."""
+    reports = []
+    for message_id, channel, text, date, has_media in records:
+        report = build_report(message_id, channel, text, _to_utc(date), has_media)
+        if report is not None:
+            reports.append(report)
+    return reports
+
+
+def iter_chunks(records: Iterator[Record], size: int, skip: int) -> Iterator[List[Record]]:
+    chunk: List[Record] = []
+    for i, record in enumerate(records):
+        if i < skip:
+            continue
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_state(state_file: str, path: str) -> int:
+    if not os.path.exists(state_file):
+        return 0
+    with open(state_file, encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("source") != os.path.abspath(path) or state.get("size") != os.path.getsize(path):
+        log.warning("State file belongs to another or a modified source, starting from the beginning")
+        return 0
+    return int(state.get("processed", 0))
+
+
+def save_state(state_file: str, path: str, processed: int) -> None:
+    tmp = state_file + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(path), "size": os.path.getsize(path), "processed": processed}, f)
+    os.replace(tmp, state_file)
+
+
+def backfill(path: str, channel: Optional[str], workers: int, chunk_size: int, state_file: str, resume: bool) -> None:
+    processed = load_state(state_file, path) if resume else 0
+    if processed:
+        log.info(f"Resuming after {processed} records")
+
+    db = MongoDB()
+    db.connect()
+    totals = {"records": 0, "reports": 0, "inserted": 0, "duplicates": 0, "failed": 0, "filtered": 0}
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # (future, record count) in submission order; bounded so memory stays flat
+            pending: deque = deque()
+
+            def drain_one() -> None:
+                nonlocal processed
+                future, count = pending.popleft()
+                reports = future.result()
+                summary = db.save_messages(reports)
+                processed += count
+                save_state(state_file, path, processed)
+                totals["records"] += count
+                totals["reports"] += len(reports)
+                for key in ("inserted", "duplicates", "failed", "filtered"):
+                    totals[key] += summary[key]
+                elapsed = time.perf_counter() - started
+                log.info(
+                    f"processed={processed} reports={totals['reports']} inserted={totals['inserted']} "
+                    f"duplicates={totals['duplicates']} failed={totals['failed']} "
+                    f"rate={totals['records'] / elapsed:.0f} msg/s"
+                )
+
+            for chunk in iter_chunks(iter_records(path, channel), chunk_size, processed):
+                pending.append((pool.submit(parse_chunk, chunk), len(chunk)))
+                if len(pending) >= workers * 2:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        db.disconnect()
+
+    elapsed = time.perf_counter() - started
+    log.info(
+        f"Backfill done in {elapsed:.1f}s: records={totals['records']} reports={totals['reports']} "
+        f"inserted={totals['inserted']} duplicates={totals['duplicates']} failed={totals['failed']} "
+        f"({totals['records'] / elapsed if elapsed else 0:.0f} msg/s)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill checkpoint reports from Telegram export files")
+    parser.add_argument("path", help="Telegram Desktop result.json or recorded .jsonl")
+    parser.add_argument("--channel", help="source_channel for Desktop exports, e.g. https://t.me/a7walstreet")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="records per worker task / write batch")
+    parser.add_argument("--state-file", help="progress checkpoint (default: <path>.backfill-state.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress")
+    args = parser.parse_args()
+
+    setup_logging()
+    backfill(
+        args.path,
+        args.channel,
+        max(1, args.workers),
+        max(1, args.chunk_size),
+        args.state_file or f"{args.path}.backfill-state.json",
+        resume=not args.restart,
+    )
+
+
+if __name__ == "__main__":
+    main()
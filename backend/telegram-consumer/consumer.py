@@ -1,44 +1,293 @@
 # main.py
+import argparse
 import asyncio
 import logging
 import os
+import signal
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from dedupe import DEDUPE_ENABLED, ReportDeduper
 from dotenv import load_dotenv
+from json_logging import LOG_SAMPLE_RATE, setup_logging
 from keyvault_client import get_secret
-from mongodb import MongoDB
+from mongodb import MongoDB, new_summary
+from run_metrics import RunMetrics
 from telegram_collector import TelegramCheckpointCollector
 
 load_dotenv()
 
-logging.basicConfig(
-    level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
-    format="%(asctime)s | %(levelname)s | %(message)s",
-)
+setup_logging()
 log = logging.getLogger("main")
 
+# Daemon mode: micro-batches are written every _BATCH_SIZE reports or _FLUSH_SECONDS, whichever comes first
+_BATCH_SIZE = int(os.getenv("DAEMON_BATCH_SIZE", "50"))
+_FLUSH_SECONDS = float(os.getenv("DAEMON_FLUSH_SECONDS", "2"))
+_QUEUE_SIZE = int(os.getenv("DAEMON_QUEUE_SIZE", "10000"))
+_WRITE_RETRIES = int(os.getenv("DAEMON_WRITE_RETRIES", "3"))
+# Queued by run_daemon on shutdown: the writer flushes what it holds and returns
+_STOP: Any = object()
 
-async def collect_once():
+# Clients kept between warm Azure Functions invocations (function_app.py keeps one event loop alive)
+_collector: Optional[TelegramCheckpointCollector] = None
+_db: Optional[MongoDB] = None
+# Dedupe state survives warm runs too; it is only rebuilt from Mongo when the process starts
+_deduper: Optional[ReportDeduper] = None
+
+
+def _settings() -> Tuple[int, List[str], int]:
     api_id = int(os.getenv("TELEGRAM_API_ID", "0"))
     channels = [c.strip() for c in os.getenv("TELEGRAM_CHANNELS", "").split(",") if c.strip()]
     per_channel = int(os.getenv("TELEGRAM_MESSAGE_LIMIT", "50"))
     if not api_id or not channels or not per_channel:
         raise ValueError("Missing TELEGRAM_API_ID / TELEGRAM_CHANNELS / TELEGRAM_MESSAGE_LIMIT")
+    return api_id, channels, per_channel
 
-    api_hash = get_secret("appHash")
-    phone = get_secret("PhoneNumber")
 
-    collector = TelegramCheckpointCollector(api_id, api_hash, phone)
-    db = MongoDB()
+async def _catch_up(
+    collector: TelegramCheckpointCollector,
+    db: MongoDB,
+    channels: List[str],
+    per_channel: int,
+    metrics: Optional[RunMetrics] = None,
+):
+    metrics = metrics or RunMetrics()
+    log.info(f"Collecting from {len(channels)} channels, {per_channel} msg/channel")
+    with metrics.stage("watermarks"):
+        watermarks = db.get_watermarks(channels)
+    reports = collector.stream_many(channels, per_channel, watermarks, metrics)
+    collected, saved = await _write_stream(db, reports, metrics)
+    # Only advance after the messages are stored, so a failed save is retried next run
+    if saved["failed"]:
+        # Some writes failed: keep the old watermarks so the next run fetches those messages again
+        log.warning(f"{saved['failed']} reports failed to save, watermarks not advanced")
+    else:
+        with metrics.stage("watermarks"):
+            db.save_watermarks(collector.watermarks)
+    log.info(
+        f"Done. collected={collected} inserted={saved['inserted']} duplicates={saved['duplicates']} "
+        f"failed={saved['failed']} filtered={saved['filtered']} suppressed={saved['suppressed']}"
+    )
+
+
+async def _write_stream(
+    db: MongoDB, reports: AsyncIterator[Dict[str, Any]], metrics: RunMetrics
+) -> Tuple[int, Dict[str, int]]:
+    """Filter reports as they arrive and upsert them every MONGO_BATCH_SIZE documents.
+    Returns the number of reports read and the save summary."""
+    summary = new_summary()
+    batch: List[Dict[str, Any]] = []
+    collected = 0
+    async for report in reports:
+        collected += 1
+        doc = db.to_document(report, metrics)
+        if doc is None:
+            summary["filtered"] += 1
+            continue
+        batch.append(doc)
+        if len(batch) >= db.batch_size:
+            # Written in a thread so the channel fetchers keep filling the stream meanwhile
+            await asyncio.to_thread(db.write_batch, batch, summary, metrics)
+            batch = []
+    if batch:
+        await asyncio.to_thread(db.write_batch, batch, summary, metrics)
+    return collected, summary
+
+
+async def _get_clients(api_id: int) -> Tuple[TelegramCheckpointCollector, MongoDB, bool]:
+    """Reuse the Telegram and Mongo clients of a previous (warm) run when they are still healthy,
+    and create or reconnect only what is missing. The bool is True when both were reused."""
+    global _collector, _db
+    warm = True
+    if _collector is None or not _collector.client.is_connected():
+        if _collector is not None:
+            await _collector.close()
+        _collector = None
+        collector = TelegramCheckpointCollector(api_id, get_secret("appHash"), get_secret("PhoneNumber"))
+        await collector.authenticate()
+        _collector = collector
+        warm = False
+    if _db is None or not _db.is_healthy():
+        if _db is not None:
+            _db.disconnect()
+        _db = None
+        db = MongoDB()
+        db.connect()
+        db.deduper = _get_deduper(db)
+        _db = db
+        warm = False
+    return _collector, _db, warm
+
 
+def _get_deduper(db: MongoDB) -> Optional[ReportDeduper]:
+    global _deduper
+    if not DEDUPE_ENABLED:
+        return None
+    if _deduper is None:
+        deduper = ReportDeduper()
+        try:
+            since = datetime.now(timezone.utc) - deduper.window
+            deduper.warm(db.recent_reports(since))
+        except Exception as e:
+            # Worst case a few duplicates from the last window are stored again
+            log.warning(f"Could not warm dedupe state: {e}")
+        _deduper = deduper
+    return _deduper
+
+
+async def close_clients() -> None:
+    global _collector, _db
+    if _collector is not None:
+        await _collector.close()
+        _collector = None
+    if _db is not None:
+        _db.disconnect()
+        _db = None
+
+
+async def collect_once():
+    api_id, channels, per_channel = _settings()
+
+    metrics = RunMetrics("timer")
+    try:
+        with metrics.stage("setup"):
+            collector, db, warm = await _get_clients(api_id)
+        metrics.info["warm_start"] = warm
+        await _catch_up(collector, db, channels, per_channel, metrics)
+    except Exception as e:
+        metrics.info["error"] = str(e)
+        # Start from fresh connections on the next invocation
+        await close_clients()
+        raise
+    finally:
+        metrics.emit()
+
+
+async def _flush(db: MongoDB, batch: List[Dict[str, Any]]) -> None:
+    # Watermarks follow what was actually written; save_messages is idempotent if a batch is replayed
+    watermarks: Dict[str, int] = {}
+    for report in batch:
+        channel = report["source_channel"]
+        watermarks[channel] = max(watermarks.get(channel, 0), report["message_id"])
+    metrics = RunMetrics("daemon")
+    for report in batch:
+        metrics.count(report["source_channel"], "with_status")
+    saved = await asyncio.to_thread(db.save_messages, batch, metrics)
+    if saved["failed"]:
+        # Retried (upserts make the stored part a no-op) instead of moving the watermarks past the failures
+        raise RuntimeError(f"{saved['failed']} of {len(batch)} reports failed to save")
+    with metrics.stage("watermarks"):
+        await asyncio.to_thread(db.save_watermarks, watermarks)
+    # One line per flush (every few seconds): sampled, the metrics record below has the exact counts
+    log.info(
+        f"Flushed {len(batch)} reports: inserted={saved['inserted']} duplicates={saved['duplicates']} "
+        f"suppressed={saved['suppressed']}",
+        extra={"event": "daemon.flush", "sample_rate": LOG_SAMPLE_RATE},
+    )
+    metrics.emit()
+
+
+async def _write_with_retries(db: MongoDB, batch: List[Dict[str, Any]]) -> bool:
+    """Flush a batch, retrying with backoff. False when every attempt failed."""
+    for attempt in range(_WRITE_RETRIES + 1):
+        try:
+            await _flush(db, batch)
+            return True
+        except Exception as e:
+            if attempt == _WRITE_RETRIES:
+                log.error(f"Flush of {len(batch)} reports failed after {attempt + 1} attempts: {e}")
+                return False
+            await asyncio.sleep(min(2**attempt, 10))
+    return False
+
+
+async def _batch_writer(db: MongoDB, queue: "asyncio.Queue[Dict[str, Any]]") -> None:
+    """Flush queued reports to Mongo every DAEMON_BATCH_SIZE reports or DAEMON_FLUSH_SECONDS.
+    A batch that still fails after its retries is written together with the next one, so no later flush
+    moves the watermarks past it. Returns once _STOP is dequeued and everything before it is flushed."""
+    loop = asyncio.get_running_loop()
+    unwritten: List[Dict[str, Any]] = []
+    stopping = False
+    while not stopping:
+        batch: List[Dict[str, Any]] = []
+        item = await queue.get()
+        if item is _STOP:
+            stopping = True
+        else:
+            batch.append(item)
+        deadline = loop.time() + _FLUSH_SECONDS
+        while batch and len(batch) < _BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+        batch = unwritten + batch
+        if batch and not await _write_with_retries(db, batch):
+            unwritten = batch
+        else:
+            unwritten = []
+    if unwritten:
+        # Not covered by a saved watermark, so the next start's catch-up fetches them again
+        log.error(f"Stopping with {len(unwritten)} unwritten reports; they are re-read on the next start")
+
+
+async def run_daemon():
+    """Stay connected and ingest new channel messages as they are posted (NewMessage updates)."""
+    api_id, channels, per_channel = _settings()
+
+    collector = TelegramCheckpointCollector(api_id, get_secret("appHash"), get_secret("PhoneNumber"))
+    db = MongoDB()
     await collector.authenticate()
     db.connect()
+    db.deduper = _get_deduper(db)
+
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=_QUEUE_SIZE)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    writer = None
     try:
-        log.info(f"Collecting from {len(channels)} channels, {per_channel} msg/channel")
-        msgs = await collector.collect_many(channels, per_channel)
-        saved = db.save_messages(msgs)
-        log.info(f"Done. collected={len(msgs)} saved={saved}")
+        # Subscribe before catching up so nothing posted in between is missed; the overlap is a no-op upsert
+        subscribed = await collector.subscribe(channels, queue)
+        log.info(f"Listening for new messages on {subscribed}/{len(channels)} channels")
+        # Reports posted while the daemon was down are picked up from the watermarks. Live reports wait in
+        # the queue until then, so no flush moves the watermarks past a catch-up that has not been written
+        await _catch_up(collector, db, channels, per_channel)
+
+        writer = asyncio.create_task(_batch_writer(db, queue))
+        disconnected = asyncio.ensure_future(collector.client.run_until_disconnected())
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait({disconnected, stopped, writer}, return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            # The writer only returns after _STOP: anything else is a crash, and nothing drains the queue now
+            error = writer.exception() if not writer.cancelled() else asyncio.CancelledError()
+            raise RuntimeError(f"Batch writer stopped unexpectedly: {error!r}")
     finally:
+        # No new messages are queued after this
         await collector.close()
+        if writer and not writer.done():
+            # The writer flushes its current batch and everything queued before the sentinel
+            await queue.put(_STOP)
+            await writer
+        else:
+            # Flush whatever was accepted but not written yet
+            remaining = []
+            while not queue.empty():
+                remaining.append(queue.get_nowait())
+            if remaining:
+                await _write_with_retries(db, remaining)
         db.disconnect()
 
 
@@ -50,4 +299,12 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Collect checkpoint reports from Telegram channels")
+    parser.add_argument("--daemon", action="store_true", help="stay connected and ingest new messages live")
+    args = parser.parse_args()
+
+    async def run_once() -> None:
+        await main()
+        await close_clients()
+
+    asyncio.run(run_daemon() if args.daemon else run_once())
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from message_parser import UNKNOWN
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+DEDUPE_ENABLED = os.getenv("DEDUPE_ENABLED", "true").lower() == "true"
+DEDUPE_WINDOW_SECONDS = int(os.getenv("DEDUPE_WINDOW_SECONDS", "600"))
+DEDUPE_MAX_KEYS = int(os.getenv("DEDUPE_MAX_KEYS", "5000"))
+
+# (source_channel, message_id) of a stored report
+Ref = Tuple[str, int]
+# (checkpoint, city, direction)
+Key = Tuple[str, str, str]
+# (status, kept ref, kept message_date)
+Entry = Tuple[str, Ref, datetime]
+
+
+def ref_of(doc: Dict[str, Any]) -> Ref:
+    return doc["source_channel"], doc["message_id"]
+
+
+class ReportDeduper:
+    """Suppresses reports of the same event posted by several channels (or forwarded) within a window.
+
+    A report is a duplicate when the latest kept report for its (checkpoint, city, direction) has the
+    same status and was posted at most `window_seconds` before or after it. The window is anchored on
+    the kept report, so an ongoing status still gets a fresh document every window. Keeping only the
+    latest status per key means "open, closed, open" stays three documents."""
+
+    def __init__(self, window_seconds: int = DEDUPE_WINDOW_SECONDS, max_keys: int = DEDUPE_MAX_KEYS) -> None:
+        self.window = timedelta(seconds=window_seconds)
+        self.max_keys = max_keys
+        # Least recently updated first
+        self._kept: "OrderedDict[Key, Entry]" = OrderedDict()
+        self._newest: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._kept)
+
+    def observe(self, doc: Dict[str, Any]) -> Optional[Ref]:
+        """Record a report; returns the ref of the kept report it duplicates, or None when it must be stored."""
+        kept_ref = self.match(doc)
+        if kept_ref is None:
+            self.record(doc)
+        return kept_ref
+
+    def match(self, doc: Dict[str, Any], staged: Optional[Dict[Key, Entry]] = None) -> Optional[Ref]:
+        """Like observe, without recording the report. With `staged`, reports kept earlier in the same batch
+        (not stored yet) are matched first, and a report that must be stored is staged there."""
+        parsed = self._parse(doc)
+        if parsed is None:
+            return None
+        key, date = parsed
+        ref = ref_of(doc)
+        with self._lock:
+            entry = (staged or {}).get(key) or self._kept.get(key)
+        if entry is not None:
+            status, kept_ref, kept_date = entry
+            if status == doc.get("status") and abs(date - kept_date) <= self.window:
+                # The kept report itself (rerun) is stored again as a no-op upsert
+                return None if kept_ref == ref else kept_ref
+            if date < kept_date:
+                # Older report with another status: store it, the kept one stays the latest
+                return None
+        if staged is not None:
+            staged[key] = (doc.get("status"), ref, date)
+        return None
+
+    def record(self, doc: Dict[str, Any]) -> None:
+        """Keep a stored report as the latest for its key, unless a newer one is already kept."""
+        parsed = self._parse(doc)
+        if parsed is None:
+            return
+        key, date = parsed
+        with self._lock:
+            entry = self._kept.get(key)
+            if entry is not None and date < entry[2]:
+                return
+            self._kept[key] = (doc.get("status"), ref_of(doc), date)
+            self._kept.move_to_end(key)
+            if self._newest is None or date > self._newest:
+                self._newest = date
+            self._evict()
+
+    @staticmethod
+    def _parse(doc: Dict[str, Any]) -> Optional[Tuple[Key, datetime]]:
+        checkpoint, date = doc.get("checkpoint_name"), doc.get("message_date")
+        if not checkpoint or checkpoint == UNKNOWN or date is None:
+            return None
+        if date.tzinfo is None:
+            # Stored dates are UTC; a client without tz_aware returns them naive
+            date = date.replace(tzinfo=timezone.utc)
+        return (checkpoint, doc.get("city_name") or "", doc.get("direction") or ""), date
+
+    def _evict(self) -> None:
+        horizon = self._newest - self.window
+        while self._kept:
+            _, _, date = next(iter(self._kept.values()))
+            if date >= horizon and len(self._kept) <= self.max_keys:
+                break
+            self._kept.popitem(last=False)
+
+    def warm(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """Seed the store from stored reports, oldest first (cold start). Returns the number of keys."""
+        for doc in docs:
+            self.observe(doc)
+        log.info(f"Dedupe: warmed {len(self._kept)} keys")
+        return len(self._kept)
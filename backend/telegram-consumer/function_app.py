@@ -2,10 +2,15 @@ import asyncio
 import logging
 
 import azure.functions as func
+from archiver import run_compaction
 from consumer import main
 
 app = func.FunctionApp()
 
+# One event loop for the worker's lifetime: the Telegram client is bound to the loop it connected on,
+# so warm invocations can only reuse it if they run on the same loop (asyncio.run would create a new one)
+_loop = asyncio.new_event_loop()
+
 
 @app.timer_trigger(schedule="0 */5 * * * *", arg_name="myTimer", run_on_startup=False, use_monitor=True)
 def FetchTelegramData(myTimer: func.TimerRequest) -> None:
@@ -13,5 +18,12 @@ def FetchTelegramData(myTimer: func.TimerRequest) -> None:
     if myTimer.past_due:
         logging.info("The timer is past due!")
 
-    asyncio.run(main())
+    _loop.run_until_complete(main())
     logging.info("Python timer trigger function executed.")
+
+
+@app.timer_trigger(schedule="0 15 * * * *", arg_name="myTimer", run_on_startup=False, use_monitor=True)
+def CompactReports(myTimer: func.TimerRequest) -> None:
+    # Hourly: move reports older than HOT_RETENTION_HOURS to the archive collection
+    summary = run_compaction()
+    logging.info(f"Compaction executed: {summary}")
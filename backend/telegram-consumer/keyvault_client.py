@@ -1,5 +1,7 @@
 import os
+import time
 from functools import lru_cache
+from typing import Dict, Tuple
 
 from azure.identity import ClientSecretCredential
 from azure.keyvault.secrets import SecretClient
@@ -17,8 +19,18 @@ def _secret_client() -> SecretClient:
     return SecretClient(vault_url=vault_url, credential=cred)
 
 
+# Secrets survive warm Azure Functions invocations for this long before being fetched again
+_SECRET_TTL_SECONDS = int(os.getenv("SECRET_CACHE_TTL_SECONDS", "3600"))
+_secret_cache: Dict[str, Tuple[str, float]] = {}
+
+
 def get_secret(name: str) -> str:
+    cached = _secret_cache.get(name)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
     try:
-        return _secret_client().get_secret(name).value
+        value = _secret_client().get_secret(name).value
     except Exception as e:
         raise RuntimeError(f"Unable to fetch secret '{name}': {e}")
+    _secret_cache[name] = (value, time.monotonic() + _SECRET_TTL_SECONDS)
+    return value
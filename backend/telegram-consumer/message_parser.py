@@ -0,0 +1,328 @@
+"""
+Compiled single-pass parser for Telegram checkpoint reports.
+
+All lookup tables (checkpoint names, status/direction keywords, noise markers) are compiled
+once into one Aho-Corasick automaton. A single scan over a message reports every marker it
+contains, including overlapping ones, and the original priority rules are then applied to
+that set, so results are identical to the former keyword-by-keyword parser.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+UNKNOWN = "غير محدد"
+INQUIRY = "استفسار"
+
+# checkpoint → city (dict order is the match priority)
+CHECKPOINT_LOCATIONS: Dict[str, Dict[str, str]] = {
+    # Nablus
+    "دير شرف": {"city": "نابلس"},
+    "شافي شومرون": {"city": "نابلس"},
+    "المربعة": {"city": "نابلس"},
+    "بوابة بورين": {"city": "نابلس"},
+    "صرة": {"city": "نابلس"},
+    "صره": {"city": "نابلس"},
+    "عورتا": {"city": "نابلس"},
+    "ال17 عصيرة": {"city": "نابلس"},
+    "بيت فوريك": {"city": "نابلس"},
+    "الباذان": {"city": "نابلس"},
+    "زعترة": {"city": "نابلس"},
+    # Ramallah
+    "عين سينا": {"city": "رام الله"},
+    "بيت ايل": {"city": "رام الله"},
+    "عطارة البلد": {"city": "رام الله"},
+    "عطاره": {"city": "رام الله"},
+    "عطارة": {"city": "رام الله"},
+    "عطارة بيرزيت": {"city": "رام الله"},
+    "الجلزون": {"city": "رام الله"},
+    "بوابة النبي صالح": {"city": "رام الله"},
+    "روابي": {"city": "رام الله"},
+    "عيلي": {"city": "رام الله"},
+    "عيون الحرمية": {"city": "رام الله"},
+    "خربثا": {"city": "رام الله"},
+    "المخماس": {"city": "رام الله"},
+    "بوابة بدو": {"city": "رام الله"},
+    "بوابة نعلين": {"city": "رام الله"},
+    "بوابة سنجل": {"city": "رام الله"},
+    # Jerusalem
+    "قلنديا": {"city": "القدس"},
+    "كفر عقب": {"city": "القدس"},
+    "عناتا": {"city": "القدس"},
+    "جبع": {"city": "القدس"},
+    "الرام": {"city": "القدس"},
+    "شعفاط": {"city": "القدس"},
+    "العيزرية": {"city": "القدس"},
+    "حزما": {"city": "القدس"},
+    # Hebron
+    "راس الجورة": {"city": "الخليل"},
+    "فرش الهوا": {"city": "الخليل"},
+    "بني النعيم": {"city": "الخليل"},
+    "الفحص": {"city": "الخليل"},
+    "كرمة": {"city": "الخليل"},
+    "جسر حلحول": {"city": "الخليل"},
+    "خلة المية": {"city": "الخليل"},
+    "العمور": {"city": "الخليل"},
+    "الفوار": {"city": "الخليل"},
+    "الشويكة": {"city": "الخليل"},
+    "دورا": {"city": "الخليل"},
+    "العروب": {"city": "الخليل"},
+    "بوابة بيت امر": {"city": "الخليل"},
+    "سعير": {"city": "الخليل"},
+    # Bethlehem
+    "الكونتينر": {"city": "بيت لحم"},
+    "عش الغراب": {"city": "بيت لحم"},
+    "النشاش": {"city": "بيت لحم"},
+    "بيت جالا": {"city": "بيت لحم"},
+    "النفق": {"city": "بيت لحم"},
+    "السدر": {"city": "بيت لحم"},
+    "جناتا": {"city": "بيت لحم"},
+    "الخضر": {"city": "بيت لحم"},
+    "العبيدية": {"city": "بيت لحم"},
+    "حاجز 300": {"city": "بيت لحم"},
+    "المناشير": {"city": "بيت لحم"},
+    "ام سلمونة": {"city": "بيت لحم"},
+    "نصار": {"city": "بيت لحم"},
+    # Salfit
+    "مدخل سلفيت الشمالي": {"city": "سلفيت"},
+    "ديرستيا": {"city": "سلفيت"},
+    "بوابة كفل حارس": {"city": "سلفيت"},
+    "بوابة حارس": {"city": "سلفيت"},
+    "سدة قرواة": {"city": "سلفيت"},
+    "بوابة بروقين": {"city": "سلفيت"},
+    "ياسوف": {"city": "سلفيت"},
+    "كدوميم": {"city": "سلفيت"},
+    "واد قانا": {"city": "سلفيت"},
+    "دير بلوط": {"city": "سلفيت"},
+    "كفر الديك": {"city": "سلفيت"},
+    "بوابة مردا الشرقية": {"city": "سلفيت"},
+    "بوابة مردا الغربية": {"city": "سلفيت"},
+    "اشارات ارائيل": {"city": "سلفيت"},
+    "بوابة جماعين": {"city": "سلفيت"},
+    # Qalqilya
+    "المدخل الشرقي": {"city": "قلقيلية"},
+    "نفق حبلة": {"city": "قلقيلية"},
+    "مدخل اماتين": {"city": "قلقيلية"},
+    "مدخل جينصافوط": {"city": "قلقيلية"},
+    "جسر عزون": {"city": "قلقيلية"},
+    "مدخل كفر لاقف": {"city": "قلقيلية"},
+    "حجة": {"city": "قلقيلية"},
+    "الفندق": {"city": "قلقيلية"},
+    "مدخل النبي الياس": {"city": "قلقيلية"},
+    # Tulkarm
+    "بزاريا": {"city": "طولكرم"},
+    "عناب": {"city": "طولكرم"},
+    "عنبتا": {"city": "طولكرم"},
+    "سناعوز": {"city": "طولكرم"},
+    "ايال": {"city": "طولكرم"},
+    "جبارة": {"city": "طولكرم"},
+    "قفين": {"city": "طولكرم"},
+    "جبارة تحت الجسر": {"city": "طولكرم"},
+    "بيت ليد": {"city": "طولكرم"},
+    "مدخل رامين": {"city": "طولكرم"},
+    "سهل رامين": {"city": "طولكرم"},
+    "كفر اللبد": {"city": "طولكرم"},
+    "شوفة": {"city": "طولكرم"},
+    "حرميش": {"city": "طولكرم"},
+    # Jenin
+    "حومش": {"city": "جنين"},
+    "الجلمة": {"city": "جنين"},
+    "دوتان": {"city": "جنين"},
+    "برطعة": {"city": "جنين"},
+    # Jericho / Tubas
+    "تياسير": {"city": "اريحا(طوباس)"},
+    "الحمرا": {"city": "اريحا(طوباس)"},
+    "المعرجات": {"city": "اريحا(طوباس)"},
+    "معالي افرايم": {"city": "اريحا(طوباس)"},
+    "الهيئة": {"city": "اريحا(طوباس)"},
+    "البنانا": {"city": "اريحا(طوباس)"},
+    "البوابة الصفراء": {"city": "اريحا(طوباس)"},
+    "عين جدي": {"city": "اريحا(طوباس)"},
+    "شارع 90": {"city": "اريحا(طوباس)"},
+}
+
+# (status, keywords) in priority order
+STATUS_KEYWORDS: List[Tuple[str, List[str]]] = [
+    (INQUIRY, ["ممكن", "شو وضع", "كيف", "ايش وضع", "كيف الوضع", "؟", "شو"]),
+    ("إغلاق", ["مغلق", "مسكر", "اغلاق", "سكر", "مغلقة", "مسكرة", "❌"]),
+    ("أزمة", ["ازمة", "أزمة", "كثافة سير", "واقف", "خانقة", "طويلة", "🔴"]),
+    ("سالك", ["سالك", "سالكة", "فاتح", "مفتوح", "بحري", "نضيف", "✅"]),
+    ("حاجز/تفتيش", ["حاجز", "تفتيش", "بفتش", "تواجد جيش", "جيش", "حاجز طيار", "وقف"]),
+    ("حادث", ["حادث", "حريق", "عطلان", "عطلانه"]),
+    ("فتح", ["فتح", "تم فتح"]),
+]
+
+# (direction, keywords) in priority order
+DIRECTION_KEYWORDS: List[Tuple[str, List[str]]] = [
+    ("دخول", ["للداخل", "دخول", "داخل", "للدخول", "ل الداخل"]),
+    ("خروج", ["للخارج", "خروج", "خارج", "للخروج", "ل الخارج"]),
+    ("الاتجاهين", ["بالاتجاهين", "الاتجاهين", "الجهتين", "باتجاهين"]),
+]
+
+# Short courtesy messages
+NOISE_EXACT = {"شكرا", "مرحبا", "اهلا", "تسلم", "يعطيك العافية"}
+NOISE_GREETINGS = [
+    "شكرا",
+    "شكراً",
+    "مرحبا",
+    "أهلا",
+    "السلام عليكم",
+    "مساء الخير",
+    "صباح الخير",
+    "تحية",
+    "بارك الله",
+    "الله يعطيك",
+    "يا جماعة",
+    "ربنا يبارك",
+    "🙏",
+    "❤️",
+]
+NOISE_GREETING_MAX_LEN = 30
+# General announcements that are not about one checkpoint
+NOISE_GENERAL = ["مخارج", "مداخل", "عام", "عمومي", "اعلان", "تنبيه عام"]
+NOISE_GENERAL_MAX_LEN = 50
+
+_CLEANUP_EMOJI = re.compile(r"[🔴❌✅️🤍🤝⚠️✋]+")
+_CLEANUP_SPACES = re.compile(r"\s+")
+
+_CACHE_SIZE = int(os.getenv("PARSER_CACHE_SIZE", "4096"))
+
+# Pattern roles
+_LOCATION, _LOCATION_WORD, _STATUS, _DIRECTION, _NOISE_GREETING, _NOISE_GENERAL = range(6)
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one left-to-right pass reports every (overlapping) pattern present."""
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+
+        ends: List[Set[int]] = [set()]
+        for pattern in dict.fromkeys(p for p in patterns if p):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    ends.append(set())
+                node = nxt
+            ends[node].add(len(self.patterns))
+            self.patterns.append(pattern)
+
+        # Breadth-first failure links; each node outputs its own patterns plus its fail chain's
+        out = [set(e) for e in ends]
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                out[nxt] |= out[self._fail[nxt]]
+        self._out: List[FrozenSet[int]] = [frozenset(o) for o in out]
+
+    def search(self, text: str) -> Set[int]:
+        """Indexes (into self.patterns) of every pattern contained in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+class MessageParser:
+    """Parses Telegram messages into (checkpoint, city, status, direction, cleaned text)."""
+
+    def __init__(self, locations: Optional[Dict[str, Dict[str, str]]] = None, cache_size: int = _CACHE_SIZE) -> None:
+        self.locations = CHECKPOINT_LOCATIONS if locations is None else locations
+        self._loc_names = list(self.locations)
+
+        # pattern text -> [(role, rank)], rank being the priority inside the role
+        roles: Dict[str, List[Tuple[int, int]]] = {}
+        for rank, loc in enumerate(self._loc_names):
+            roles.setdefault(loc.lower(), []).append((_LOCATION, rank))
+            for word in loc.lower().split():
+                if len(word) > 2:
+                    roles.setdefault(word, []).append((_LOCATION_WORD, rank))
+        for rank, (_, keywords) in enumerate(STATUS_KEYWORDS):
+            for kw in keywords:
+                roles.setdefault(kw, []).append((_STATUS, rank))
+        for rank, (_, keywords) in enumerate(DIRECTION_KEYWORDS):
+            for kw in keywords:
+                roles.setdefault(kw, []).append((_DIRECTION, rank))
+        for kw in NOISE_GREETINGS:
+            roles.setdefault(kw, []).append((_NOISE_GREETING, 0))
+        for kw in NOISE_GENERAL:
+            roles.setdefault(kw, []).append((_NOISE_GENERAL, 0))
+
+        self._automaton = AhoCorasick(roles)
+        self._roles = [roles[p] for p in self._automaton.patterns]
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _best(self, found: Set[int]) -> List[int]:
+        """Lowest (highest-priority) rank per role among the matched patterns."""
+        best = [-1] * 6
+        for idx in found:
+            for role, rank in self._roles[idx]:
+                if best[role] < 0 or rank < best[role]:
+                    best[role] = rank
+        return best
+
+    def _parse(self, text: str) -> Tuple[str, str, str, str, str]:
+        if not text:
+            return UNKNOWN, UNKNOWN, UNKNOWN, UNKNOWN, ""
+        best = self._best(self._automaton.search(text.lower()))
+
+        checkpoint, city = UNKNOWN, UNKNOWN
+        loc_rank = best[_LOCATION] if best[_LOCATION] >= 0 else best[_LOCATION_WORD]
+        if loc_rank >= 0:
+            checkpoint = self._loc_names[loc_rank]
+            city = self.locations[checkpoint]["city"]
+
+        status = STATUS_KEYWORDS[best[_STATUS]][0] if best[_STATUS] >= 0 else UNKNOWN
+
+        if best[_DIRECTION] >= 0:
+            direction = DIRECTION_KEYWORDS[best[_DIRECTION]][0]
+        elif checkpoint != UNKNOWN and status not in {UNKNOWN, INQUIRY}:
+            direction = "الاتجاهين"
+        else:
+            direction = UNKNOWN
+
+        cleaned = _CLEANUP_EMOJI.sub("", text)
+        cleaned = _CLEANUP_SPACES.sub(" ", cleaned).strip()
+        return checkpoint, city, status, direction, cleaned
+
+    def is_noise(self, text: str) -> bool:
+        """Greetings, thanks and general announcements that carry no checkpoint report."""
+        if not text:
+            return True
+        t = text.lower().strip()
+        if t in NOISE_EXACT:
+            return True
+        best = self._best(self._automaton.search(t))
+        if best[_NOISE_GREETING] >= 0 and len(t) < NOISE_GREETING_MAX_LEN:
+            return True
+        return best[_NOISE_GENERAL] >= 0 and len(t) < NOISE_GENERAL_MAX_LEN
+
+
+_default_parser: Optional[MessageParser] = None
+
+
+def get_parser() -> MessageParser:
+    """Process-wide parser built from CHECKPOINT_LOCATIONS (compiled on first use)."""
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = MessageParser()
+    return _default_parser
@@ -1,22 +1,36 @@
 import logging
 import os
-from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from dedupe import Ref, ReportDeduper, ref_of
 from dotenv import load_dotenv
 from keyvault_client import get_secret
-from pymongo import MongoClient
+from message_parser import get_parser
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from rollups import ensure_rollup_indexes, record_reports
+from run_metrics import RunMetrics
 
 load_dotenv()
 
 _DB = os.getenv("MONGO_DB_NAME")
 _COL = os.getenv("MONGO_COLLECTION_DATA")
 _SECRET_KEY = os.getenv("MONGO_CONNECTION_STRING_KEY") or "mongodbConnectionString"
+_WATERMARKS_COL = os.getenv("MONGO_COLLECTION_WATERMARKS") or "channel_watermarks"
+_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "500"))
+_DUPLICATE_KEY = 11000
+
+# Hot/cold split: the data collection keeps HOT_RETENTION_HOURS of reports for the live endpoints,
+# archiver.py moves older ones to the archive collection. There is deliberately no TTL index: it would delete
+# reports that were never archived whenever compaction falls behind, so only compaction removes hot reports.
+_ROLLUPS_COL = os.getenv("MONGO_COLLECTION_ROLLUPS") or "status_rollups"
+_ARCHIVE_COL = os.getenv("MONGO_COLLECTION_ARCHIVE") or f"{_COL}_archive"
+HOT_RETENTION_HOURS = int(os.getenv("HOT_RETENTION_HOURS", "48"))
 if not _DB or not _COL:
     raise ValueError("MONGO_DB_NAME or MONGO_COLLECTION_DATA is missing.")
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 def _to_utc(value: Any) -> Optional[datetime]:
@@ -50,31 +64,18 @@ def _to_utc(value: Any) -> Optional[datetime]:
 
 
 def _is_noise(text: str) -> bool:
-    if not text:
-        return True
-    t = text.lower().strip()
-    if t in {"شكرا", "مرحبا", "اهلا", "تسلم", "يعطيك العافية"}:
-        return True
-    patterns = [
-        "شكرا",
-        "شكراً",
-        "مرحبا",
-        "أهلا",
-        "السلام عليكم",
-        "مساء الخير",
-        "صباح الخير",
-        "تحية",
-        "بارك الله",
-        "الله يعطيك",
-        "يا جماعة",
-        "ربنا يبارك",
-        "🙏",
-        "❤️",
-    ]
-    if any(p in t for p in patterns) and len(t) < 30:
-        return True
-    non_checkpoint = ["مخارج", "مداخل", "عام", "عمومي", "اعلان", "تنبيه عام"]
-    return any(p in t for p in non_checkpoint) and len(t) < 50
+    return get_parser().is_noise(text)
+
+
+def new_summary() -> Dict[str, int]:
+    return {"inserted": 0, "duplicates": 0, "failed": 0, "filtered": 0, "suppressed": 0}
+
+
+def log_summary(summary: Dict[str, int]) -> None:
+    logger.info(
+        f"MongoDB: inserted={summary['inserted']} duplicates={summary['duplicates']} "
+        f"failed={summary['failed']} filtered={summary['filtered']} suppressed={summary['suppressed']}"
+    )
 
 
 class MongoDB:
@@ -82,55 +83,273 @@ class MongoDB:
         self._conn_str = get_secret(_SECRET_KEY)
         self._client: Optional[MongoClient] = None
         self.collection = None
+        self.watermarks = None
+        self.archive = None
+        self.rollups = None
+        self.batch_size = max(1, _BATCH_SIZE)
+        # Cross-channel duplicate suppression; the consumer sets it, offline tools write every report
+        self.deduper: Optional[ReportDeduper] = None
 
     def connect(self) -> None:
         # tz_aware=True makes reads return tz-aware datetimes
         self._client = MongoClient(self._conn_str, tz_aware=True)
         self.collection = self._client[_DB][_COL]
+        self.watermarks = self._client[_DB][_WATERMARKS_COL]
+        self.archive = self._client[_DB][_ARCHIVE_COL]
+        self.rollups = self._client[_DB][_ROLLUPS_COL]
         self._client.admin.command("ping")
         logger.info("MongoDB: connected")
+        self._ensure_indexes()
+
+    def _ensure_indexes(self) -> None:
+        # One document per Telegram message: reruns and overlapping windows become no-ops
+        try:
+            self.collection.create_index(
+                [("source_channel", ASCENDING), ("message_id", ASCENDING)], unique=True, name="source_message_unique"
+            )
+        except OperationFailure as e:
+            # e.g. duplicates inserted before the index existed; upserts still avoid new ones
+            logger.warning(f"MongoDB: could not create unique (source_channel, message_id) index: {e}")
+        self.ensure_archive_indexes()
+        try:
+            # Deployments that ran with the former TTL safety net: drop it before it deletes unarchived reports
+            if "message_date_ttl" in self.collection.index_information():
+                self.collection.drop_index("message_date_ttl")
+                logger.info("MongoDB: dropped the message_date TTL index")
+            # Compaction scans reports by age
+            self.collection.create_index([("message_date", ASCENDING)], name="message_date")
+        except OperationFailure as e:
+            logger.warning(f"MongoDB: could not replace the message_date TTL index: {e}")
+        ensure_rollup_indexes(self.rollups)
+
+    def ensure_archive_indexes(self) -> None:
+        try:
+            # Reports older than the hot window are upserted straight into the archive, keyed like the hot tier
+            self.archive.create_index(
+                [("source_channel", ASCENDING), ("message_id", ASCENDING)], unique=True, name="source_message_unique"
+            )
+            self.archive.create_index(
+                [("checkpoint_name", ASCENDING), ("city_name", ASCENDING), ("message_date", DESCENDING)],
+                name="checkpoint_city_date",
+            )
+            # Day-by-day scans of `rollups.py rebuild`
+            self.archive.create_index([("message_date", ASCENDING)], name="message_date")
+        except OperationFailure as e:
+            logger.warning(f"MongoDB: could not create archive indexes: {e}")
 
     def disconnect(self) -> None:
         if self._client:
             self._client.close()
+            self._client = None
             logger.info("MongoDB: disconnected")
 
-    def save_messages(self, messages: Iterable[Dict[str, Any]]) -> int:
-        msgs = list(messages)
-        if not msgs:
+    def is_healthy(self) -> bool:
+        if not self._client:
+            return False
+        try:
+            self._client.admin.command("ping")
+            return True
+        except Exception as e:
+            logger.warning(f"MongoDB: health check failed: {e}")
+            return False
+
+    def save_messages(self, messages: Iterable[Dict[str, Any]], metrics: Optional[RunMetrics] = None) -> Dict[str, int]:
+        """Upsert reports keyed on (source_channel, message_id), streaming them in batches of MONGO_BATCH_SIZE.
+        Returns counts of inserted, duplicate (already stored), failed and filtered messages;
+        `metrics` additionally gets the filter/insert timings and per-channel funnel counts."""
+        summary = new_summary()
+        metrics = metrics or RunMetrics()
+        batch: List[Dict[str, Any]] = []
+        seen = 0
+        for m in messages:
+            seen += 1
+            doc = self.to_document(m, metrics)
+            if doc is None:
+                summary["filtered"] += 1
+                continue
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, summary, metrics)
+                batch = []
+        if batch:
+            self.write_batch(batch, summary, metrics)
+
+        if not seen:
             logger.info("MongoDB: nothing to save")
-            return 0
+        else:
+            log_summary(summary)
+        return summary
 
-        docs: List[Dict[str, Any]] = []
-        for m in msgs:
+    def to_document(self, m: Dict[str, Any], metrics: Optional[RunMetrics] = None) -> Optional[Dict[str, Any]]:
+        """Stored document for a report, or None when it is filtered out (no checkpoint data, or noise)."""
+        metrics = metrics or RunMetrics()
+        with metrics.stage("filter"):
             checkpoint = (m.get("checkpoint_name") or "").strip()
             city = (m.get("city_name") or "").strip()
             status = (m.get("status") or "").strip()
             original = (m.get("original_message") or "").strip()
 
             if all(x in {"غير محدد", "", None} for x in (checkpoint, city, status)):
-                continue
+                metrics.count(m.get("source_channel"), "dropped_unknown")
+                return None
             if _is_noise(original):
-                continue
+                metrics.count(m.get("source_channel"), "dropped_noise")
+                return None
 
             dt = _to_utc(m.get("message_date")) or datetime.now(timezone.utc)
-            docs.append(
-                {
-                    "message_id": m.get("message_id"),
-                    "source_channel": m.get("source_channel"),
-                    "original_message": original,
-                    "checkpoint_name": checkpoint,
-                    "city_name": city,
-                    "status": status,
-                    "direction": (m.get("direction") or "").strip(),
-                    "message_date": dt,  # UTC with tzinfo
-                }
+            return {
+                "message_id": m.get("message_id"),
+                "source_channel": m.get("source_channel"),
+                "original_message": original,
+                "checkpoint_name": checkpoint,
+                "city_name": city,
+                "status": status,
+                "direction": (m.get("direction") or "").strip(),
+                "message_date": dt,  # UTC with tzinfo
+                "report_count": 1,  # + reports of the same event suppressed by the deduper
+            }
+
+    def write_batch(
+        self, docs: List[Dict[str, Any]], summary: Dict[str, int], metrics: Optional[RunMetrics] = None
+    ) -> None:
+        """Upsert one batch of documents from to_document, adding the outcomes to `summary`.
+        Reports older than HOT_RETENTION_HOURS (backfills, late messages) go straight to the archive tier.
+        With a deduper, duplicates of a kept report increment its report_count instead of being stored."""
+        metrics = metrics or RunMetrics()
+        kept, corroborations = docs, []
+        if self.deduper is not None:
+            with metrics.stage("dedupe"):
+                # Reports are recorded only once stored, so a failed upsert never becomes a kept report
+                kept, staged = [], {}
+                for doc in docs:
+                    kept_ref = self.deduper.match(doc, staged)
+                    if kept_ref is None:
+                        kept.append(doc)
+                    else:
+                        corroborations.append((kept_ref, doc))
+
+        failed_refs = set()
+        if kept:
+            with metrics.stage("insert"):
+                outcomes = self._upsert_batch(kept)
+            for doc, outcome in zip(kept, outcomes):
+                summary[outcome] += 1
+                metrics.count(doc["source_channel"], outcome)
+                if outcome == "failed":
+                    failed_refs.add(ref_of(doc))
+                elif self.deduper is not None:
+                    self.deduper.record(doc)
+            # Only newly stored reports, so replayed batches do not count twice
+            inserted = [doc for doc, outcome in zip(kept, outcomes) if outcome == "inserted"]
+            if inserted:
+                with metrics.stage("rollups"):
+                    try:
+                        record_reports(self.rollups, inserted)
+                    except Exception as e:
+                        # The reports are stored; `python rollups.py rebuild` can recompute the rollups
+                        logger.warning(f"MongoDB: could not update status rollups: {e}")
+
+        if failed_refs:
+            # Duplicates of a report that failed to store fail with it, so the batch is retried as a whole
+            orphans = [doc for kept_ref, doc in corroborations if kept_ref in failed_refs]
+            for doc in orphans:
+                summary["failed"] += 1
+                metrics.count(doc["source_channel"], "failed")
+            corroborations = [(kept_ref, doc) for kept_ref, doc in corroborations if kept_ref not in failed_refs]
+
+        if corroborations:
+            # After the upserts: the kept report may be in this same batch
+            with metrics.stage("insert"):
+                self._corroborate(corroborations)
+            for _, doc in corroborations:
+                summary["suppressed"] += 1
+                metrics.count(doc["source_channel"], "suppressed")
+
+    def _hot_cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(hours=HOT_RETENTION_HOURS)
+
+    def _corroborate(self, corroborations: List[Tuple[Ref, Dict[str, Any]]]) -> None:
+        cutoff = self._hot_cutoff()
+        hot_ops, archive_ops = [], []
+        for (channel, message_id), doc in corroborations:
+            # Telegram message link of the duplicate; the $ne guard keeps replayed runs from counting it twice
+            dup = f"{doc['source_channel']}/{doc['message_id']}"
+            # The duplicate was posted within the dedupe window of the kept report, so it shares its tier
+            ops = archive_ops if doc["message_date"] < cutoff else hot_ops
+            ops.append(
+                UpdateOne(
+                    {"source_channel": channel, "message_id": message_id, "duplicate_refs": {"$ne": dup}},
+                    {"$inc": {"report_count": 1}, "$push": {"duplicate_refs": dup}},
+                )
+            )
+        for collection, ops in ((self.collection, hot_ops), (self.archive, archive_ops)):
+            if not ops:
+                continue
+            try:
+                collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                logger.warning(f"MongoDB: {len(e.details.get('writeErrors', []))} report_count updates failed")
+
+    def recent_reports(self, since: datetime) -> Iterator[Dict[str, Any]]:
+        """Stored reports posted since `since`, oldest first (used to warm the deduper)."""
+        fields = ["source_channel", "message_id", "checkpoint_name", "city_name", "status", "direction", "message_date"]
+        return self.collection.find({"message_date": {"$gte": since}}, dict.fromkeys(fields, 1)).sort(
+            "message_date", ASCENDING
+        )
+
+    def _upsert_batch(self, docs: List[Dict[str, Any]]) -> List[str]:
+        """Outcome per doc: "inserted", "duplicates" (already stored) or "failed".
+        Docs older than the hot window are upserted into the archive, the rest into the hot collection."""
+        cutoff = self._hot_cutoff()
+        outcomes = [""] * len(docs)
+        hot = [i for i, d in enumerate(docs) if d["message_date"] >= cutoff]
+        old = [i for i, d in enumerate(docs) if d["message_date"] < cutoff]
+        for collection, indexes in ((self.collection, hot), (self.archive, old)):
+            if indexes:
+                tier_outcomes = self._upsert_into(collection, [docs[i] for i in indexes])
+                for i, outcome in zip(indexes, tier_outcomes):
+                    outcomes[i] = outcome
+        return outcomes
+
+    def _upsert_into(self, collection, docs: List[Dict[str, Any]]) -> List[str]:
+        ops = [
+            UpdateOne(
+                {"source_channel": d["source_channel"], "message_id": d["message_id"]},
+                {"$setOnInsert": d},
+                upsert=True,
             )
+            for d in docs
+        ]
+        # Matched (already stored) unless the result says the op upserted or failed
+        outcomes = ["duplicates"] * len(docs)
+        try:
+            result = collection.bulk_write(ops, ordered=False)
+            upserted = result.upserted_ids or {}
+        except BulkWriteError as e:
+            details = e.details
+            upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+            for err in details.get("writeErrors", []):
+                # Two concurrent upserts of the same message: the other one stored it
+                if err.get("code") != _DUPLICATE_KEY:
+                    outcomes[err["index"]] = "failed"
+                    logger.warning(f"MongoDB: write failed: {err.get('errmsg')}")
+        for index in upserted:
+            outcomes[index] = "inserted"
+        return outcomes
 
-        if not docs:
-            logger.info("MongoDB: all messages filtered")
-            return 0
+    def get_watermarks(self, channels: Iterable[str]) -> Dict[str, int]:
+        """Last seen Telegram message id per channel (channels never collected are absent)."""
+        docs = self.watermarks.find({"_id": {"$in": list(channels)}})
+        return {d["_id"]: int(d.get("last_message_id") or 0) for d in docs}
 
-        self.collection.insert_many(docs, ordered=False)
-        logger.info(f"MongoDB: inserted {len(docs)} docs")
-        return len(docs)
+    def save_watermarks(self, watermarks: Dict[str, int]) -> None:
+        if not watermarks:
+            return
+        now = datetime.now(timezone.utc)
+        ops = [
+            # $max: a watermark never moves backwards, even if runs overlap
+            UpdateOne({"_id": ch}, {"$max": {"last_message_id": mid}, "$set": {"updated_at": now}}, upsert=True)
+            for ch, mid in watermarks.items()
+        ]
+        self.watermarks.bulk_write(ops, ordered=False)
+        logger.info(f"MongoDB: saved watermarks for {len(ops)} channels")
@@ -0,0 +1,150 @@
+# rollups.py
+"""
+Hourly per-checkpoint status rollups (same document shape as api/rollups.py, which serves them).
+
+One document per (checkpoint, city, UTC hour) with report counts by status and direction. The consumer
+adds every newly stored report with $inc upserts; `rebuild` recomputes them from the raw reports in the
+hot and archive collections, one day at a time:
+
+    python rollups.py rebuild                   # everything
+    python rollups.py rebuild --since 2025-09-01
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from json_logging import setup_logging
+from message_parser import UNKNOWN
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+load_dotenv()
+
+log = logging.getLogger("rollups")
+
+
+def hour_bucket(dt: datetime) -> datetime:
+    """Start of the UTC hour containing dt (naive datetimes are taken as UTC)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _field_name(value: Optional[str]) -> str:
+    """Status/direction as a counter field name ("." and a leading "$" are not allowed in field names)"""
+    return (value or "").replace(".", " ").lstrip("$").strip() or UNKNOWN
+
+
+def rollup_ops(docs: Iterable[Dict[str, Any]]) -> List[UpdateOne]:
+    """
+    $inc upserts for a batch of stored reports, one per (checkpoint, city, hour)
+
+    Args:
+        docs (Iterable[Dict]): Report documents with checkpoint_name, city_name, status, direction, message_date
+
+    Returns:
+        List[UpdateOne]: Operations for the rollups collection
+    """
+    increments: Dict[tuple, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for doc in docs:
+        checkpoint, date = doc.get("checkpoint_name"), doc.get("message_date")
+        if not checkpoint or checkpoint == UNKNOWN or not isinstance(date, datetime):
+            continue
+        key = (checkpoint, doc.get("city_name") or UNKNOWN, hour_bucket(date))
+        counts = increments[key]
+        counts["total"] += 1
+        counts[f"status.{_field_name(doc.get('status'))}"] += 1
+        counts[f"direction.{_field_name(doc.get('direction'))}"] += 1
+
+    return [
+        UpdateOne({"checkpoint_name": cp, "city_name": city, "hour": hour}, {"$inc": dict(counts)}, upsert=True)
+        for (cp, city, hour), counts in increments.items()
+    ]
+
+
+def record_reports(collection, docs: Iterable[Dict[str, Any]]) -> None:
+    """Add stored reports to the hourly rollups"""
+    ops = rollup_ops(docs)
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def ensure_rollup_indexes(collection) -> None:
+    try:
+        collection.create_index(
+            [("checkpoint_name", ASCENDING), ("city_name", ASCENDING), ("hour", ASCENDING)],
+            unique=True,
+            name="checkpoint_city_hour_unique",
+        )
+    except OperationFailure as e:
+        log.warning(f"Could not create rollup index: {e}")
+
+
+def rebuild(raw_collections: List[Any], rollups, since: datetime, until: datetime) -> int:
+    """Recompute the rollups of [since, until) from raw reports. Each day is deleted and rewritten
+    separately, so live increments can only be lost or doubled for the day being rewritten."""
+    day = hour_bucket(since).replace(hour=0)
+    rebuilt = 0
+    while day < until:
+        next_day = day + timedelta(days=1)
+        window = {"message_date": {"$gte": day, "$lt": next_day}}
+        fields = {"source_channel": 1, "message_id": 1, "checkpoint_name": 1, "city_name": 1}
+        fields.update({"status": 1, "direction": 1, "message_date": 1})
+        # A report can be in both tiers after an interrupted compaction
+        seen = set()
+        docs = []
+        for col in raw_collections:
+            for doc in col.find(window, fields):
+                ref = (doc.get("source_channel"), doc.get("message_id"))
+                if ref not in seen:
+                    seen.add(ref)
+                    docs.append(doc)
+        rollups.delete_many({"hour": {"$gte": day, "$lt": next_day}})
+        ops = rollup_ops(docs)
+        if ops:
+            rollups.bulk_write(ops, ordered=False)
+        rebuilt += len(docs)
+        log.info(f"{day.date().isoformat()}: {len(docs)} reports, {len(ops)} hourly rollups")
+        day = next_day
+    return rebuilt
+
+
+def main() -> None:
+    # Imported here: mongodb imports this module for the write path
+    from mongodb import MongoDB
+
+    parser = argparse.ArgumentParser(description="Hourly checkpoint status rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="recompute rollups from the raw reports (hot + archive)")
+    p_rebuild.add_argument("--since", help="first day to rebuild, YYYY-MM-DD (default: oldest report)")
+    args = parser.parse_args()
+
+    setup_logging()
+    db = MongoDB()
+    db.connect()
+    try:
+        raw = [db.collection, db.archive]
+        if args.since:
+            since = datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        else:
+            oldest = [
+                d["message_date"]
+                for col in raw
+                for d in col.find({}, {"message_date": 1}).sort("message_date", 1).limit(1)
+            ]
+            if not oldest:
+                log.info("No reports to roll up")
+                return
+            since = min(hour_bucket(d) for d in oldest)
+        rebuilt = rebuild(raw, db.rollups, since, datetime.now(timezone.utc))
+        log.info(f"Rebuilt rollups from {rebuilt} reports since {since.date().isoformat()}")
+    finally:
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
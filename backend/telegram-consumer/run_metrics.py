@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+log = logging.getLogger("metrics")
+
+# Optional Prometheus textfile (node_exporter textfile collector), rewritten after every run
+_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+
+# Funnel steps in pipeline order
+FUNNEL = [
+    "fetched",  # messages returned by iter_messages (daemon flushes start at with_status)
+    "with_status",  # passed the status filter in collect (not "غير محدد"/"استفسار")
+    "dropped_unknown",  # checkpoint, city and status all "غير محدد" in save_messages
+    "dropped_noise",  # _is_noise in save_messages
+    "suppressed",  # same event already reported by another message within DEDUPE_WINDOW_SECONDS
+    "inserted",
+    "duplicates",
+    "failed",
+]
+
+
+class RunMetrics:
+    """Stage durations and a per-channel message funnel for one consumer run."""
+
+    def __init__(self, mode: str = "timer") -> None:
+        self.mode = mode
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        # stage -> seconds; channels run concurrently, so per-channel stage times are wall time per channel
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.channel_stages: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.funnel: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(FUNNEL, 0))
+        # Extra run attributes for the JSON record, e.g. warm start or error
+        self.info: Dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str, channel: Optional[str] = None) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started, channel)
+
+    def add_time(self, name: str, seconds: float, channel: Optional[str] = None) -> None:
+        self.stages[name] += seconds
+        if channel is not None:
+            self.channel_stages[channel][name] += seconds
+
+    def count(self, channel: Optional[str], step: str, n: int = 1) -> None:
+        self.funnel[channel or "unknown"][step] += n
+
+    def to_record(self) -> Dict[str, Any]:
+        totals = dict.fromkeys(FUNNEL, 0)
+        for steps in self.funnel.values():
+            for step, n in steps.items():
+                totals[step] += n
+        return {
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            **self.info,
+            "stages_ms": {k: round(v * 1000, 1) for k, v in self.stages.items()},
+            "funnel": totals,
+            "channels": {
+                ch: {
+                    "funnel": steps,
+                    "stages_ms": {k: round(v * 1000, 1) for k, v in self.channel_stages.get(ch, {}).items()},
+                }
+                for ch, steps in self.funnel.items()
+            },
+        }
+
+    def emit(self) -> Dict[str, Any]:
+        """Log the run record as one JSON line and refresh the Prometheus textfile if configured."""
+        record = self.to_record()
+        log.info(json.dumps(record, ensure_ascii=False), extra={"event": "consumer.run"})
+        if _TEXTFILE:
+            try:
+                self._write_textfile(record)
+            except OSError as e:
+                log.warning(f"Could not write metrics textfile {_TEXTFILE}: {e}")
+        return record
+
+    def _write_textfile(self, record: Dict[str, Any]) -> None:
+        def esc(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = [
+            "# HELP tariqi_consumer_last_run_timestamp_seconds Start time of the last consumer run.",
+            "# TYPE tariqi_consumer_last_run_timestamp_seconds gauge",
+            f'tariqi_consumer_last_run_timestamp_seconds{{mode="{self.mode}"}} {self.started_at.timestamp():.0f}',
+            "# HELP tariqi_consumer_run_duration_seconds Wall time of the last consumer run.",
+            "# TYPE tariqi_consumer_run_duration_seconds gauge",
+            f'tariqi_consumer_run_duration_seconds{{mode="{self.mode}"}} {record["duration_ms"] / 1000:.3f}',
+            "# HELP tariqi_consumer_stage_seconds Time spent per pipeline stage in the last run.",
+            "# TYPE tariqi_consumer_stage_seconds gauge",
+        ]
+        for ch, stages in sorted(self.channel_stages.items()):
+            for stage, seconds in sorted(stages.items()):
+                lines.append(f'tariqi_consumer_stage_seconds{{channel="{esc(ch)}",stage="{stage}"}} {seconds:.3f}')
+        for stage, seconds in sorted(self.stages.items()):
+            lines.append(f'tariqi_consumer_stage_seconds{{channel="all",stage="{stage}"}} {seconds:.3f}')
+        lines += [
+            "# HELP tariqi_consumer_messages Messages at each funnel step in the last run.",
+            "# TYPE tariqi_consumer_messages gauge",
+        ]
+        for ch, steps in sorted(self.funnel.items()):
+            for step in FUNNEL:
+                lines.append(f'tariqi_consumer_messages{{channel="{esc(ch)}",step="{step}"}} {steps[step]}')
+
+        tmp = f"{_TEXTFILE}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, _TEXTFILE)
@@ -1,17 +1,40 @@
+import asyncio
 import base64
+import logging
 import os
-import re
 import shutil
-from typing import Any, Dict, List, Tuple
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 from keyvault_client import get_secret
-from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
+from message_parser import CHECKPOINT_LOCATIONS, INQUIRY, UNKNOWN, get_parser
+from run_metrics import RunMetrics
+from telethon import TelegramClient, events, utils
+from telethon.errors import FloodWaitError, SessionPasswordNeededError
 from telethon.tl.types import Channel, Chat
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+# Channels fetched at the same time, and how FloodWaitError back-off is bounded per channel
+_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "4"))
+_FLOOD_WAIT_MAX_SECONDS = int(os.getenv("TELEGRAM_FLOOD_WAIT_MAX_SECONDS", "120"))
+_FLOOD_WAIT_RETRIES = int(os.getenv("TELEGRAM_FLOOD_WAIT_RETRIES", "2"))
+
+# Incremental runs read at most limit * _MAX_PAGES new messages per channel; the rest is picked up next run
+_MAX_PAGES = int(os.getenv("TELEGRAM_MAX_PAGES", "10"))
+
+# Reports fetched ahead of the Mongo writer before the channel fetchers pause
+_STREAM_BUFFER = int(os.getenv("TELEGRAM_STREAM_BUFFER", "1000"))
+
+# Messages without a usable status are not stored
+SKIPPED_STATUSES = {UNKNOWN, INQUIRY}
+
+# channel link -> resolved input peer; lives as long as the process so warm runs skip get_entity
+_entity_cache: Dict[str, Any] = {}
+
 
 def rebuild_session_file(path: str = "telegram_session.session") -> str:
     parts = ["telegramSessionPart1", "telegramSessionPart2"]
@@ -37,134 +60,14 @@ def get_Telegram_Client(app_id: int, api_hash: str) -> TelegramClient:
 class TelegramCheckpointCollector:
     def __init__(self, api_id: int, api_hash: str, phone_number: str) -> None:
         self.client = get_Telegram_Client(api_id, api_hash)
+        # Surface every FloodWaitError so collect_many can back off per channel
+        self.client.flood_sleep_threshold = 0
         self.phone_number = phone_number
+        # channel -> highest message id seen by the last successful collect()
+        self.watermarks: Dict[str, int] = {}
 
         # checkpoint → city
-        self._locations: Dict[str, Dict[str, str]] = {
-            # Nablus
-            "دير شرف": {"city": "نابلس"},
-            "شافي شومرون": {"city": "نابلس"},
-            "المربعة": {"city": "نابلس"},
-            "بوابة بورين": {"city": "نابلس"},
-            "صرة": {"city": "نابلس"},
-            "صره": {"city": "نابلس"},
-            "عورتا": {"city": "نابلس"},
-            "ال17 عصيرة": {"city": "نابلس"},
-            "بيت فوريك": {"city": "نابلس"},
-            "الباذان": {"city": "نابلس"},
-            "زعترة": {"city": "نابلس"},
-            # Ramallah
-            "عين سينا": {"city": "رام الله"},
-            "بيت ايل": {"city": "رام الله"},
-            "عطارة البلد": {"city": "رام الله"},
-            "عطاره": {"city": "رام الله"},
-            "عطارة": {"city": "رام الله"},
-            "عطارة بيرزيت": {"city": "رام الله"},
-            "الجلزون": {"city": "رام الله"},
-            "بوابة النبي صالح": {"city": "رام الله"},
-            "روابي": {"city": "رام الله"},
-            "عيلي": {"city": "رام الله"},
-            "عيون الحرمية": {"city": "رام الله"},
-            "خربثا": {"city": "رام الله"},
-            "المخماس": {"city": "رام الله"},
-            "بوابة بدو": {"city": "رام الله"},
-            "بوابة نعلين": {"city": "رام الله"},
-            "بوابة سنجل": {"city": "رام الله"},
-            # Jerusalem
-            "قلنديا": {"city": "القدس"},
-            "كفر عقب": {"city": "القدس"},
-            "عناتا": {"city": "القدس"},
-            "جبع": {"city": "القدس"},
-            "الرام": {"city": "القدس"},
-            "شعفاط": {"city": "القدس"},
-            "العيزرية": {"city": "القدس"},
-            "حزما": {"city": "القدس"},
-            # Hebron
-            "راس الجورة": {"city": "الخليل"},
-            "فرش الهوا": {"city": "الخليل"},
-            "بني النعيم": {"city": "الخليل"},
-            "الفحص": {"city": "الخليل"},
-            "كرمة": {"city": "الخليل"},
-            "جسر حلحول": {"city": "الخليل"},
-            "خلة المية": {"city": "الخليل"},
-            "العمور": {"city": "الخليل"},
-            "الفوار": {"city": "الخليل"},
-            "الشويكة": {"city": "الخليل"},
-            "دورا": {"city": "الخليل"},
-            "العروب": {"city": "الخليل"},
-            "بوابة بيت امر": {"city": "الخليل"},
-            "سعير": {"city": "الخليل"},
-            # Bethlehem
-            "الكونتينر": {"city": "بيت لحم"},
-            "عش الغراب": {"city": "بيت لحم"},
-            "النشاش": {"city": "بيت لحم"},
-            "بيت جالا": {"city": "بيت لحم"},
-            "النفق": {"city": "بيت لحم"},
-            "السدر": {"city": "بيت لحم"},
-            "جناتا": {"city": "بيت لحم"},
-            "الخضر": {"city": "بيت لحم"},
-            "العبيدية": {"city": "بيت لحم"},
-            "حاجز 300": {"city": "بيت لحم"},
-            "المناشير": {"city": "بيت لحم"},
-            "ام سلمونة": {"city": "بيت لحم"},
-            "نصار": {"city": "بيت لحم"},
-            # Salfit
-            "مدخل سلفيت الشمالي": {"city": "سلفيت"},
-            "ديرستيا": {"city": "سلفيت"},
-            "بوابة كفل حارس": {"city": "سلفيت"},
-            "بوابة حارس": {"city": "سلفيت"},
-            "سدة قرواة": {"city": "سلفيت"},
-            "بوابة بروقين": {"city": "سلفيت"},
-            "ياسوف": {"city": "سلفيت"},
-            "كدوميم": {"city": "سلفيت"},
-            "واد قانا": {"city": "سلفيت"},
-            "دير بلوط": {"city": "سلفيت"},
-            "كفر الديك": {"city": "سلفيت"},
-            "بوابة مردا الشرقية": {"city": "سلفيت"},
-            "بوابة مردا الغربية": {"city": "سلفيت"},
-            "اشارات ارائيل": {"city": "سلفيت"},
-            "بوابة جماعين": {"city": "سلفيت"},
-            # Qalqilya
-            "المدخل الشرقي": {"city": "قلقيلية"},
-            "نفق حبلة": {"city": "قلقيلية"},
-            "مدخل اماتين": {"city": "قلقيلية"},
-            "مدخل جينصافوط": {"city": "قلقيلية"},
-            "جسر عزون": {"city": "قلقيلية"},
-            "مدخل كفر لاقف": {"city": "قلقيلية"},
-            "حجة": {"city": "قلقيلية"},
-            "الفندق": {"city": "قلقيلية"},
-            "مدخل النبي الياس": {"city": "قلقيلية"},
-            # Tulkarm
-            "بزاريا": {"city": "طولكرم"},
-            "عناب": {"city": "طولكرم"},
-            "عنبتا": {"city": "طولكرم"},
-            "سناعوز": {"city": "طولكرم"},
-            "ايال": {"city": "طولكرم"},
-            "جبارة": {"city": "طولكرم"},
-            "قفين": {"city": "طولكرم"},
-            "جبارة تحت الجسر": {"city": "طولكرم"},
-            "بيت ليد": {"city": "طولكرم"},
-            "مدخل رامين": {"city": "طولكرم"},
-            "سهل رامين": {"city": "طولكرم"},
-            "كفر اللبد": {"city": "طولكرم"},
-            "شوفة": {"city": "طولكرم"},
-            "حرميش": {"city": "طولكرم"},
-            # Jenin
-            "حومش": {"city": "جنين"},
-            "الجلمة": {"city": "جنين"},
-            "دوتان": {"city": "جنين"},
-            "برطعة": {"city": "جنين"},
-            # Jericho / Tubas
-            "تياسير": {"city": "اريحا(طوباس)"},
-            "الحمرا": {"city": "اريحا(طوباس)"},
-            "المعرجات": {"city": "اريحا(طوباس)"},
-            "معالي افرايم": {"city": "اريحا(طوباس)"},
-            "الهيئة": {"city": "اريحا(طوباس)"},
-            "البنانا": {"city": "اريحا(طوباس)"},
-            "البوابة الصفراء": {"city": "اريحا(طوباس)"},
-            "عين جدي": {"city": "اريحا(طوباس)"},
-            "شارع 90": {"city": "اريحا(طوباس)"},
-        }
+        self._locations: Dict[str, Dict[str, str]] = CHECKPOINT_LOCATIONS
 
     async def authenticate(self) -> None:
         await self.client.connect()
@@ -178,87 +81,186 @@ class TelegramCheckpointCollector:
             await self.client.sign_in(password=pwd)
 
     async def _entity(self, username_or_link: str):
+        cached = _entity_cache.get(username_or_link)
+        if cached is not None:
+            return cached
         try:
             ent = await self.client.get_entity(username_or_link)
-            return ent if isinstance(ent, (Channel, Chat)) else None
+        except FloodWaitError:
+            raise
         except Exception:
             return None
+        if not isinstance(ent, (Channel, Chat)):
+            return None
+        peer = await self.client.get_input_entity(ent)
+        _entity_cache[username_or_link] = peer
+        return peer
 
-    def parse(self, text: str) -> Tuple[str, str, str, str, str]:
-        if not text:
-            return "غير محدد", "غير محدد", "غير محدد", "غير محدد", ""
-        t = text.lower()
-        checkpoint, city = "غير محدد", "غير محدد"
-        for loc, info in self._locations.items():
-            if loc.lower() in t:
-                checkpoint, city = loc, info["city"]
-                break
-        if checkpoint == "غير محدد":
-            for loc, info in self._locations.items():
-                words = [w for w in loc.lower().split() if len(w) > 2]
-                if any(w in t for w in words):
-                    checkpoint, city = loc, info["city"]
-                    break
-
-        status = "غير محدد"
-        if any(w in t for w in ["ممكن", "شو وضع", "كيف", "ايش وضع", "كيف الوضع", "؟", "شو"]):
-            status = "استفسار"
-        elif any(w in t for w in ["مغلق", "مسكر", "اغلاق", "سكر", "مغلقة", "مسكرة", "❌"]):
-            status = "إغلاق"
-        elif any(w in t for w in ["ازمة", "أزمة", "كثافة سير", "واقف", "خانقة", "طويلة", "🔴"]):
-            status = "أزمة"
-        elif any(w in t for w in ["سالك", "سالكة", "فاتح", "مفتوح", "بحري", "نضيف", "✅"]):
-            status = "سالك"
-        elif any(w in t for w in ["حاجز", "تفتيش", "بفتش", "تواجد جيش", "جيش", "حاجز طيار", "وقف"]):
-            status = "حاجز/تفتيش"
-        elif any(w in t for w in ["حادث", "حريق", "عطلان", "عطلانه"]):
-            status = "حادث"
-        elif any(w in t for w in ["فتح", "تم فتح"]):
-            status = "فتح"
-
-        direction = "غير محدد"
-        if any(w in t for w in ["للداخل", "دخول", "داخل", "للدخول", "ل الداخل"]):
-            direction = "دخول"
-        elif any(w in t for w in ["للخارج", "خروج", "خارج", "للخروج", "ل الخارج"]):
-            direction = "خروج"
-        elif any(w in t for w in ["بالاتجاهين", "الاتجاهين", "الجهتين", "باتجاهين"]):
-            direction = "الاتجاهين"
-        elif checkpoint != "غير محدد" and status not in {"غير محدد", "استفسار"}:
-            direction = "الاتجاهين"
-
-        cleaned = re.sub(r"[🔴❌✅️🤍🤝⚠️✋]+", "", text)
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
-        return checkpoint, city, status, direction, cleaned
+    @staticmethod
+    def parse(text: str) -> Tuple[str, str, str, str, str]:
+        # Static so offline tools (backfill workers) can parse without a Telegram client
+        return get_parser().parse(text)
 
-    async def collect(self, channel: str, limit: int) -> List[Dict[str, Any]]:
-        ent = await self._entity(channel)
+    async def stream(
+        self, channel: str, limit: int, min_id: int = 0, metrics: Optional[RunMetrics] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield reports for the newest `limit` messages, or with a watermark for every message newer
+        than `min_id` (oldest first, capped at limit * TELEGRAM_MAX_PAGES), as they are fetched.
+        The channel watermark is only advanced once the stream is exhausted."""
+        metrics = metrics or RunMetrics()
+        with metrics.stage("resolve_entity", channel):
+            ent = await self._entity(channel)
         if not ent:
-            return []
-        results: List[Dict[str, Any]] = []
-        async for msg in self.client.iter_messages(ent, limit=limit):
+            return
+        if min_id:
+            messages = self.client.iter_messages(ent, limit=limit * _MAX_PAGES, min_id=min_id, reverse=True)
+        else:
+            messages = self.client.iter_messages(ent, limit=limit)
+        newest_id = min_id
+        fetch_started, busy_seconds, parse_seconds = time.perf_counter(), 0.0, 0.0
+        async for msg in messages:
+            metrics.count(channel, "fetched")
+            newest_id = max(newest_id, msg.id)
             text = msg.text or msg.message or ""
-            ts = msg.date
-            checkpoint, city, status, direction, _ = self.parse(text)
-            payload = {
-                "message_id": msg.id,
-                "source_channel": channel,
-                "original_message": text or "[Media message]" if msg.media else text,
-                "checkpoint_name": checkpoint,
-                "city_name": city,
-                "status": status,
-                "direction": direction,
-                "message_date": ts,
-            }
-            if payload["status"] == "غير محدد" or payload["status"] == "استفسار":
+            parse_started = time.perf_counter()
+            payload = build_report(msg.id, channel, text, msg.date, bool(msg.media))
+            parse_seconds += time.perf_counter() - parse_started
+            if payload is None:
                 continue
-            results.append(payload)
-        return results
+            metrics.count(channel, "with_status")
+            # Time spent downstream while this generator is suspended is not fetch time
+            yielded = time.perf_counter()
+            yield payload
+            busy_seconds += time.perf_counter() - yielded
+        # iter_messages time is the loop minus parsing (mostly waiting on GetHistory round trips)
+        metrics.add_time("iter_messages", time.perf_counter() - fetch_started - busy_seconds - parse_seconds, channel)
+        metrics.add_time("parse", parse_seconds, channel)
+        if newest_id:
+            self.watermarks[channel] = newest_id
+
+    async def collect(
+        self, channel: str, limit: int, min_id: int = 0, metrics: Optional[RunMetrics] = None
+    ) -> List[Dict[str, Any]]:
+        return [report async for report in self.stream(channel, limit, min_id, metrics)]
 
-    async def collect_many(self, channels: List[str], per_channel: int) -> List[Dict[str, Any]]:
-        all_msgs: List[Dict[str, Any]] = []
+    async def _stream_bounded(
+        self,
+        sem: asyncio.Semaphore,
+        channel: str,
+        limit: int,
+        min_id: int,
+        metrics: RunMetrics,
+        out: "asyncio.Queue[Optional[Dict[str, Any]]]",
+    ) -> None:
+        # Ids already pushed, so a retry after a flood wait does not emit them twice
+        sent: Set[int] = set()
+        for attempt in range(_FLOOD_WAIT_RETRIES + 1):
+            try:
+                with metrics.stage("semaphore_wait", channel):
+                    await sem.acquire()
+                try:
+                    async for report in self.stream(channel, limit, min_id, metrics):
+                        if report["message_id"] not in sent:
+                            sent.add(report["message_id"])
+                            await out.put(report)
+                    break
+                finally:
+                    sem.release()
+            except FloodWaitError as e:
+                if attempt == _FLOOD_WAIT_RETRIES or e.seconds > _FLOOD_WAIT_MAX_SECONDS:
+                    log.warning(f"{channel}: flood wait of {e.seconds}s, skipping this run")
+                    break
+                # Sleep outside the semaphore so the other channels keep going
+                log.info(f"{channel}: flood wait, retrying in {e.seconds}s")
+                with metrics.stage("flood_wait", channel):
+                    await asyncio.sleep(e.seconds)
+            except Exception as e:
+                log.error(f"{channel}: collection failed: {e}")
+                break
+        # End of this channel for stream_many
+        await out.put(None)
+
+    async def stream_many(
+        self,
+        channels: List[str],
+        per_channel: int,
+        watermarks: Optional[Dict[str, int]] = None,
+        metrics: Optional[RunMetrics] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield reports from all channels as they arrive (no ordering across channels).
+        At most TELEGRAM_STREAM_BUFFER reports are buffered, so memory does not grow with the message limit."""
+        watermarks = watermarks or {}
+        metrics = metrics or RunMetrics()
+        sem = asyncio.Semaphore(max(1, _CONCURRENCY))
+        out: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max(1, _STREAM_BUFFER))
+        producers = [
+            asyncio.create_task(self._stream_bounded(sem, ch, per_channel, watermarks.get(ch, 0), metrics, out))
+            for ch in channels
+        ]
+        try:
+            remaining = len(producers)
+            while remaining:
+                report = await out.get()
+                if report is None:
+                    remaining -= 1
+                    continue
+                yield report
+        finally:
+            for task in producers:
+                task.cancel()
+
+    async def collect_many(
+        self,
+        channels: List[str],
+        per_channel: int,
+        watermarks: Optional[Dict[str, int]] = None,
+        metrics: Optional[RunMetrics] = None,
+    ) -> List[Dict[str, Any]]:
+        return [report async for report in self.stream_many(channels, per_channel, watermarks, metrics)]
+
+    async def subscribe(self, channels: List[str], queue: "asyncio.Queue[Dict[str, Any]]") -> int:
+        """Push a report for every new message posted in `channels` onto `queue` (daemon mode).
+        Returns the number of channels subscribed."""
+        channel_by_peer: Dict[int, str] = {}
         for ch in channels:
-            all_msgs.extend(await self.collect(ch, per_channel))
-        return sorted(all_msgs, key=lambda x: x["message_date"], reverse=True)
+            peer = await self._entity(ch)
+            if peer is None:
+                log.warning(f"{ch}: could not resolve channel, not subscribed")
+                continue
+            channel_by_peer[utils.get_peer_id(peer)] = ch
+
+        async def on_new_message(event) -> None:
+            channel = channel_by_peer.get(event.chat_id)
+            if channel is None:
+                return
+            msg = event.message
+            report = build_report(msg.id, channel, msg.text or msg.message or "", msg.date, bool(msg.media))
+            if report is not None:
+                # Blocks the handler (not the client) when the writer falls behind
+                await queue.put(report)
+
+        if channel_by_peer:
+            self.client.add_event_handler(on_new_message, events.NewMessage(chats=list(channel_by_peer)))
+        return len(channel_by_peer)
 
     async def close(self) -> None:
         await self.client.disconnect()
+
+
+def build_report(
+    message_id: int, channel: str, text: str, message_date: Any, has_media: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Report document for one channel message, or None when it carries no checkpoint status."""
+    checkpoint, city, status, direction, _ = TelegramCheckpointCollector.parse(text)
+    if status in SKIPPED_STATUSES:
+        return None
+    return {
+        "message_id": message_id,
+        "source_channel": channel,
+        "original_message": text or "[Media message]" if has_media else text,
+        "checkpoint_name": checkpoint,
+        "city_name": city,
+        "status": status,
+        "direction": direction,
+        "message_date": message_date,
+    }
@@ -24,4 +24,19 @@ self.addEventListener('message', (event) => {
     body,
     icon: "LogoFinal.png", // Make sure this file exists in /public
   });
-});
\ No newline at end of file
+});
+
+// Server-side pushes (backend/api/push_dispatch.py) for status changes near the user
+self.addEventListener('push', (event) => {
+  const data = event.data ? event.data.json() : {};
+
+  console.log("📩 SW received push:", data.title);
+
+  event.waitUntil(
+    self.registration.showNotification(data.title || "🚧 تحديث حالة حاجز", {
+      body: data.body,
+      icon: "LogoFinal.png",
+      data,
+    })
+  );
+});
@@ -146,9 +146,13 @@ const FeedbackPage = () => {
       body: JSON.stringify(payload),
       });
     })
-      .then((res) => res.json())
+      .then((res) => {
+        // 503: the server is busy and asks to retry shortly
+        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+        return res.json();
+      })
       .then((data) => {
-        console.log("Inserted feedback:", data);
+        console.log("Accepted feedback:", data);
         alert("✅ تم إرسال الملاحظة بنجاح!");
         setStatus("");
         setDirection("");
@@ -14,11 +14,27 @@ L.Icon.Default.mergeOptions({
   shadowUrl: require('leaflet/dist/images/marker-shadow.png'),
 });
  
+// XYZ tiles (Leaflet/OSM numbering) covering the current view at the current zoom
+const visibleTiles = (map) => {
+  const z = Math.round(map.getZoom());
+  const last = 2 ** z - 1;
+  const { min, max } = map.getPixelBounds();
+  const tiles = [];
+  for (let x = Math.max(0, Math.floor(min.x / 256)); x <= Math.min(last, Math.floor(max.x / 256)); x++) {
+    for (let y = Math.max(0, Math.floor(min.y / 256)); y <= Math.min(last, Math.floor(max.y / 256)); y++) {
+      tiles.push({ z, x, y });
+    }
+  }
+  return tiles;
+};
+ 
 const Map = () => {
   const mapRef = useRef(null);
   const checkpointMarkersRef = useRef([]);
+  const clusterMarkersRef = useRef([]);
   const userMarkerRef = useRef(null);
   const [checkpoints, setCheckpoints] = useState([]);
+  const [clusters, setClusters] = useState([]);
   const REFRESH_MS = Number(process.env.REACT_APP_MAP_REFRESH_MS) || 30000;
   const AGO_MINUTES = Number(process.env.REACT_APP_MAP_AGO_MINUTES) || 90;
   const userPopupTimerRef = useRef(null);
@@ -106,46 +122,6 @@ const ensureRoomForTooltip = (map, latlng, estW = 260, estH = 180, margin = 16)
     }
   };
  
-  useEffect(() => {
-    let timerId;
- 
-    const load = async () => {
-      try {
-        const base = process.env.REACT_APP_BACKEND_URL;
-        const response = await fetch(`${base}/api/checkpoints/query?top=5000&with_location=true`);
-        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-        const data = await response.json();
-        const list = Array.isArray(data?.results) ? data.results : [];
-        const filtered = list.filter(p => Number.isFinite(p.lat) && Number.isFinite(p.lng));
- 
-        // Merge new data with old data
-        setCheckpoints(prev => {
-          const merged = { ...Object.fromEntries(prev.map(cp => [cp._id || cp.checkpoint_name, cp])) };
- 
-          filtered.forEach(cp => {
-            const key = cp._id || cp.checkpoint_name;
-            const old = merged[key];
- 
-            if (!old || new Date(cp?.message_date?.$date || 0) > new Date(old?.message_date?.$date || 0)) {
-              merged[key] = cp; // Update if the data is newer
-            }
-          });
- 
-          return Object.values(merged);
-        });
- 
-      } catch (error) {
-        console.error("Could not fetch checkpoints:", error);
- 
-      }
-    };
- 
-    load();
-    timerId = setInterval(load, REFRESH_MS);
-    return () => clearInterval(timerId);
-  }, []);
- 
- 
   useEffect(() => {
     if (mapRef.current) return;
     const map = L.map('map', { zoomControl: false }).setView([31.9, 35.2], 8);
@@ -195,6 +171,93 @@ div.innerHTML = `
     return () => { if (mapRef.current) { mapRef.current.remove(); mapRef.current = null; } };
   }, []);
  
+  useEffect(() => {
+    const map = mapRef.current;
+    if (!map) return;
+    let timerId;
+    let fromSnapshot = false;
+    let request = 0;
+ 
+    // Static status snapshot (backend/api/static_snapshot.py): a complete list, so it replaces the state
+    const loadSnapshot = async (manifestUrl) => {
+      const manifestResponse = await fetch(manifestUrl, { cache: "no-cache" });
+      if (!manifestResponse.ok) throw new Error(`HTTP error! status: ${manifestResponse.status}`);
+      const manifest = await manifestResponse.json();
+      const response = await fetch(new URL(manifest.current, new URL(manifestUrl, window.location.href)));
+      if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+      const data = await response.json();
+      const list = Array.isArray(data?.results) ? data.results : [];
+      setCheckpoints(list.filter(p => Number.isFinite(p.lat) && Number.isFinite(p.lng)));
+      setClusters([]);
+    };
+
+    // Map tiles (/api/checkpoints/tiles/{z}/{x}/{y}) of the visible area only. Unchanged tiles revalidate
+    // against their ETag; below the cluster zoom they hold clusters instead of every checkpoint
+    const loadTiles = async () => {
+      const current = ++request;
+      const base = process.env.REACT_APP_BACKEND_URL;
+      const tiles = visibleTiles(map);
+      const responses = await Promise.all(tiles.map(async ({ z, x, y }) => {
+        const response = await fetch(`${base}/api/checkpoints/tiles/${z}/${x}/${y}`);
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        return response.json();
+      }));
+      if (current !== request) return; // the map moved again meanwhile
+ 
+      const rows = [];
+      const clusterList = [];
+      responses.forEach(tile => (tile?.features || []).forEach(feature => {
+        if (feature.type === "cluster") {
+          clusterList.push(feature);
+          return;
+        }
+        // One row per direction, in the /api/checkpoints/query shape the markers are built from
+        const location = { checkpoint_name: feature.checkpoint, city_name: feature.city, lat: feature.latitude, lng: feature.longitude };
+        const directions = feature.directions || [];
+        if (directions.length === 0) rows.push(location);
+        directions.forEach(d => rows.push({
+          ...location,
+          status: d.status,
+          direction: d.direction,
+          message_date: { $date: d.updatedAt },
+        }));
+      }));
+      setCheckpoints(rows.filter(p => Number.isFinite(p.lat) && Number.isFinite(p.lng)));
+      setClusters(clusterList);
+    };
+ 
+    const load = async () => {
+      const snapshotUrl = process.env.REACT_APP_STATUS_SNAPSHOT_URL;
+      if (snapshotUrl) {
+        try {
+          await loadSnapshot(snapshotUrl);
+          fromSnapshot = true;
+          return;
+        } catch (error) {
+          console.error("Could not fetch status snapshot, using the API:", error);
+        }
+      }
+      fromSnapshot = false;
+      try {
+        await loadTiles();
+      } catch (error) {
+        console.error("Could not fetch checkpoints:", error);
+ 
+      }
+    };
+ 
+    // The snapshot already covers the whole map; tiles follow the view
+    const onMoveEnd = () => { if (!fromSnapshot) load(); };
+ 
+    load();
+    timerId = setInterval(load, REFRESH_MS);
+    map.on('moveend', onMoveEnd);
+    return () => {
+      clearInterval(timerId);
+      map.off('moveend', onMoveEnd);
+    };
+  }, []);
+ 
   // Card Display (Enter/Exit)
   useEffect(() => {
     if (!mapRef.current) return;
@@ -317,6 +380,49 @@ marker.on('tooltipopen', (e) => {
  
   }, [checkpoints]);
  
+  // Clusters (tiles below the cluster zoom): count bubble in the color of the most reported status
+  useEffect(() => {
+    const map = mapRef.current;
+    if (!map) return;
+
+    clusterMarkersRef.current.forEach(marker => map.removeLayer(marker));
+    clusterMarkersRef.current = [];
+ 
+    clusters.forEach(cluster => {
+      const counts = Object.entries(cluster.status_counts || {}).sort((a, b) => b[1] - a[1]);
+      const color = getStatusColor(counts[0]?.[0] || "");
+      const size = cluster.count < 10 ? 28 : cluster.count < 100 ? 34 : 40;
+      const r = size / 2;
+      const icon = L.divIcon({
+        className: '',
+        html: `
+<svg width="${size}" height="${size}" viewBox="0 0 ${size} ${size}" xmlns="http://www.w3.org/2000/svg">
+  <circle cx="${r}" cy="${r}" r="${r - 2}" fill="${color}" fill-opacity="0.85" stroke="#FFF" stroke-width="2"/>
+  <text x="${r}" y="${r + 4}" font-family="Arial" font-size="11" fill="#FFF" text-anchor="middle">${cluster.count}</text>
+</svg>`,
+        iconSize: [size, size],
+        iconAnchor: [r, r],
+      });
+ 
+      const marker = L.marker([cluster.latitude, cluster.longitude], { icon }).addTo(map);
+      const rows = counts.map(([status, count]) => `<div><b>${status}:</b> ${count}</div>`).join("");
+      marker.bindTooltip(`
+        <div class="checkpoint-hover-card" dir="rtl">
+          <div class="cp-title"><b>${cluster.count} حواجز</b></div>
+          <div class="cp-block">${rows}</div>
+        </div>
+      `, { className: 'checkpoint-tooltip-card', direction: 'auto', offset: [0, -r], opacity: 1 });
+      // Zoom in until the cluster splits up
+      marker.on('click', () => {
+        const { south, west, north, east } = cluster.bounds;
+        if (south === north && west === east) map.setView([south, west], map.getZoom() + 2);
+        else map.fitBounds([[south, west], [north, east]], { padding: [40, 40] });
+      });
+ 
+      clusterMarkersRef.current.push(marker);
+    });
+  }, [clusters]);
+ 
   useEffect(() => {
     if (!mapRef.current) return;
  
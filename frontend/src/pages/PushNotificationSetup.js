@@ -1,9 +1,37 @@
 import { useEffect  } from 'react';
+import { useMsal } from "@azure/msal-react";
+import { loginRequest } from "../auth/authConfig";
 import getLocation from '../utils/getLocation';
 import { formatCheckpointTime } from '../utils/timeFormat'; 
 
+// Send the location again once the user has moved this far, so server pushes follow them
+const RESUBSCRIBE_DISTANCE_KM = 1;
+
+// VAPID public key (base64url) -> applicationServerKey for pushManager.subscribe()
+function urlBase64ToUint8Array(base64String) {
+  const padding = '='.repeat((4 - (base64String.length % 4)) % 4);
+  const base64 = (base64String + padding).replace(/-/g, '+').replace(/_/g, '/');
+  const raw = window.atob(base64);
+  return Uint8Array.from([...raw].map((char) => char.charCodeAt(0)));
+}
+
+function distanceKm(a, b) {
+  const toRad = (deg) => (deg * Math.PI) / 180;
+  const dLat = toRad(b.latitude - a.latitude);
+  const dLng = toRad(b.longitude - a.longitude);
+  const h = Math.sin(dLat / 2) ** 2 +
+    Math.cos(toRad(a.latitude)) * Math.cos(toRad(b.latitude)) * Math.sin(dLng / 2) ** 2;
+  return 2 * 6371 * Math.asin(Math.sqrt(h));
+}
+
 export default function PushNotificationSetup({ setNotificationStatus })  {
+  const { instance } = useMsal();
+
   useEffect(() => {
+    let active = true;
+    let watchId = null;
+    let lastSentLocation = null;
+
     //  Register service worker
     if ('serviceWorker' in navigator) {
       navigator.serviceWorker.register('/service_worker.js')
@@ -31,6 +59,7 @@ export default function PushNotificationSetup({ setNotificationStatus })  {
         console.log("✅ Notification permission granted.");
         setNotificationStatus("granted");
         await notifyNearbyCheckpoints();   
+        await subscribeToPush();
       } else {
         console.log("❌ Permission denied");
         setNotificationStatus("denied");
@@ -85,7 +114,75 @@ async function notifyNearbyCheckpoints() {
   }
 }
 
+    async function subscribeToPush() {
+      if (!('PushManager' in window)) {
+        console.log("ℹ️ Push messages are not supported by this browser");
+        return;
+      }
+      try {
+        const reg = await navigator.serviceWorker.ready;
+        let subscription = await reg.pushManager.getSubscription();
+        if (!subscription) {
+          const keyRes = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/push/vapid-public-key`);
+          if (!keyRes.ok) {
+            console.log("ℹ️ Push notifications are not configured on the server");
+            return;
+          }
+          const { publicKey } = await keyRes.json();
+          subscription = await reg.pushManager.subscribe({
+            userVisibleOnly: true,
+            applicationServerKey: urlBase64ToUint8Array(publicKey),
+          });
+        }
+
+        await sendSubscription(subscription, await getLocation());
+
+        // Keep the stored location current while the page is open
+        if (!active) return;
+        watchId = navigator.geolocation.watchPosition(
+          (position) => {
+            const location = { latitude: position.coords.latitude, longitude: position.coords.longitude };
+            if (lastSentLocation && distanceKm(lastSentLocation, location) < RESUBSCRIBE_DISTANCE_KM) return;
+            sendSubscription(subscription, location).catch((err) => {
+              console.error("❌ Error updating push subscription location:", err);
+            });
+          },
+          (err) => console.warn("⚠️ Location watch failed:", err.message)
+        );
+      } catch (err) {
+        console.error("❌ Error subscribing to push notifications:", err);
+      }
+    }
+
+    async function sendSubscription(subscription, location) {
+      // The subscribe endpoint needs a signed-in user, like feedback
+      const account = instance.getActiveAccount();
+      if (!account) {
+        console.log("ℹ️ Sign in to receive push notifications for nearby checkpoints");
+        return;
+      }
+      const tokenResponse = await instance.acquireTokenSilent({ ...loginRequest, account });
+      const res = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/push/subscribe`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "Authorization": `Bearer ${tokenResponse.accessToken}`,
+        },
+        body: JSON.stringify({
+          subscription: subscription.toJSON(),
+          latitude: location.latitude,
+          longitude: location.longitude,
+        }),
+      });
+      if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+      lastSentLocation = location;
+      console.log("✅ Push subscription saved for", location.latitude, location.longitude);
+    }
 
-  }, []);
+    return () => {
+      active = false;
+      if (watchId !== null) navigator.geolocation.clearWatch(watchId);
+    };
+  }, [instance]);
   return null;
 }
\ No newline at end of file